@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Micro-benchmark of the any-id deduplication of the br entities done by the
+# index addons (indexapi_core.__dedup_brs) against the previous implementation,
+# which compared the ids of each br entity with all the ones already accepted.
+#
+# Usage: python benchmark/bench_brs_dedup.py [--sizes 10000 100000 1000000] [--legacy-max 10000]
+
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+from random import Random
+from sys import path
+from time import perf_counter
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+import indexapi_core
+
+HEADER = ["val", "pubDate", "ids", "source", "author"]
+
+
+def synthetic_brs_meta(n, dup_ratio=0.1, seed=0):
+    # n br entities with 1-3 ids each, dup_ratio of them sharing a doi with
+    # another br entity (as returned by __br_meta_metadata)
+    rnd = Random(seed)
+    brs_meta = {}
+    for i in range(n):
+        uri = "https://w3id.org/oc/meta/br/06%s" % i
+        if i > 0 and rnd.random() < dup_ratio:
+            doi = "doi:10.1000/%s" % rnd.randrange(i)
+        else:
+            doi = "doi:10.1000/%s" % i
+        ids = [doi] + ["pmid:%s" % (i * 10 + k) for k in range(rnd.randrange(3))]
+        brs_meta[uri] = {
+            "val": uri,
+            "pubDate": "2020-01-01",
+            "ids": " __ ".join(ids),
+            "source": "",
+            "author": ""
+        }
+    return brs_meta
+
+
+def legacy_dedup(brs_meta, header):
+    unique_brs_anyid = []
+    f_res = {}
+    for k_br, k_val in brs_meta.items():
+        br_ids = k_val["ids"]
+        if br_ids:
+            s = set(br_ids.split(" __ "))
+            _c_intersection = 0
+            for __unique in unique_brs_anyid:
+                _c_intersection += len(__unique.intersection(s))
+            if _c_intersection == 0:
+                unique_brs_anyid.append(s)
+                f_res[k_br] = {k: k_val.get(k, "") for k in header}
+    return f_res
+
+
+def timed(func, *args):
+    start = perf_counter()
+    result = func(*args)
+    return perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser("bench_brs_dedup.py")
+    arg_parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000, 1000000])
+    arg_parser.add_argument("--legacy-max", type=int, default=10000,
+                            help="run the quadratic implementation only up to this size")
+    args = arg_parser.parse_args()
+
+    dedup_brs = getattr(indexapi_core, "__dedup_brs")
+    print("%10s %12s %12s %10s" % ("entities", "indexed (s)", "legacy (s)", "unique"))
+    for n in args.sizes:
+        brs_meta = synthetic_brs_meta(n)
+        t_new, (f_res, alias) = timed(dedup_brs, brs_meta, HEADER)
+        t_old = "-"
+        if n <= args.legacy_max:
+            t, old_res = timed(legacy_dedup, brs_meta, HEADER)
+            assert old_res == f_res
+            t_old = "%.3f" % t
+        print("%10s %12.3f %12s %10s" % (n, t_new, t_old, len(f_res)))
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Micro-benchmark of the computation of the timespans of the citations: the
+# previous per-row computation (dateutil's parse and relativedelta for each
+# citation) against oc_dates.durations, with the dates parsed by dateutil or by
+# the fast parser of oc_dates (with an empty cache, i.e. the first request).
+#
+# Usage: python benchmark/bench_dates.py [--rows 50000] [--distinct 5000]
+
+from argparse import ArgumentParser
+from datetime import datetime
+from os.path import abspath, dirname
+from random import Random
+from sys import path
+from time import perf_counter
+
+from dateutil.parser import parse
+from dateutil.relativedelta import relativedelta
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+import oc_dates
+
+
+def legacy_cit_duration(citing_complete_pub_date, cited_complete_pub_date):
+    DEFAULT_DATE = datetime(1970, 1, 1, 0, 0)
+    consider_months = len(citing_complete_pub_date) >= 7 and len(cited_complete_pub_date) >= 7
+    consider_days = len(citing_complete_pub_date) >= 10 and len(cited_complete_pub_date) >= 10
+    try:
+        citing_pub_datetime = parse(citing_complete_pub_date, default=DEFAULT_DATE)
+    except ValueError:
+        citing_pub_datetime = parse(citing_complete_pub_date[:7] + "-28", default=DEFAULT_DATE)
+    try:
+        cited_pub_datetime = parse(cited_complete_pub_date, default=DEFAULT_DATE)
+    except ValueError:
+        cited_pub_datetime = parse(cited_complete_pub_date[:7] + "-28", default=DEFAULT_DATE)
+    delta = relativedelta(citing_pub_datetime, cited_pub_datetime)
+    result = ""
+    if delta.years < 0 or (delta.years == 0 and delta.months < 0 and consider_months) or \
+            (delta.years == 0 and delta.months == 0 and delta.days < 0 and consider_days):
+        result += "-"
+    result += "P%sY" % abs(delta.years)
+    if consider_months:
+        result += "%sM" % abs(delta.months)
+    if consider_days:
+        result += "%sD" % abs(delta.days)
+    return result
+
+
+def synthetic_pairs(rows, distinct, seed=0):
+    # the citations of a cited entity, whose citing entities have distinct
+    # publication dates (10% of them partial)
+    rnd = Random(seed)
+    dates = []
+    for _ in range(distinct):
+        y, m, d = rnd.randint(1950, 2025), rnd.randint(1, 12), rnd.randint(1, 29)
+        dates.append(rnd.choice(["%d" % y, "%d-%02d" % (y, m)] + ["%d-%02d-%02d" % (y, m, d)] * 18))
+    return [(rnd.choice(dates), "2015-03-09") for _ in range(rows)]
+
+
+def timed(func, *args):
+    start = perf_counter()
+    result = func(*args)
+    return perf_counter() - start, result
+
+
+def with_dateutil(pairs):
+    # oc_dates.durations with the dates parsed by dateutil
+    fast_parse = oc_dates.parse_date
+    oc_dates.parse_date = getattr(oc_dates, "__parse_general")
+    try:
+        return oc_dates.durations(pairs)
+    finally:
+        oc_dates.parse_date = fast_parse
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser("bench_dates.py")
+    arg_parser.add_argument("--rows", nargs="+", type=int, default=[1000, 10000, 50000])
+    arg_parser.add_argument("--distinct", type=int, default=5000)
+    args = arg_parser.parse_args()
+
+    print("%8s %16s %16s %16s %10s" % ("rows", "per-row (us)", "dateutil (us)", "fast (us)", "speedup"))
+    for n in args.rows:
+        pairs = synthetic_pairs(n, min(n, args.distinct))
+        t_legacy, expected = timed(lambda p: [legacy_cit_duration(*pair) for pair in p], pairs)
+        t_dateutil, res_dateutil = timed(with_dateutil, pairs)
+        oc_dates.parse_date.cache_clear()
+        t_fast, res_fast = timed(oc_dates.durations, pairs)
+        assert expected == res_dateutil == res_fast
+        print("%8s %16.2f %16.2f %16.2f %9.0fx" % (
+            n, t_legacy / n * 1e6, t_dateutil / n * 1e6, t_fast / n * 1e6, t_legacy / t_fast))
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Benchmark of the metadata operation of the Meta API on the test database,
+# with the identifiers looked up by generate_id_search with a UNION branch for
+# each identifier or with a single VALUES block, for an increasing number of
+# identifiers (DOIs taken from the database, plus some missing ones).
+#
+# Usage (after test/start_test_db.sh):
+#     python benchmark/bench_id_search.py [--ids 1 10 50 100] [--repeat 5]
+
+from argparse import ArgumentParser
+from json import loads
+from os.path import abspath, dirname, join
+from statistics import median
+from sys import path
+from time import perf_counter
+
+from requests import post
+
+ROOT = dirname(dirname(abspath(__file__)))
+path.insert(0, ROOT)
+from ramose import APIManager
+
+import metaapi
+
+ENDPOINT = "http://127.0.0.1:8891/sparql"
+
+
+def sample_dois(n):
+    query = """
+        PREFIX datacite: <http://purl.org/spar/datacite/>
+        PREFIX literal: <http://www.essepuntato.it/2010/06/literalreification/>
+        SELECT DISTINCT ?literal {
+            ?identifier datacite:usesIdentifierScheme datacite:doi;
+                        literal:hasLiteralValue ?literal
+        } LIMIT %s
+    """ % n
+    r = post(ENDPOINT, data={"query": query}, headers={"Accept": "application/sparql-results+json"}, timeout=60)
+    r.raise_for_status()
+    return ["doi:" + b["literal"]["value"] for b in loads(r.text)["results"]["bindings"]]
+
+
+def timed_metadata(api_manager, ids, mode, repeat):
+    metaapi.ID_SEARCH = mode
+    times = []
+    for _ in range(repeat):
+        op = api_manager.get_op("/api/v1/metadata/" + "__".join(ids))
+        start = perf_counter()
+        status, result, _ = op.exec(method="get", content_type="application/json")
+        times.append(perf_counter() - start)
+        assert status == 200, result
+    return median(times), sorted(loads(result), key=lambda x: x["id"])
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser("bench_id_search.py")
+    arg_parser.add_argument("--ids", nargs="+", type=int, default=[1, 10, 25, 50, 100])
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    api_manager = APIManager([join(ROOT, "test", "meta_v1_test.hf")])
+    dois = sample_dois(max(args.ids))
+    print("%6s %8s %14s %14s %10s" % ("ids", "results", "union (ms)", "values (ms)", "speedup"))
+    for n in args.ids:
+        # one identifier out of ten is not in the database
+        ids = [doi if i % 10 else "doi:10.0000/missing-%s" % i for i, doi in enumerate(dois[:n], 1)]
+        t_union, res_union = timed_metadata(api_manager, ids, "union", args.repeat)
+        t_values, res_values = timed_metadata(api_manager, ids, "values", args.repeat)
+        assert res_union == res_values
+        print("%6s %8s %14.1f %14.1f %9.1fx" % (
+            n, len(res_values), t_union * 1e3, t_values * 1e3, t_union / t_values))
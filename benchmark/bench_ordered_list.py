@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Micro-benchmark of the ordering of the authors of a bibliographic resource
+# (e.g. of a physics collaboration): the previous process_ordered_list, which
+# looked for the head of the chain among all the next roles of each role,
+# against the current one, on synthetic chains of thousands of authors.
+#
+# Usage: python benchmark/bench_ordered_list.py [--authors 100 1000 5000] [--repeat 3]
+
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+from random import Random
+from sys import path
+from time import perf_counter
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+import metaapi
+from bench_metadata_output import ordered_list
+
+
+def legacy_process_ordered_list(items):
+    if not items:
+        return items
+    items_dict = {}
+    role_to_name = {}
+    for item in items.split('|'):
+        parts = item.split(':')
+        name = ':'.join(parts[:-2])
+        current_role = parts[-2]
+        next_role = parts[-1] if parts[-1] != '' else None
+        items_dict[current_role] = next_role
+        role_to_name[current_role] = name
+
+    ordered_items = []
+    start_role = next(iter(role for role, next_role in items_dict.items() if not role in items_dict.values()))
+
+    current_role = start_role
+    while current_role:
+        ordered_items.append(role_to_name[current_role])
+        current_role = items_dict.get(current_role, '')
+
+    return "; ".join(ordered_items)
+
+
+def timed(func, items, repeat):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func(items)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser("bench_ordered_list.py")
+    arg_parser.add_argument("--authors", nargs="+", type=int, default=[100, 1000, 5000])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    print("%8s %14s %14s %10s" % ("authors", "legacy (ms)", "linear (ms)", "speedup"))
+    for n in args.authors:
+        items = ordered_list(Random(n), n, "ar")
+        t_legacy, expected = timed(legacy_process_ordered_list, items, args.repeat)
+        t_linear, result = timed(metaapi.process_ordered_list, items, args.repeat)
+        assert result == expected
+        print("%8s %14.2f %14.2f %9.1fx" % (n, t_legacy * 1e3, t_linear * 1e3, t_legacy / t_linear))
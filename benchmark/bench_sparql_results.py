@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Benchmark of the decoding of the results of the metadata query of the index
+# addons (__br_meta_metadata), i.e. of a chunk of 3000 br entities with long
+# GROUP_CONCAT fields: the previous decoding of the whole JSON document,
+# against the row by row reading of oc_sparql on the same results as CSV, TSV
+# and JSON, both of a response read as a whole ("buffered") and of a streamed
+# one, read in chunks of oc_http.CHUNK_SIZE bytes ("streamed"). The responses
+# are read from a file, and the time and the peak of the memory allocated while
+# reading and decoding them (the body of the buffered responses included) are
+# reported.
+#
+# The responses are synthetic, unless recorded ones are specified, e.g. saved
+# with: curl -H "Accept: text/csv" --data-binary @query.rq -H "Content-Type:
+# application/sparql-query" http://localhost:8890/sparql > results.csv
+#
+# Usage: python benchmark/bench_sparql_results.py [--brs 3000] [--json results.json] [--csv results.csv]
+
+from argparse import ArgumentParser
+from json import dumps, loads
+from os import remove
+from os.path import abspath, dirname, getsize, join
+from sys import path
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+ROOT = dirname(dirname(abspath(__file__)))
+path.insert(0, ROOT)
+path.insert(0, join(ROOT, "test"))
+import oc_sparql
+from fake_meta import _csv, _tsv, _uri, _literal, _results, BR, RA
+from oc_http import AsyncResponse
+
+
+def synthetic_results(n):
+    # each br entity has 10 ids, 30 authors and 2 venues
+    bindings = []
+    for i in range(n):
+        bindings.append({
+            "val": _uri(BR + "06%s" % i),
+            "pubDate": _literal("2020-01-%02d" % (i % 28 + 1)),
+            "ids": _literal(" __ ".join(["doi:10.1000/%s" % i] + ["pmid:%s" % (i * 10 + k) for k in range(9)])),
+            "source": _literal("; ".join(BR + "09%s" % (i % 100 + k) for k in range(2))),
+            "author": _literal("; ".join(RA + "06%s" % (i * 30 + k) for k in range(30)))})
+    return _results(["val", "pubDate", "ids", "source", "author"], bindings)
+
+
+def legacy_decode(response):
+    r = loads(response.text)
+    return {elem["val"]["value"]: elem for elem in r["results"]["bindings"]}
+
+
+def rows_decode(response):
+    return {elem["val"]: elem for elem in oc_sparql.read_rows(response)}
+
+
+class StreamedResponse(AsyncResponse):
+    # a response whose body is read from a file, a chunk at a time
+
+    def __init__(self, content_type, file_path):
+        super().__init__(200, "OK", {"Content-Type": content_type}, None)
+        self.file_path = file_path
+
+    def iter_content(self, chunk_size=1):
+        with open(self.file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
+
+def buffered(content_type, file_path, func):
+    def run():
+        with open(file_path, "rb") as f:
+            return func(AsyncResponse(200, "OK", {"Content-Type": content_type}, f.read()))
+    return run
+
+
+def streamed(content_type, file_path, func):
+    return lambda: func(StreamedResponse(content_type, file_path))
+
+
+def measured(run):
+    # the time is measured without tracing the allocations
+    t = perf_counter()
+    result = run()
+    elapsed = perf_counter() - t
+    del result
+    start()
+    result = run()
+    peak = get_traced_memory()[1]
+    stop()
+    return elapsed, peak, result
+
+
+def saved(content):
+    with NamedTemporaryFile(delete=False) as f:
+        f.write(content)
+    return f.name
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser("bench_sparql_results.py")
+    arg_parser.add_argument("--brs", type=int, default=3000)
+    arg_parser.add_argument("--json", help="a recorded response in the SPARQL JSON results format")
+    arg_parser.add_argument("--csv", help="the same response in the CSV format")
+    args = arg_parser.parse_args()
+
+    if args.json:
+        with open(args.json, "rb") as f:
+            json_content = f.read()
+        res = loads(json_content)
+    else:
+        res = synthetic_results(args.brs)
+        json_content = dumps(res).encode("utf-8")
+    if args.csv:
+        with open(args.csv, "rb") as f:
+            csv_content = f.read()
+    else:
+        csv_content = _csv(res).encode("utf-8")
+    files = {
+        oc_sparql.JSON: saved(json_content),
+        oc_sparql.CSV: saved(csv_content),
+        oc_sparql.TSV: saved(_tsv(res).encode("utf-8"))}
+    del res, json_content, csv_content
+
+    runs = [("json (whole)", oc_sparql.JSON, buffered(oc_sparql.JSON, files[oc_sparql.JSON], legacy_decode))]
+    for name, c_type in (("json", oc_sparql.JSON), ("csv", oc_sparql.CSV), ("tsv", oc_sparql.TSV)):
+        runs.append(("%s (buffered)" % name, c_type, buffered(c_type, files[c_type], rows_decode)))
+        runs.append(("%s (streamed)" % name, c_type, streamed(c_type, files[c_type], rows_decode)))
+    try:
+        print("%16s %12s %12s %16s" % ("decoding", "size (KB)", "time (ms)", "peak mem (KB)"))
+        expected = None
+        for name, c_type, run in runs:
+            elapsed, peak, result = measured(run)
+            flat = {k: {var: v["value"] if isinstance(v, dict) else v for var, v in elem.items()}
+                    for k, elem in result.items()}
+            assert expected is None or flat == expected
+            expected = flat
+            print("%16s %12.0f %12.1f %16.0f" % (name, getsize(files[c_type]) / 1024, elapsed * 1e3, peak / 1024))
+    finally:
+        for file_path in files.values():
+            remove(file_path)
@@ -0,0 +1,214 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Offline benchmark of the postprocessing functions of all the addons, on
+# synthetic results of the SPARQL queries with an increasing number of rows.
+# The calls to OpenCitations Meta done by the index addons are answered by
+# test/fake_meta.py, run in another process on synthetic data, so that only
+# the time and memory of the addons are measured here.
+#
+# For each function and number of rows, the best wall and CPU time of --repeat
+# runs and the peak memory allocated (by tracemalloc, in a separate run) are
+# printed, and saved as JSON with --save. With --baseline, they are compared
+# with the ones of a previous run, and the script fails if any of them grew by
+# more than --tolerance, e.g.:
+#
+#     python benchmark/bench_suite.py --save baseline.json
+#     ... (changes)
+#     python benchmark/bench_suite.py --baseline baseline.json --save current.json
+#
+# Usage: python benchmark/bench_suite.py [--rows 1000 10000 100000] [--repeat 3] [--cases citations_info_v2 ...]
+
+from argparse import ArgumentParser
+from json import dump, load
+from os.path import abspath, dirname, join
+from platform import platform, python_version
+from random import Random
+from subprocess import Popen, PIPE
+from sys import exit, executable, path
+from time import perf_counter, process_time
+from tracemalloc import get_traced_memory, start as start_tracing, stop as stop_tracing
+
+ROOT = dirname(dirname(abspath(__file__)))
+path.insert(0, ROOT)
+import ccc_addon
+import indexapi_core
+import indexapi_v1
+import indexapi_v2
+import metaapi
+import occapi
+import wikidataapi
+from oc_cache import TTLCache
+
+from bench_metadata_output import ordered_list, synthetic_results
+
+BR = "https://w3id.org/oc/meta/br/"
+
+
+def index_results(rows, seed=0):
+    # the (oci, citing, cited) rows of the index, among rows br entities
+    rnd = Random(seed)
+    res = [["oci", "citing", "cited"]]
+    for _ in range(rows):
+        citing, cited = rnd.randrange(rows), rnd.randrange(rows)
+        oci = "06%s-06%s" % (citing, cited)
+        res.append([(oci, oci), (BR + "06%s" % citing, BR + "06%s" % citing), (BR + "06%s" % cited, BR + "06%s" % cited)])
+    return res
+
+
+def metadata_results(rows, seed=0):
+    # the (val, citation, reference) rows of the metadata operation of the index v1
+    rnd = Random(seed)
+    res = [["val", "citation", "reference"]]
+    for i in range(rows):
+        row = [BR + "06%s" % i] + [
+            "; ".join(BR + "06%s" % rnd.randrange(rows) for _ in range(rnd.randrange(4))) for _ in range(2)]
+        res.append([(value, value) for value in row])
+    return res
+
+
+def coauthor_results(rows, seed=0):
+    # the (author, author, count) rows of the co-authorships, counted in both directions
+    rnd = Random(seed)
+    res = [["author1", "author2", "count"]]
+    for _ in range(rows):
+        a1, a2 = "Doe%s, John" % rnd.randrange(rows // 4 + 1), "Doe%s, John" % rnd.randrange(rows // 4 + 1)
+        count = rnd.randrange(1, 10)
+        res.append([(a1, a1), (a2, a2), (count, str(count))])
+    return res
+
+
+def doi_results(rows, seed=0):
+    # rows of the Wikidata items, where half of the DOIs are repeated
+    rnd = Random(seed)
+    res = [["item", "doi", "title"]]
+    for i in range(rows):
+        doi = "10.1000/%s" % rnd.randrange(rows // 2 + 1)
+        res.append([("Q%s" % i, "Q%s" % i), (doi, doi), ("Title %s" % i, "Title %s" % i)])
+    return res
+
+
+# each case is the function generating the input for a number of rows, and the
+# function run on it
+CASES = {
+    "citations_info_v2": (index_results, lambda res: indexapi_v2.citations_info(res, "oci", "citing", "cited")),
+    "citations_info_v1": (index_results, lambda res: indexapi_v1.citations_info(res, "oci", "citing", "cited")),
+    "count_unique_cits_v2": (index_results, lambda res: indexapi_v2.count_unique_cits(res, "oci", "citing", "cited")),
+    "metadata_v1": (metadata_results, lambda res: indexapi_v1.metadata(res, "val", "citation", "reference")),
+    "create_metadata_output": (synthetic_results, metaapi.create_metadata_output),
+    "process_ordered_list": (lambda rows: ordered_list(Random(0), rows, "ar"), metaapi.process_ordered_list),
+    "remove_duplicates_occapi": (coauthor_results, occapi.remove_duplicates),
+    "remove_duplicates_ccc": (coauthor_results, ccc_addon.remove_duplicates),
+    "distinct_wikidata": (doi_results, wikidataapi.distinct),
+}
+
+
+def start_fake_meta(entities):
+    process = Popen([executable, "-u", join(ROOT, "test", "fake_meta.py"), "--port", "0", "--entities", str(entities)],
+                    stdout=PIPE, text=True)
+    endpoints = dict(process.stdout.readline().strip().split("=", 1) for _ in range(2))
+    indexapi_core.META_SPARQL_ENDPOINT = endpoints["OC_META_SPARQL_ENDPOINT"]
+    indexapi_v1.META_API_ENDPOINT = endpoints["OC_META_API_ENDPOINT"]
+    return process
+
+
+def run(func, make_input):
+    # nothing is kept among the runs, so that each one asks Meta for everything
+    indexapi_core.BR_CACHE = None
+    indexapi_core.OMID_CACHE = TTLCache()
+    data = make_input()
+    wall, cpu = perf_counter(), process_time()
+    func(data)
+    return perf_counter() - wall, process_time() - cpu
+
+
+def measure(name, rows, repeat):
+    make_input, func = CASES[name]
+    times = [run(func, lambda: make_input(rows)) for _ in range(repeat)]
+
+    data = make_input(rows)
+    indexapi_core.BR_CACHE = None
+    start_tracing()
+    try:
+        func(data)
+        peak = get_traced_memory()[1]
+    finally:
+        stop_tracing()
+    return {
+        "wall_s": round(min(t[0] for t in times), 6),
+        "cpu_s": round(min(t[1] for t in times), 6),
+        "peak_kib": round(peak / 1024, 1)
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, by_rows in results.items():
+        for rows, current in by_rows.items():
+            previous = baseline.get("results", {}).get(name, {}).get(rows)
+            if previous is None:
+                continue
+            for key in ("wall_s", "cpu_s", "peak_kib"):
+                if previous[key] > 0 and current[key] > previous[key] * (1 + tolerance):
+                    regressions.append("%s (%s rows): %s %s -> %s" % (name, rows, key, previous[key], current[key]))
+    return regressions
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser("bench_suite.py")
+    arg_parser.add_argument("--rows", nargs="+", type=int, default=[1000, 10000, 100000])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    arg_parser.add_argument("--save", help="the JSON file where to save the results")
+    arg_parser.add_argument("--baseline", help="the JSON file of the results of a previous run")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="the relative growth of time or memory accepted with respect to the baseline")
+    args = arg_parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = load(f)
+
+    fake_meta = start_fake_meta(max(args.rows))
+    results = {}
+    try:
+        print("%-26s %8s %12s %12s %12s %10s" % ("case", "rows", "wall (ms)", "cpu (ms)", "peak (KiB)", "baseline"))
+        for name in args.cases:
+            results[name] = {}
+            for rows in args.rows:
+                result = results[name][str(rows)] = measure(name, rows, args.repeat)
+                previous = baseline["results"].get(name, {}).get(str(rows)) if baseline else None
+                print("%-26s %8s %12.1f %12.1f %12.1f %10s" % (
+                    name, rows, result["wall_s"] * 1e3, result["cpu_s"] * 1e3, result["peak_kib"],
+                    "%.2fx" % (result["wall_s"] / previous["wall_s"]) if previous and previous["wall_s"] else "-"))
+    finally:
+        fake_meta.terminate()
+        fake_meta.wait()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            dump({"python": python_version(), "platform": platform(), "repeat": args.repeat, "results": results},
+                 f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("regression: " + regression)
+        exit(1 if regressions else 0)
@@ -0,0 +1,779 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# The enrichment of the results of the index with the metadata of OpenCitations
+# Meta, shared by the addons of all the versions of the index API (indexapi_v1.py
+# and indexapi_v2.py): the resolution of the identifiers into OMIDs, the batch
+# retrieval of the metadata of the br entities, their deduplication by anyid,
+# and the computation of timespans and self-citations.
+#
+# The addons differ only in how the citing and cited entities are presented,
+# i.e. the function pids(elem, uri_omid) passed to the operations, which
+# returns the string representing the br entity uri_omid with metadata elem.
+#
+# The functions doing any call to Meta have an asynchronous version too, named
+# after them followed by "_async" (e.g. citations_info_async), which are used
+# when the operations are run in an event loop (see oc_async.py).
+
+from urllib.parse import quote
+from oc_http import post, apost, release
+from oc_cache import TTLCache, MISSING, cache_from_url
+from oc_dates import durations
+from oc_sparql import read_rows, sparql_headers
+from oc_flight import SingleFlight
+from oc_metrics import stage
+from oc_responses import incomplete
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from asyncio import Semaphore, gather, get_running_loop, sleep as async_sleep
+from os import environ
+from time import sleep
+from weakref import WeakKeyDictionary
+
+# the metadata of the br entities are retrieved from Meta in chunks of
+# META_CHUNK_SIZE entities, running at most META_MAX_WORKERS queries at the
+# same time, and retrying each failed query META_RETRIES times
+META_CHUNK_SIZE = int(environ.get("OC_META_CHUNK_SIZE", "3000"))
+META_MAX_WORKERS = int(environ.get("OC_META_MAX_WORKERS", "4"))
+META_RETRIES = int(environ.get("OC_META_RETRIES", "2"))
+META_RETRY_BACKOFF = float(environ.get("OC_META_RETRY_BACKOFF", "0.5"))
+
+# the SPARQL endpoint of Meta, e.g. the local Virtuoso of the deployment (or
+# the fake one in test/fake_meta.py for testing and benchmarking offline)
+META_SPARQL_ENDPOINT = environ.get("OC_META_SPARQL_ENDPOINT", "https://test.opencitations.net/meta/sparql")
+
+# the identifiers resolved together (e.g. by split_dois2omids) are looked up in
+# Meta with a query for each chunk of OMID_BATCH_SIZE identifiers
+OMID_BATCH_SIZE = int(environ.get("OC_OMID_BATCH_SIZE", "100"))
+
+# the OMIDs of the identifiers resolved recently are kept for OC_OMID_CACHE_TTL
+# seconds (OC_OMID_CACHE_NEGATIVE_TTL for the identifiers without any OMID)
+OMID_CACHE = TTLCache(
+    maxsize = int(environ.get("OC_OMID_CACHE_SIZE", "10000")),
+    ttl = float(environ.get("OC_OMID_CACHE_TTL", "3600")),
+    negative_ttl = float(environ.get("OC_OMID_CACHE_NEGATIVE_TTL", "300")))
+
+# the metadata of the br entities retrieved from Meta are cached by OMID in the
+# backend specified by OC_BR_CACHE: "memory" (default), "sqlite:////path/to/file.db"
+# or "redis://host:port/db" to share them among workers (skipped for
+# OC_REDIS_RETRY_AFTER seconds after an error), "none" to disable it
+BR_CACHE = cache_from_url(
+    environ.get("OC_BR_CACHE", "memory"),
+    ttl = float(environ.get("OC_BR_CACHE_TTL", "3600")),
+    maxsize = int(environ.get("OC_BR_CACHE_SIZE", "100000")))
+
+# the identical queries to Meta in progress at the same time (e.g. for the same
+# chunk of br entities, by identical requests) are run only once
+META_FLIGHT = SingleFlight("meta")
+
+# the semaphores of meta_semaphore, one for each event loop
+META_SEMAPHORES = WeakKeyDictionary()
+
+BR_HEADER = ["val","pubDate","ids","source","author"]
+# the results of the SPARQL queries are read row by row, in the format set by
+# OC_SPARQL_RESULTS_FORMAT (see oc_sparql.py)
+SPARQL_HEADERS = sparql_headers()
+CITATION_HEADER = ["oci", "citing", "cited", "creation", "timespan", "journal_sc", "author_sc"]
+
+def lower(s):
+    return s.lower(),
+
+def encode(s):
+    return quote(s),
+
+def id2omids(s):
+    if "omid" in s:
+        return s.replace("omid:br/","<https://w3id.org/oc/meta/br/") +">",
+    return get_omid_of(s, multi = True),
+
+async def id2omids_async(s):
+    if "omid" in s:
+        return id2omids(s)
+    return await get_omid_of_async(s, multi = True),
+
+def count_unique_cits(res, *args):
+    header = res[0]
+    citing_idx = header.index(args[1])
+    cited_idx = header.index(args[2])
+
+    cits = []
+    if len(res) > 1:
+        cits, citing_meta, cited_meta = __join_citations(res, citing_idx, cited_idx)
+
+    return [["count"],[ len( cits ) ]], True
+
+async def count_unique_cits_async(res, *args):
+    header = res[0]
+    citing_idx = header.index(args[1])
+    cited_idx = header.index(args[2])
+
+    cits = []
+    if len(res) > 1:
+        cits, citing_meta, cited_meta = await __join_citations_async(res, citing_idx, cited_idx)
+
+    return [["count"],[ len( cits ) ]], True
+
+# args must contain the <citing> and <cited>
+def citations_info(res, *args, pids, state = None):
+
+    header = res[0]
+    citing_idx = header.index(args[1])
+    cited_idx = header.index(args[2])
+
+    # build
+    f_res = [ list(CITATION_HEADER) ]
+
+    if len(res) > 1:
+        cits, citing_meta, cited_meta = __join_citations(res, citing_idx, cited_idx, state)
+        f_res.extend(__citation_rows(cits, citing_meta, cited_meta, pids))
+
+    return f_res, True
+
+async def citations_info_async(res, *args, pids):
+    header = res[0]
+    citing_idx = header.index(args[1])
+    cited_idx = header.index(args[2])
+
+    f_res = [ list(CITATION_HEADER) ]
+
+    if len(res) > 1:
+        cits, citing_meta, cited_meta = await __join_citations_async(res, citing_idx, cited_idx)
+        f_res.extend(__citation_rows(cits, citing_meta, cited_meta, pids))
+
+    return f_res, True
+
+# streaming version of citations_info (see oc_stream.py): res_pages are the
+# pages of the results of the index, and the unique br entities and the
+# citations already returned are kept among the pages, so as to not return
+# the same citation twice
+def citations_info_stream(res_pages, *args, pids):
+    state = ({}, {}, set())
+    for res in res_pages:
+        yield citations_info(res, *args, pids = pids, state = state)[0]
+
+# paginated version of citations_info (see oc_stream.py): res is a page of the
+# results of the index sorted by oci, and lookup runs the query of the
+# operation on a subset of its results. The duplicates of the br entities of
+# the page are searched in all the results, so that all the pages together
+# contain exactly the citations returned by citations_info, once each
+def citations_info_page(res, *args, pids, lookup):
+
+    header = res[0]
+    oci_idx = header.index(args[0])
+    citing_idx = header.index(args[1])
+    cited_idx = header.index(args[2])
+
+    f_res = [ list(CITATION_HEADER) ]
+
+    if len(res) > 1:
+        rows = [(row[citing_idx][1], row[cited_idx][1]) for row in res[1:]]
+        citing_meta, citing_alias = __get_unique_brs_in_results(
+            {citing for citing, cited in rows},
+            lambda brs: {row[0][1] for row in lookup({args[1]: brs}, distinct = args[1])[1:]})
+        cited_meta, cited_alias = __get_unique_brs_in_results(
+            {cited for citing, cited in rows},
+            lambda brs: {row[0][1] for row in lookup({args[2]: brs}, distinct = args[2])[1:]})
+
+        # the same citation can be in a previous page only if one of its
+        # entities has a duplicate in the results
+        found = set()
+        if len(citing_alias) > len(citing_meta) or len(cited_alias) > len(cited_meta):
+            prev_res = lookup({args[1]: sorted(citing_alias), args[2]: sorted(cited_alias)}, before = res[1][oci_idx][1])
+            for row in prev_res[1:]:
+                found.add((citing_alias.get(row[citing_idx][1]), cited_alias.get(row[cited_idx][1])))
+
+        cits, citing_meta, cited_meta = __unique_citations(rows, citing_meta, citing_alias, cited_meta, cited_alias, found)
+        f_res.extend(__citation_rows(cits, citing_meta, cited_meta, pids))
+
+    return f_res, True
+
+# args must contain the <count>
+def sum_all(res, *args):
+
+    header = res[0]
+    try:
+        count_idx = header.index(args[0])
+
+        tot_count = 0
+        for idx, row in enumerate(res[1:]):
+            tot_count += int(row[count_idx][1])
+
+        # delete the item + citing + cited columns
+        res = [header,[str(tot_count)]]
+        return res, True
+
+    except:
+        return [], True
+
+def get_omid_of(s, multi = False):
+    key = (s, multi)
+    omids = OMID_CACHE.get(key)
+    if omids is MISSING:
+        with stage("meta"):
+            omids = __query_omid_of(s, multi)
+        # in case Meta could not be queried nothing is cached
+        if omids is None:
+            incomplete()
+            return ""
+        OMID_CACHE.set(key, omids, negative = omids == "")
+    return omids
+
+async def get_omid_of_async(s, multi = False):
+    key = (s, multi)
+    omids = OMID_CACHE.get(key)
+    if omids is MISSING:
+        with stage("meta"):
+            omids = await __query_omid_of_async(s, multi)
+        if omids is None:
+            incomplete()
+            return ""
+        OMID_CACHE.set(key, omids, negative = omids == "")
+    return omids
+
+def get_omids_of(l_s):
+    # the OMIDs of each identifier in l_s, as returned by get_omid_of(s, multi = True),
+    # retrieved with a single query for each chunk of identifiers (except the
+    # journals, which are looked up one by one)
+    omids, chunks, journals = __omids_to_fetch(l_s)
+    with stage("meta"):
+        for chunk, omid_ls in zip(chunks, fetch_chunks(__query_omids_of, chunks)):
+            __omids_fetched(omids, chunk, omid_ls)
+        for s, journal_omids in zip(journals, fetch_chunks(lambda s: get_omid_of(s, multi = True), journals)):
+            omids[s] = journal_omids
+    return omids
+
+async def get_omids_of_async(l_s):
+    omids, chunks, journals = __omids_to_fetch(l_s)
+    with stage("meta"):
+        for chunk, omid_ls in zip(chunks, await fetch_chunks_async(__query_omids_of_async, chunks)):
+            __omids_fetched(omids, chunk, omid_ls)
+        for s, journal_omids in zip(journals, await fetch_chunks_async(lambda s: get_omid_of_async(s, multi = True), journals)):
+            omids[s] = journal_omids
+    return omids
+
+def get_brs_metadata(l_url_brs):
+    cached, chunks = __brs_to_fetch(l_url_brs)
+    with stage("meta"):
+        results = fetch_chunks(__br_meta_metadata_retry, chunks)
+    return __brs_fetched(l_url_brs, cached, results)
+
+async def get_brs_metadata_async(l_url_brs):
+    cached, chunks = __brs_to_fetch(l_url_brs)
+    with stage("meta"):
+        results = await fetch_chunks_async(__br_meta_metadata_retry_async, chunks)
+    return __brs_fetched(l_url_brs, cached, results)
+
+def fetch_chunks(func, chunks):
+    # the results are returned in the same order of the chunks, and each chunk
+    # is fetched in a copy of the context of the caller (e.g. with the stages of
+    # oc_metrics and the incomplete responses of oc_responses)
+    if len(chunks) <= 1 or META_MAX_WORKERS <= 1:
+        return [func(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=min(META_MAX_WORKERS, len(chunks))) as executor:
+        return list(executor.map(lambda ctx, chunk: ctx.run(func, chunk), [copy_context() for _ in chunks], chunks))
+
+async def fetch_chunks_async(func, chunks):
+    # as fetch_chunks, where the requests to Meta are limited by meta_semaphore
+    return await gather(*[func(chunk) for chunk in chunks])
+
+def meta_semaphore():
+    # the requests to Meta in progress in the running event loop, for all the
+    # calls it is serving, are at most META_MAX_WORKERS
+    loop = get_running_loop()
+    semaphore = META_SEMAPHORES.get(loop)
+    if semaphore is None:
+        semaphore = META_SEMAPHORES[loop] = Semaphore(max(META_MAX_WORKERS, 1))
+    return semaphore
+
+def get_id_val(val, reverse = False):
+    if not reverse:
+        return "https://w3id.org/oc/meta/"+val.split("oc/meta/")[1]
+    return val.replace("https://w3id.org/oc/meta/br/","")
+
+def get_pub_date(elem):
+    if "pubDate" in elem:
+        return elem["pubDate"]
+    return ""
+
+
+# ---
+# Local methods
+# ---
+
+def __query_omid_of(s, multi = False):
+    try:
+        response = post(META_SPARQL_ENDPOINT, headers=SPARQL_HEADERS, data=__omid_of_query(s), timeout=45, stream=True)
+    except:
+        return None
+    return __omid_of_results(response, multi)
+
+async def __query_omid_of_async(s, multi = False):
+    try:
+        async with meta_semaphore():
+            response = await apost(META_SPARQL_ENDPOINT, headers=SPARQL_HEADERS, data=__omid_of_query(s), timeout=45)
+    except:
+        return None
+    return __omid_of_results(response, multi)
+
+def __id_value(s):
+    # the literal value of the identifier s, without its scheme, and whether
+    # it is the identifier of a journal
+    is_journal = False
+    br_pre_l = ["doi","issn","isbn","pmid","pmcid","url","wikidata","wikipedia","jid","arxiv"]
+    for br_pre in br_pre_l:
+        if s.startswith(br_pre+":"):
+            s = s.replace(br_pre+":","")
+            # check if is journal
+            is_journal = br_pre in ["issn"]
+            break
+    return s, is_journal
+
+def __omid_of_query(s):
+    # SPARQL query
+    s, is_journal = __id_value(s)
+
+    sparql_query = """
+        PREFIX datacite: <http://purl.org/spar/datacite/>
+        PREFIX literal: <http://www.essepuntato.it/2010/06/literalreification/>
+        SELECT ?br {
+            ?identifier literal:hasLiteralValue '"""+s+"""'.
+            ?br datacite:hasIdentifier ?identifier
+        }
+    """
+
+    # in case is a journal the SAPRQL query retrieves all associated BRs
+    if is_journal:
+        sparql_query = """
+            PREFIX datacite: <http://purl.org/spar/datacite/>
+            PREFIX literal: <http://www.essepuntato.it/2010/06/literalreification/>
+            PREFIX ns1: <http://purl.org/vocab/frbr/core#>
+            PREFIX fabio: <http://purl.org/spar/fabio/>
+            SELECT ?br {
+            	?identifier literal:hasLiteralValue '"""+s+"""'^^<http://www.w3.org/2001/XMLSchema#string>.
+            	?venue datacite:hasIdentifier ?identifier .
+              	{?br ns1:partOf ?venue .}
+              	UNION { ?br ns1:partOf/ns1:partOf ?venue . }
+              	UNION { ?br ns1:partOf/ns1:partOf/ns1:partOf ?venue . }
+              	UNION { ?br ns1:partOf/ns1:partOf/ns1:partOf/ns1:partOf ?venue .}
+              	?br a fabio:JournalArticle .
+            }
+        """
+
+    return sparql_query
+
+def __omid_of_results(response, multi = False):
+    omid_l = []
+    try:
+        if response.status_code != 200:
+            release(response)
+            return None
+        for elem in read_rows(response):
+            omid_val = elem["br"].split("meta/br/")[1]
+            omid_l.append(omid_val)
+    except:
+        return None
+
+    return __omids_value(omid_l, multi)
+
+def __omids_value(omid_l, multi = False):
+    MULTI_VAL_MAX = 9000
+
+    if len(omid_l) == 0:
+        return ""
+
+    if multi:
+        sparql_values = []
+        for i in range(0, len(omid_l), MULTI_VAL_MAX):
+            sparql_values.append( " ".join(["<https://w3id.org/oc/meta/br/"+e+">" for e in omid_l[i:i + MULTI_VAL_MAX]]) )
+        return sparql_values
+
+    # in case multi OMIDs is not handled
+    # return the only omid given as result
+    return omid_l[0]
+
+def __omids_to_fetch(l_s):
+    # the OMIDs of the identifiers in cache, the chunks of the other identifiers,
+    # and the journals
+    omids = {}
+    l_ids = []
+    journals = []
+    for s in dict.fromkeys(l_s):
+        cached = OMID_CACHE.get((s, True))
+        if cached is not MISSING:
+            omids[s] = cached
+        elif __id_value(s)[1]:
+            journals.append(s)
+        else:
+            l_ids.append(s)
+    return omids, [l_ids[i:i + OMID_BATCH_SIZE] for i in range(0, len(l_ids), OMID_BATCH_SIZE)], journals
+
+def __omids_fetched(omids, l_s, omid_ls):
+    for s in l_s:
+        # in case Meta could not be queried nothing is cached
+        if omid_ls is None:
+            incomplete()
+            omids[s] = ""
+        else:
+            omids[s] = __omids_value(omid_ls.get(__id_value(s)[0], []), multi = True)
+            OMID_CACHE.set((s, True), omids[s], negative = omids[s] == "")
+
+def __query_omids_of(l_s):
+    try:
+        response = post(META_SPARQL_ENDPOINT, headers=SPARQL_HEADERS, data=__omids_of_query(l_s), timeout=45, stream=True)
+    except:
+        return None
+    return __omids_of_results(response)
+
+async def __query_omids_of_async(l_s):
+    try:
+        async with meta_semaphore():
+            response = await apost(META_SPARQL_ENDPOINT, headers=SPARQL_HEADERS, data=__omids_of_query(l_s), timeout=45)
+    except:
+        return None
+    return __omids_of_results(response)
+
+def __omids_of_query(l_s):
+    # the br entities having any of the literal values, in a single query
+    values = ['"%s"' % __id_value(s)[0].replace("\\", "\\\\").replace('"', '\\"') for s in l_s]
+    return """
+        PREFIX datacite: <http://purl.org/spar/datacite/>
+        PREFIX literal: <http://www.essepuntato.it/2010/06/literalreification/>
+        SELECT ?literalValue ?br {
+            VALUES ?literalValue { """+" ".join(values)+""" }
+            ?identifier literal:hasLiteralValue ?literalValue.
+            ?br datacite:hasIdentifier ?identifier
+        }
+    """
+
+def __omids_of_results(response):
+    # the OMIDs found for each literal value, in the order of the results
+    omid_ls = {}
+    try:
+        if response.status_code != 200:
+            release(response)
+            return None
+        for elem in read_rows(response):
+            omid_ls.setdefault(elem["literalValue"], []).append(elem["br"].split("meta/br/")[1])
+    except:
+        return None
+    return omid_ls
+
+def __citation_rows(cits, citing_meta, cited_meta, pids):
+    # the timespans are computed all together, and the sources and authors of
+    # each br entity are turned into sets only once
+    timespans = durations([
+        (get_pub_date(citing_meta[citing_entity]), get_pub_date(cited_meta[cited_entity]))
+        for citing_entity, cited_entity in cits])
+    citing_sc = __get_sc_sets(citing_meta)
+    cited_sc = __get_sc_sets(cited_meta)
+
+    f_res = []
+    for (citing_entity, cited_entity), timespan in zip(cits, timespans):
+
+        _citing = citing_meta[citing_entity]
+        _cited = cited_meta[cited_entity]
+
+        res_row = [
+            # oci value
+            get_id_val(citing_entity,True)+"-"+get_id_val(cited_entity,True),
+            # citing
+            pids(_citing,citing_entity),
+            # cited
+            pids(_cited,cited_entity),
+            # creation = citing[pub_date]
+            get_pub_date(_citing),
+            # timespan = citing[pub_date] - cited[pub_date]
+            timespan,
+            # journal_sc = compare citing[source_id] and cited[source_id]
+            "no" if citing_sc[citing_entity][0].isdisjoint(cited_sc[cited_entity][0]) else "yes",
+            # author_sc = compare citing[source_id] and cited[source_id]
+            "no" if citing_sc[citing_entity][1].isdisjoint(cited_sc[cited_entity][1]) else "yes"
+        ]
+        f_res.append(res_row)
+
+    return f_res
+
+def __join_citations(res, citing_idx, cited_idx, state = None):
+    # walk the (oci, citing, cited) rows returned by the index: each row is
+    # mapped to the deduplicated citing and cited entities, so that only the
+    # citations actually returned are considered (once each); state contains
+    # the anyids of the unique citing and cited entities and the citations
+    # found in the previous pages (when streaming)
+    citing_index, cited_index, found = state if state is not None else ({}, {}, set())
+    rows, citing_to_dedup, cited_to_dedup = __citation_pairs(res, citing_idx, cited_idx)
+
+    citing_meta, citing_alias = __get_unique_brs_metadata( sorted(citing_to_dedup), citing_index )
+    cited_meta, cited_alias = __get_unique_brs_metadata( sorted(cited_to_dedup), cited_index )
+
+    return __unique_citations(rows, citing_meta, citing_alias, cited_meta, cited_alias, found)
+
+async def __join_citations_async(res, citing_idx, cited_idx):
+    # as __join_citations, retrieving the citing and cited entities at once
+    rows, citing_to_dedup, cited_to_dedup = __citation_pairs(res, citing_idx, cited_idx)
+
+    citing_brs, cited_brs = await gather(
+        get_brs_metadata_async( sorted(citing_to_dedup) ), get_brs_metadata_async( sorted(cited_to_dedup) ))
+    citing_meta, citing_alias = __dedup_brs(citing_brs, BR_HEADER)
+    cited_meta, cited_alias = __dedup_brs(cited_brs, BR_HEADER)
+
+    return __unique_citations(rows, citing_meta, citing_alias, cited_meta, cited_alias, set())
+
+def __citation_pairs(res, citing_idx, cited_idx):
+    rows = []
+    citing_to_dedup = set()
+    cited_to_dedup = set()
+    for row in res[1:]:
+        citing_val = row[citing_idx]
+        cited_val = row[cited_idx]
+        if isinstance(citing_val, tuple):
+            citing_val = citing_val[1]
+            cited_val = cited_val[1]
+        rows.append((citing_val, cited_val))
+        citing_to_dedup.add(citing_val)
+        cited_to_dedup.add(cited_val)
+    return rows, citing_to_dedup, cited_to_dedup
+
+def __unique_citations(rows, citing_meta, citing_alias, cited_meta, cited_alias, found):
+    cits = []
+    for citing_val, cited_val in rows:
+        cit = (citing_alias.get(citing_val), cited_alias.get(cited_val))
+        if cit[0] in citing_meta and cit[1] in cited_meta and cit not in found:
+            found.add(cit)
+            cits.append(cit)
+
+    return cits, citing_meta, cited_meta
+
+def __get_unique_brs_metadata(l_url_brs, anyid_index = None):
+    brs_meta = get_brs_metadata(l_url_brs)
+    f_res, alias = __dedup_brs(brs_meta, BR_HEADER, anyid_index)
+    # the metadata of the unique br entities found in a previous page (when
+    # streaming) are not kept in memory, and are retrieved again if needed
+    l_prev = sorted(set(alias.values()).difference(f_res))
+    if l_prev:
+        prev_meta = {_url_br: brs_meta[_url_br] for _url_br in l_prev if _url_br in brs_meta}
+        prev_meta.update(get_brs_metadata([_url_br for _url_br in l_prev if _url_br not in brs_meta]))
+        f_res.update(__dedup_brs(prev_meta, BR_HEADER)[0])
+    return f_res, alias
+
+def __get_unique_brs_in_results(url_brs, in_results):
+    # the br entities in url_brs are deduplicated together with their
+    # duplicates (i.e. the br entities sharing an anyid with them, directly or
+    # not) that are in the results of the operation too, according to in_results
+    brs_meta = get_brs_metadata(sorted(url_brs))
+    visited_ids = set()
+    to_visit = brs_meta
+    while to_visit:
+        l_ids = set()
+        for k_val in to_visit.values():
+            if k_val.get("ids"):
+                l_ids.update(k_val["ids"].split(" __ "))
+        l_ids = sorted(l_ids.difference(visited_ids))
+        visited_ids.update(l_ids)
+
+        l_brs = set()
+        chunks = [l_ids[i:i + META_CHUNK_SIZE] for i in range(0, len(l_ids), META_CHUNK_SIZE)]
+        with stage("meta"):
+            for m_br in fetch_chunks(__br_meta_brs_retry, chunks):
+                l_brs.update(m_br[0])
+        l_brs.difference_update(brs_meta)
+        if l_brs:
+            l_brs = in_results(sorted(l_brs))
+        to_visit = get_brs_metadata(sorted(l_brs)) if l_brs else {}
+        brs_meta.update(to_visit)
+
+    return __dedup_brs({k: brs_meta[k] for k in sorted(brs_meta)}, BR_HEADER)
+
+def __brs_to_fetch(l_url_brs):
+    # only the br entities not available in cache are retrieved from Meta
+    cached = BR_CACHE.get_many(l_url_brs) if BR_CACHE is not None else {}
+    l_brs = ["<"+_url_br+">" for _url_br in l_url_brs if _url_br not in cached]
+    return cached, [l_brs[i:i + META_CHUNK_SIZE] for i in range(0, len(l_brs), META_CHUNK_SIZE)]
+
+def __brs_fetched(l_url_brs, cached, results):
+    brs_meta = {}
+    for m_br in results:
+        brs_meta.update( m_br[0] )
+    if BR_CACHE is not None:
+        BR_CACHE.set_many(brs_meta)
+    brs_meta.update(cached)
+
+    # keep the order of the input entities
+    return {_url_br: brs_meta[_url_br] for _url_br in l_url_brs if _url_br in brs_meta}
+
+def __br_meta_metadata_retry(values):
+    return META_FLIGHT.do(("metadata", frozenset(values)), __meta_retry, __br_meta_metadata, values)
+
+async def __br_meta_metadata_retry_async(values):
+    return await META_FLIGHT.do_async(("metadata", frozenset(values)), __meta_retry_async, __br_meta_metadata_async, values)
+
+def __br_meta_brs_retry(values):
+    return META_FLIGHT.do(("brs_of", frozenset(values)), __meta_retry, __br_meta_brs_of, values)
+
+def __meta_retry(func, values):
+    for attempt in range(META_RETRIES + 1):
+        m_br = func(values)
+        if m_br is not None and m_br[0] is not None:
+            return m_br
+        if attempt < META_RETRIES:
+            sleep(META_RETRY_BACKOFF * 2 ** attempt)
+    raise ConnectionError(
+        "the metadata of %s entities could not be retrieved from OpenCitations Meta" % len(values))
+
+async def __meta_retry_async(func, values):
+    for attempt in range(META_RETRIES + 1):
+        m_br = await func(values)
+        if m_br is not None and m_br[0] is not None:
+            return m_br
+        if attempt < META_RETRIES:
+            await async_sleep(META_RETRY_BACKOFF * 2 ** attempt)
+    raise ConnectionError(
+        "the metadata of %s entities could not be retrieved from OpenCitations Meta" % len(values))
+
+def __dedup_brs(brs_meta, header, anyid_index = None):
+    # a br entity is a duplicate of a unique br entity (the first one found)
+    # if they have at least one anyid in common: the anyids of the unique br
+    # entities are indexed, so that each anyid is looked up only once
+    if anyid_index is None:
+        anyid_index = {}
+    f_res = {}
+    # alias maps each br entity to the unique br entity representing it
+    alias = {}
+    for k_br,k_val in brs_meta.items():
+        br_ids = k_val.get("ids")
+        if br_ids:
+            l_ids = br_ids.split(" __ ")
+            _c_unique = None
+            for id in l_ids:
+                if id in anyid_index:
+                    if _c_unique is None or anyid_index[id][0] < _c_unique[0]:
+                        _c_unique = anyid_index[id]
+            # if there is no common anyids with the other br entities
+            if _c_unique is None:
+                _c_unique = (len(anyid_index), k_br)
+                for id in l_ids:
+                    anyid_index[id] = _c_unique
+                f_res[k_br] = {k: k_val.get(k, "") for k in header}
+            alias[k_br] = _c_unique[1]
+
+    return f_res, alias
+
+def __br_meta_metadata(values):
+    try:
+        response = post(META_SPARQL_ENDPOINT, headers=SPARQL_HEADERS, data=__br_meta_metadata_query(values), timeout=60, stream=True)
+        return __br_meta_metadata_results(response)
+    except:
+        return None,None
+
+async def __br_meta_metadata_async(values):
+    try:
+        async with meta_semaphore():
+            response = await apost(META_SPARQL_ENDPOINT, headers=SPARQL_HEADERS, data=__br_meta_metadata_query(values), timeout=60)
+        return __br_meta_metadata_results(response)
+    except:
+        return None,None
+
+def __br_meta_metadata_query(values):
+    # SPARQL query
+    return """
+    PREFIX pro: <http://purl.org/spar/pro/>
+    PREFIX frbr: <http://purl.org/vocab/frbr/core#>
+    PREFIX fabio: <http://purl.org/spar/fabio/>
+    PREFIX datacite: <http://purl.org/spar/datacite/>
+    PREFIX literal: <http://www.essepuntato.it/2010/06/literalreification/>
+    PREFIX prism: <http://prismstandard.org/namespaces/basic/2.0/>
+    SELECT DISTINCT ?val ?pubDate (GROUP_CONCAT(DISTINCT ?id; SEPARATOR=' __ ') AS ?ids) (GROUP_CONCAT(?venue; separator="; ") as ?source) (GROUP_CONCAT(?raAuthor; separator="; ") as ?author)
+    WHERE {
+    	  VALUES ?val { """+" ".join(values)+""" }
+          OPTIONAL { ?val prism:publicationDate ?pubDate. }
+          OPTIONAL {
+              ?val datacite:hasIdentifier ?identifier.
+              ?identifier datacite:usesIdentifierScheme ?scheme;
+                  literal:hasLiteralValue ?literalValue.
+              BIND(CONCAT(STRAFTER(STR(?scheme), "http://purl.org/spar/datacite/"), ":", ?literalValue) AS ?id)
+          }
+          OPTIONAL {
+              {
+                ?val a fabio:JournalArticle;
+                      frbr:partOf+ ?venue.
+                ?venue a fabio:Journal.
+              } UNION {
+                ?val frbr:partOf ?venue.
+              }
+          }
+          OPTIONAL {
+              ?val pro:isDocumentContextFor ?arAuthor.
+                  ?arAuthor pro:withRole pro:author;
+                            pro:isHeldBy ?raAuthor.
+          }
+     } GROUP BY ?val ?pubDate
+    """
+
+def __br_meta_metadata_results(response):
+    if response.status_code == 200:
+        res_json = {}
+        for elem in read_rows(response):
+            res_json[elem["val"]] = elem
+        return res_json,list(BR_HEADER)
+    release(response)
+    return None,None
+
+def __br_meta_brs_of(ids):
+    # the br entities having any of the ids (e.g. "doi:10.1108/jd-12-2013-0166")
+    values = []
+    for id in ids:
+        scheme, literal_value = id.split(":", 1)
+        if scheme.isalnum():
+            values.append('(datacite:%s "%s")' % (scheme, literal_value.replace("\\", "\\\\").replace('"', '\\"')))
+
+    sparql_query = """
+    PREFIX datacite: <http://purl.org/spar/datacite/>
+    PREFIX literal: <http://www.essepuntato.it/2010/06/literalreification/>
+    SELECT DISTINCT ?val
+    WHERE {
+          VALUES (?scheme ?literalValue) { """+" ".join(values)+""" }
+          ?identifier datacite:usesIdentifierScheme ?scheme;
+              literal:hasLiteralValue ?literalValue.
+          ?val datacite:hasIdentifier ?identifier.
+    }
+    """
+
+    try:
+        response = post(META_SPARQL_ENDPOINT, headers=SPARQL_HEADERS, data=sparql_query, timeout=60, stream=True)
+        if response.status_code == 200:
+            return {elem["val"] for elem in read_rows(response)},["val"]
+        release(response)
+    except:
+        pass
+    return None,None
+
+def __get_source(elem):
+    if "source" in elem:
+        return elem["source"].split("; ")
+    return ""
+
+def __get_author(elem):
+    if "author" in elem:
+        return elem["author"].split("; ")
+    return ""
+
+def __get_sc_sets(brs_meta):
+    # the sets of sources and authors of each br entity, to find self-citations
+    return {
+        k_br: (frozenset(__get_source(elem)), frozenset(__get_author(elem)))
+        for k_br, elem in brs_meta.items()
+    }
@@ -15,35 +15,73 @@
 # SOFTWARE.
 
 __author__ = 'Arcangelo Massari & Ivan Heibi'
-from urllib.parse import quote, unquote
-from requests import get,post
-from rdflib import Graph, URIRef
+import indexapi_core
+from indexapi_core import lower, encode, id2omids, id2omids_async, count_unique_cits, count_unique_cits_async, sum_all
+from oc_http import get, aget
+from oc_metrics import stage
+from asyncio import gather
 from re import sub,findall
 from json import loads
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from dateutil.parser import parse
-from collections import defaultdict
+from os import environ
 
-def lower(s):
-    return s.lower(),
+# the Meta metadata of the citing and cited entities are retrieved, deduplicated
+# and compared by indexapi_core.py, and the entities are presented with their
+# DOIs only (e.g. "10.7717/peerj-cs.421")
 
-def encode(s):
-    return quote(s),
+# number of entities asked in each call to the REST API of Meta
+META_API_CHUNK_SIZE = int(environ.get("OC_META_API_CHUNK_SIZE", "100"))
+# the metadata operation of the REST API of Meta
+META_API_ENDPOINT = environ.get("OC_META_API_ENDPOINT", "http://test.opencitations.net/meta/api/v1/metadata/")
+META_API_HEADERS = {"User-Agent": "INDEX REST API (via OpenCitations - http://opencitations.net; mailto:contact@opencitations.net)"}
 
+# the OMIDs of all the DOIs are retrieved at once (see indexapi_core.get_omids_of)
 def split_dois2omids(s):
+    l_dois = s.split("__")
+    omids = indexapi_core.get_omids_of(l_dois)
     l_omids = []
-    for d in s.split("__"):
-        print("omid of :",d)
-        l_omids.extend( __get_omid_of(d, multi = True) )
+    for d in l_dois:
+        l_omids.extend( omids[d] )
     return " ".join(l_omids),
 
-def id2omids(s):
-    if "omid" in s:
-        return s.replace("omid:br/","<https://w3id.org/oc/meta/br/") +">",
-    return __get_omid_of(s, multi = True),
+async def split_dois2omids_async(s):
+    l_dois = s.split("__")
+    omids = await indexapi_core.get_omids_of_async(l_dois)
+    l_omids = []
+    for d in l_dois:
+        l_omids.extend( omids[d] )
+    return " ".join(l_omids),
 
 def metadata(res, *args):
+    res, res_entities, all_entities, chunks = __metadata_request(res, *args)
+    k_omids_uris = indexapi_core.get_brs_metadata(all_entities)
+    with stage("meta"):
+        omids_meta = indexapi_core.fetch_chunks(lambda ids: __ocmeta_parser(ids,"omid"), chunks)
+    return __metadata_rows(res, res_entities, k_omids_uris, omids_meta), True
+
+async def metadata_async(res, *args):
+    res, res_entities, all_entities, chunks = __metadata_request(res, *args)
+    with stage("meta"):
+        k_omids_uris, omids_meta = await gather(
+            indexapi_core.get_brs_metadata_async(all_entities),
+            indexapi_core.fetch_chunks_async(lambda ids: __ocmeta_parser_async(ids,"omid"), chunks))
+    return __metadata_rows(res, res_entities, k_omids_uris, omids_meta), True
+
+# args must contain the <citing> and <cited>
+def citations_info(res, *args, state = None):
+    return indexapi_core.citations_info(res, *args, pids = __get_citation_doi, state = state)
+
+async def citations_info_async(res, *args):
+    return await indexapi_core.citations_info_async(res, *args, pids = __get_citation_doi)
+
+def citations_info_stream(res_pages, *args):
+    return indexapi_core.citations_info_stream(res_pages, *args, pids = __get_citation_doi)
+
+
+# ---
+# Local methods
+# ---
+
+def __metadata_request(res, *args):
     header = res[0]
     oci_idx = header.index(args[0]);
     citation_idx = header.index(args[1])
@@ -64,170 +102,71 @@ def metadata(res, *args):
     header = res[0]
     additional_fields = ["doi" , "citation_count", "citation", "reference", "author", "year", "title", "source_title", "volume", "issue", "page", "source_id", "oa_link"]
     header.extend(additional_fields)
-    rows_to_remove = []
 
+    # collect the br entities of all the rows (the entity itself, its citations and its
+    # references) so as to retrieve all their metadata with a few batched calls to Meta
     # org value: <https://w3id.org/oc/meta/br/06NNNNNN>
+    all_entities = {}
+    for idx in res_entities:
+        entities = res_entities[idx]["citation"].split("; ") + res_entities[idx]["reference"].split("; ") + [res_entities[idx]["omid"]]
+        for e in entities:
+            if e != "":
+                all_entities[e] = None
+
+    l_omids = ["omid:"+res_entities[idx]["omid"].split("oc/meta/")[1] for idx in res_entities]
+    chunks = [l_omids[i:i + META_API_CHUNK_SIZE] for i in range(0, len(l_omids), META_API_CHUNK_SIZE)]
+    return res, res_entities, list(all_entities), chunks
+
+def __metadata_rows(res, res_entities, k_omids_uris, l_omids_meta):
+    k_omids_dois = {e: __get_doi(k_omids_uris[e]) for e in k_omids_uris}
+    omids_meta = {}
+    for r in l_omids_meta:
+        omids_meta.update(r)
+
     for idx, row in enumerate(res[1:]):
         omid_uri = res_entities[idx]["omid"]
         citation = res_entities[idx]["citation"]
         reference = res_entities[idx]["reference"]
-        entities = citation.split("; ") + reference.split("; ") + [omid_uri]
-        r = __br_meta_metadata(["<"+e+">" for e in entities])
-        if r is None or all([i in ("", None) for i in r]):
-            row.extend(["","",""])
-        else:
-            k_omids_uris = r[0]
 
-            citation_ids = []
-            for e in citation.split("; "):
-                if e in k_omids_uris:
-                    citation_ids.append(__get_doi(k_omids_uris[e],True))
+        citation_ids = [k_omids_dois[e] for e in citation.split("; ") if e in k_omids_dois]
+        reference_ids = [k_omids_dois[e] for e in reference.split("; ") if e in k_omids_dois]
 
-            reference_ids = []
-            for e in reference.split("; "):
-                if e in k_omids_uris:
-                    reference_ids.append(__get_doi(k_omids_uris[e],True))
+        row.extend([
+            k_omids_dois.get(omid_uri, ""),
+            str(len(citation_ids)),
+            "; ".join(citation_ids),
+            "; ".join(reference_ids)
+        ])
 
+        entity = "omid:"+omid_uri.split("oc/meta/")[1]
+        if entity in omids_meta:
+            r = omids_meta[entity]
             row.extend([
-                __get_doi(k_omids_uris[omid_uri],True),
-                str(len(citation_ids)),
-                "; ".join(citation_ids),
-                "; ".join(reference_ids)
+                r["authors_str"],
+                r["pub_date"],
+                r["title"],
+                r["source_title"],
+                r["volume"],
+                r["issue"],
+                r["page"],
+                r["source_id"],
+                ""
             ])
-
-
-        entity = "omid:"+omid_uri.split("oc/meta/")[1]
-        r = __ocmeta_parser([entity],"omid")
-        if r is None or all([i in ("", None) for i in r]):
-            row.extend(["","","","","","","","",""])
         else:
-            if entity in r:
-                r = r[entity]
-                row.extend([
-                    r["authors_str"],
-                    r["pub_date"],
-                    r["title"],
-                    r["source_title"],
-                    r["volume"],
-                    r["issue"],
-                    r["page"],
-                    r["source_id"],
-                    ""
-                ])
-
-    return res, True
-
-def count_unique_cits(res, *args):
-    header = res[0]
-    oci_idx = header.index(args[0])
-    citing_idx = header.index(args[1])
-    cited_idx = header.index(args[2])
-    set_oci = set()
-
-    # build
-    if len(res) > 1:
-        citing_to_dedup = []
-        cited_to_dedup = []
-        for idx, row in enumerate(res[1:]):
-            citing_val = row[citing_idx]
-            cited_val = row[cited_idx]
-            if isinstance(citing_val, tuple):
-                citing_to_dedup.extend(citing_val)
-                cited_to_dedup.extend(cited_val)
-            else:
-                citing_to_dedup.append(citing_val)
-                cited_to_dedup.append(cited_val)
-
-        citing_to_dedup_meta = __get_unique_brs_metadata( list(set(citing_to_dedup)) )
-        cited_to_dedup_meta = __get_unique_brs_metadata( list(set(cited_to_dedup)) )
-        for _k_citing in citing_to_dedup_meta.keys():
-            for _k_cited in cited_to_dedup_meta.keys():
-                set_oci.add( (_k_citing,_k_cited) )
-    return [["count"],[ len( set_oci ) ]], True
-
-# args must contain the <citing> and <cited>
-def citations_info(res, *args):
-
-    header = res[0]
-    oci_idx = header.index(args[0])
-    citing_idx = header.index(args[1])
-    cited_idx = header.index(args[2])
-
-    # build
-    f_res = [
-        ["oci", "citing", "cited", "creation", "timespan", "journal_sc", "author_sc"]
-    ]
-
-    if len(res) > 1:
-        citing_to_dedup = []
-        cited_to_dedup = []
-        for idx, row in enumerate(res[1:]):
-            citing_val = row[citing_idx]
-            cited_val = row[cited_idx]
-            if isinstance(citing_val, tuple):
-                citing_to_dedup.extend(citing_val)
-                cited_to_dedup.extend(cited_val)
-            else:
-                citing_to_dedup.append(citing_val)
-                cited_to_dedup.append(cited_val)
-
-        citing_to_dedup_meta = __get_unique_brs_metadata( list(set(citing_to_dedup)) )
-        cited_to_dedup_meta = __get_unique_brs_metadata( list(set(cited_to_dedup)) )
-
-        for citing_entity in citing_to_dedup_meta:
-            for cited_entity in cited_to_dedup_meta:
-
-                _citing = citing_to_dedup_meta[citing_entity]
-                _cited = cited_to_dedup_meta[cited_entity]
-
-                res_row = [
-                    # oci value
-                    __get_id_val(citing_entity,True)+"-"+__get_id_val(cited_entity,True),
-                    # citing
-                    __get_doi(_citing),
-                    # cited
-                    __get_doi(_cited),
-                    # creation = citing[pub_date]
-                    __get_pub_date(_citing),
-                    # timespan = citing[pub_date] - cited[pub_date]
-                    __cit_duration(__get_pub_date(_citing),__get_pub_date(_cited)),
-                    # journal_sc = compare citing[source_id] and cited[source_id]
-                    __cit_journal_sc(__get_source(_citing),__get_source(_cited)),
-                    # author_sc = compare citing[source_id] and cited[source_id]
-                    __cit_author_sc(__get_author(_citing),__get_author(_cited))
-                ]
-                f_res.append(res_row)
-
-    return f_res, True
-
-# args must contain the <count>
-def sum_all(res, *args):
-
-    header = res[0]
-    try:
-        count_idx = header.index(args[0])
-
-        tot_count = 0
-        for idx, row in enumerate(res[1:]):
-            tot_count += int(row[count_idx][1])
-
-        # delete the item + citing + cited columns
-        res = [header,[str(tot_count)]]
-        return res, True
-
-    except:
-        return [], True
-
+            row.extend(["","","","","","","","",""])
 
-# ---
-# Local methods
-# ---
+    return res
 
 def __ocmeta_parser(ids, pre="doi"):
-    api = "http://test.opencitations.net/meta/api/v1/metadata/"
+    r = get(META_API_ENDPOINT + "__".join(ids), headers=META_API_HEADERS, timeout=60)
+    return __ocmeta_results(r, pre)
 
-    r = get(api + "__".join(ids), headers={"User-Agent": "INDEX REST API (via OpenCitations - http://opencitations.net; mailto:contact@opencitations.net)"}, timeout=60)
+async def __ocmeta_parser_async(ids, pre="doi"):
+    async with indexapi_core.meta_semaphore():
+        r = await aget(META_API_ENDPOINT + "__".join(ids), headers=META_API_HEADERS, timeout=60)
+    return __ocmeta_results(r, pre)
 
+def __ocmeta_results(r, pre):
     f_res = {}
     if r.status_code == 200:
         json_res = loads(r.text)
@@ -337,141 +276,6 @@ def __convert_cit_v1(l_cits):
     return l_cits
 
 
-def __get_omid_of(s, multi = False):
-    MULTI_VAL_MAX = 9000
-    sparql_endpoint = "https://test.opencitations.net/meta/sparql"
-
-    sparql_query = """
-        PREFIX datacite: <http://purl.org/spar/datacite/>
-        PREFIX literal: <http://www.essepuntato.it/2010/06/literalreification/>
-        SELECT ?br {
-            ?identifier literal:hasLiteralValue '"""+s+"""'.
-            ?br datacite:hasIdentifier ?identifier
-        }
-    """
-
-    headers={"Accept": "application/sparql-results+json", "Content-Type": "application/sparql-query"}
-    data = {"query": sparql_query}
-    omid_l = []
-    try:
-        response = post(sparql_endpoint, headers=headers, data=sparql_query, timeout=45)
-        if response.status_code == 200:
-            r = loads(response.text)
-            results = r["results"]["bindings"]
-            if len(results) > 0:
-                for elem in results:
-                    omid_val = elem["br"]["value"].split("meta/br/")[1]
-                    omid_l.append(omid_val)
-    except:
-        return ""
-
-    if len(omid_l) == 0:
-        return ""
-
-    if multi:
-        sparql_values = []
-        for i in range(0, len(omid_l), MULTI_VAL_MAX):
-            sparql_values.append( " ".join(["<https://w3id.org/oc/meta/br/"+e+">" for e in omid_l[i:i + MULTI_VAL_MAX]]) )
-        return sparql_values
-
-    # in case multi OMIDs is not handled
-    # return the only omid given as result
-    return omid_l[0]
-
-def __get_unique_brs_metadata(l_url_brs):
-
-    res = []
-    l_brs = ["<"+_url_br+">" for _url_br in l_url_brs]
-
-    i = 0
-    chunk_size = 3000
-    brs_meta = {}
-    while i < len(l_brs):
-        chunk = l_brs[i:i + chunk_size]
-        m_br = __br_meta_metadata(chunk)
-        brs_meta.update( m_br[0] )
-        if i == 0:
-            res.append(m_br[1])
-        i += chunk_size
-
-    unique_brs_anyid = []
-    unique_brs = []
-    for k_br,k_val in brs_meta.items():
-        br_ids = k_val["ids"]["value"]
-        if br_ids:
-            s = set( [id for id in br_ids.split(" __ ")] )
-            # check the unique br anyids
-            _c_intersection = 0
-            for __unique in unique_brs_anyid:
-                _c_intersection += len(__unique.intersection(s))
-            # if there is no common anyids with the other br entities
-            if _c_intersection == 0:
-                unique_brs_anyid.append(s)
-                br_values = [k_val[k]['value'] if k in k_val else "" for k in res[0]]
-                res.append( br_values )
-                #unique_brs.append( br_values )
-
-    f_res = {}
-    for row in res[1:]:
-        f_res[row[0]] = {k_val: row[i] for i, k_val in enumerate(res[0])}
-
-    return f_res
-
-def __br_meta_metadata(values):
-    sparql_endpoint = "https://test.opencitations.net/meta/sparql"
-
-    # SPARQL query
-    sparql_query = """
-    PREFIX pro: <http://purl.org/spar/pro/>
-    PREFIX frbr: <http://purl.org/vocab/frbr/core#>
-    PREFIX fabio: <http://purl.org/spar/fabio/>
-    PREFIX datacite: <http://purl.org/spar/datacite/>
-    PREFIX literal: <http://www.essepuntato.it/2010/06/literalreification/>
-    PREFIX prism: <http://prismstandard.org/namespaces/basic/2.0/>
-    SELECT DISTINCT ?val ?pubDate (GROUP_CONCAT(DISTINCT ?id; SEPARATOR=' __ ') AS ?ids) (GROUP_CONCAT(?venue; separator="; ") as ?source) (GROUP_CONCAT(?raAuthor; separator="; ") as ?author)
-    WHERE {
-    	  VALUES ?val { """+" ".join(values)+""" }
-          OPTIONAL { ?val prism:publicationDate ?pubDate. }
-          OPTIONAL {
-              ?val datacite:hasIdentifier ?identifier.
-              ?identifier datacite:usesIdentifierScheme ?scheme;
-                  literal:hasLiteralValue ?literalValue.
-              BIND(CONCAT(STRAFTER(STR(?scheme), "http://purl.org/spar/datacite/"), ":", ?literalValue) AS ?id)
-          }
-          OPTIONAL {
-              {
-                ?val a fabio:JournalArticle;
-                      frbr:partOf+ ?venue.
-                ?venue a fabio:Journal.
-              } UNION {
-                ?val frbr:partOf ?venue.
-              }
-          }
-          OPTIONAL {
-              ?val pro:isDocumentContextFor ?arAuthor.
-                  ?arAuthor pro:withRole pro:author;
-                            pro:isHeldBy ?raAuthor.
-          }
-     } GROUP BY ?val ?pubDate
-    """
-
-    headers={"Accept": "application/sparql-results+json", "Content-Type": "application/sparql-query"}
-    data = {"query": sparql_query}
-
-    try:
-        response = post(sparql_endpoint, headers=headers, data=sparql_query)
-        if response.status_code == 200:
-            r = loads(response.text)
-            results = r["results"]["bindings"]
-            res_json = {}
-            if len(results) > 0:
-                for elem in results:
-                    res_json[elem["val"]["value"]] = elem
-            return res_json,["val","pubDate","ids","source","author"]
-
-    except:
-        return None,None
-
 def __normalise(o):
     if o is None:
         s = ""
@@ -479,11 +283,6 @@ def __normalise(o):
         s = str(o)
     return sub("\s+", " ", s).strip()
 
-def __get_id_val(val, reverse = False):
-    if not reverse:
-        return "https://w3id.org/oc/meta/"+val.split("oc/meta/")[1]
-    return val.replace("https://w3id.org/oc/meta/br/","")
-
 def __get_omid(elem):
     str_ids = []
     if "ids" in elem:
@@ -493,99 +292,14 @@ def __get_omid(elem):
 
     return " ".join(str_ids)
 
-def __get_doi(elem, value_key = False):
+def __get_doi(elem):
     str_ids = []
     if "ids" in elem:
-        ids = elem["ids"]
-        if value_key:
-            ids = ids["value"]
-        for id in ids.split(" __ "):
+        for id in elem["ids"].split(" __ "):
             if id.startswith("doi:"):
                 str_ids.append(id.split("doi:")[1])
 
     return " ".join(str_ids)
 
-def __get_pub_date(elem):
-    if "pubDate" in elem:
-        return elem["pubDate"]
-    return ""
-
-def __get_source(elem):
-    if "source" in elem:
-        return elem["source"].split("; ")
-    return ""
-
-def __get_author(elem):
-    if "author" in elem:
-        return elem["author"].split("; ")
-    return ""
-
-def __cit_journal_sc(citing_source_ids, cited_source_ids):
-    if len(set(citing_source_ids).intersection(set(cited_source_ids))) > 0:
-        return "yes"
-    return "no"
-
-def __cit_author_sc(citing_authors, cited_authors):
-    if len(set(citing_authors).intersection(set(cited_authors))) > 0:
-        return "yes"
-    return "no"
-
-def __cit_duration(citing_complete_pub_date, cited_complete_pub_date):
-
-    def ___contains_years(date):
-        return date is not None and len(date) >= 4
-
-    def ___contains_months(date):
-        return date is not None and len(date) >= 7
-
-    def ___contains_days(date):
-        return date is not None and len(date) >= 10
-
-    DEFAULT_DATE = datetime(1970, 1, 1, 0, 0)
-    consider_months = ___contains_months(citing_complete_pub_date) and ___contains_months(cited_complete_pub_date)
-    consider_days = ___contains_days(citing_complete_pub_date) and ___contains_days(cited_complete_pub_date)
-
-    try:
-        if citing_complete_pub_date == "" or citing_complete_pub_date == None:
-            return ""
-        citing_pub_datetime = parse(
-            citing_complete_pub_date, default=DEFAULT_DATE
-        )
-    except ValueError:  # It is not a leap year
-        citing_pub_datetime = parse(
-            citing_complete_pub_date[:7] + "-28", default=DEFAULT_DATE
-        )
-    try:
-        if cited_complete_pub_date == "" or cited_complete_pub_date == None:
-            return ""
-        cited_pub_datetime = parse(
-            cited_complete_pub_date, default=DEFAULT_DATE
-        )
-    except ValueError:  # It is not a leap year
-        cited_pub_datetime = parse(
-            cited_complete_pub_date[:7] + "-28", default=DEFAULT_DATE
-        )
-
-    delta = relativedelta(citing_pub_datetime, cited_pub_datetime)
-
-    result = ""
-    if (
-        delta.years < 0
-        or (delta.years == 0 and delta.months < 0 and consider_months)
-        or (
-            delta.years == 0
-            and delta.months == 0
-            and delta.days < 0
-            and consider_days
-        )
-    ):
-        result += "-"
-    result += "P%sY" % abs(delta.years)
-
-    if consider_months:
-        result += "%sM" % abs(delta.months)
-
-    if consider_days:
-        result += "%sD" % abs(delta.days)
-
-    return result
+def __get_citation_doi(elem, uri_omid):
+    return __get_doi(elem)
@@ -18,12 +18,19 @@ __author__ = 'Arcangelo Massari'
 
 import re
 from difflib import get_close_matches
+from os import environ
 from typing import List, Tuple
 from urllib.parse import quote
 
 # from publishers import PUBLISHERS
 PUBLISHERS = list()
 
+# how generate_id_search looks up the non-OMID identifiers: "values" for a
+# single VALUES (?scheme ?literal) block joined once with the identifiers,
+# "union" for a UNION branch for each identifier
+ID_SEARCH = environ.get("OC_META_ID_SEARCH", "values")
+ID_SCHEMES = {'doi', 'issn', 'isbn', 'openalex', 'pmid', 'pmcid', 'url', 'wikidata', 'wikipedia'}
+
 URI_TYPE_DICT = {
     'http://purl.org/spar/doco/Abstract': 'abstract',
     'http://purl.org/spar/fabio/ArchivalDocument': 'archival document',
@@ -83,25 +90,47 @@ def generate_id_search(ids: str) -> Tuple[str]:
         literal_value = literal_value.lower() if scheme == 'doi' else literal_value
         if scheme == 'omid':
             omid_values.append("{{ BIND(<https://w3id.org/oc/meta/"+literal_value+"> AS ?res) }}")
-        elif scheme in {'doi', 'issn', 'isbn', 'openalex', 'pmid', 'pmcid', 'url', 'wikidata', 'wikipedia'}:
-            other_values.append('''
-                {{
-                    ?identifier literal:hasLiteralValue "'''+literal_value+'''";
-                                datacite:usesIdentifierScheme datacite:'''+scheme+''';
-                                ^datacite:hasIdentifier ?res.
-                    ?res a fabio:Expression.
-                }}
-            ''')
+        elif scheme in ID_SCHEMES:
+            other_values.append((scheme, literal_value))
 
     if omid_values:
         id_searches.append("?res a fabio:Expression."+" UNION ".join(omid_values))
 
     if other_values:
-        id_searches.append(" UNION ".join(other_values))
+        if ID_SEARCH == 'union':
+            id_searches.append(" UNION ".join(__id_search_union(scheme, literal_value) for scheme, literal_value in other_values))
+        else:
+            id_searches.append(__id_search_values(other_values))
 
     ids_search = " UNION ".join(id_searches)
     return ids_search,
 
+def __id_search_union(scheme:str, literal_value:str) -> str:
+    return '''
+                {{
+                    ?identifier literal:hasLiteralValue "'''+literal_value+'''";
+                                datacite:usesIdentifierScheme datacite:'''+scheme+''';
+                                ^datacite:hasIdentifier ?res.
+                    ?res a fabio:Expression.
+                }}
+            '''
+
+def __id_search_values(scheme_literal_values:List[Tuple[str, str]]) -> str:
+    # the identifiers are grouped by scheme, and the duplicates are removed
+    rows = list()
+    for scheme, literal_value in sorted(dict.fromkeys(scheme_literal_values), key=lambda x: x[0]):
+        literal_value = literal_value.replace('\\', '\\\\').replace('"', '\\"')
+        rows.append('(datacite:'+scheme+' "'+literal_value+'")')
+    return '''
+                {{
+                    VALUES (?scheme ?literal) { '''+" ".join(rows)+''' }
+                    ?identifier literal:hasLiteralValue ?literal;
+                                datacite:usesIdentifierScheme ?scheme;
+                                ^datacite:hasIdentifier ?res.
+                    ?res a fabio:Expression.
+                }}
+            '''
+
 def generate_ra_search(identifier:str) -> Tuple[str]:
     scheme_literal_value = identifier.split(':')
     if len(scheme_literal_value) == 2:
@@ -122,20 +151,25 @@ def generate_ra_search(identifier:str) -> Tuple[str]:
 
 def create_metadata_output(results):
     header = results[0]
-    output_results = [header]
+    # the columns to transform, and how, are resolved once, and the rows are
+    # modified in place
+    plan = [
+        (header.index(field), transform)
+        for field, transform in (
+            ('type', __postprocess_type),
+            ('author', process_ordered_list),
+            ('editor', process_ordered_list),
+            ('publisher', process_ordered_list))
+        if field in header]
     for result in results[1:]:
-        output_result = list()
-        for i, data in enumerate(result):
-            if i == header.index('type'):
-                beautiful_type = __postprocess_type(data[1])
-                output_result.append((data[0], beautiful_type))
-            elif i == header.index('author') or i == header.index('editor') or i == header.index('publisher'):
-                ordered_list = process_ordered_list(data[1])
-                output_result.append((data[0], ordered_list))
-            else:
-                output_result.append(data)
-        output_results.append(output_result)
-    return output_results, True
+        for i, transform in plan:
+            data = result[i]
+            result[i] = (data[0], transform(data[1]))
+    return results, True
+
+def create_metadata_output_stream(results_tables):
+    for results in results_tables:
+        yield create_metadata_output(results)[0]
 
 def __postprocess_type(type_uri:str) -> str:
     if type_uri:
@@ -157,15 +191,31 @@ def process_ordered_list(items):
         items_dict[current_role] = next_role
         role_to_name[current_role] = name
 
-    ordered_items = []
-    start_role = next(iter(role for role, next_role in items_dict.items() if not role in items_dict.values()))
-
-    current_role = start_role
-    while current_role:
-        ordered_items.append(role_to_name[current_role])
-        current_role = items_dict.get(current_role, '')
-
-    return "; ".join(ordered_items)
+    # the chain starts from the role that does not follow any other one. If the
+    # chain is broken, its segments are returned from the longest one, followed
+    # by the roles in cycles, if any
+    next_roles = set(items_dict.values())
+    visited = set()
+    heads = [role for role in items_dict if role not in next_roles]
+    if len(heads) > 1:
+        heads.sort()
+    segments = [__follow_roles(role, items_dict, visited) for role in heads]
+    if len(segments) > 1:
+        segments.sort(key=lambda segment: -len(segment))
+    if len(visited) < len(items_dict):
+        for role in sorted(items_dict):
+            if role not in visited:
+                segments.append(__follow_roles(role, items_dict, visited))
+
+    return "; ".join(role_to_name[role] for segment in segments for role in segment)
+
+def __follow_roles(role, items_dict, visited):
+    roles = []
+    while role in items_dict and role not in visited:
+        visited.add(role)
+        roles.append(role)
+        role = items_dict[role]
+    return roles
 
 # def clean_name(name: str) -> str:
 #     if ',' in name:
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Asynchronous execution of the RAMOSE operations, for serving them from an
+# event loop (e.g. an ASGI application) without blocking a thread for each
+# call to the SPARQL endpoints. The operations are executed as Operation.exec
+# does, but each function specified in '#preprocess' and '#postprocess' is
+# replaced by its asynchronous version, i.e. the addon coroutine having the
+# same name followed by "_async" (e.g. citations_info_async), if any. The other
+# functions are called as they are, and must not do any blocking call.
+#
+# Usage (e.g. in a Starlette endpoint):
+#
+#     status, res, c_type = await oc_async.exec_async(api_manager, str(request.url.path) + "?" + request.url.query)
+#     return Response(res, status_code=status, media_type=c_type)
+
+from csv import reader, writer
+from io import StringIO
+from re import sub
+from sys import exc_info
+from urllib.parse import parse_qs, quote
+
+from ramose import Operation
+
+from oc_http import aget, apost
+from oc_stream import operation_params
+
+
+async def exec_async(api_manager, op_complete_url, method="get", content_type="application/json"):
+    """Execute the operation specified by op_complete_url as Operation.exec does,
+    returning a tuple (status code, result, content type)."""
+    op = api_manager.get_op(op_complete_url)
+    if not isinstance(op, Operation):
+        return op
+    str_method = method.lower()
+    if str_method not in op.i["method"].split():
+        sc = 405
+        return sc, "HTTP status code %s: '%s' method not allowed" % (sc, str_method), "text/plain"
+
+    try:
+        par_dict = operation_params(op)
+        if op.addon is not None:
+            await preprocess_async(op, par_dict)
+
+        query = op.i["sparql"]
+        for param in par_dict:
+            query = query.replace("[[%s]]" % param, str(par_dict[param]))
+
+        if op.sparql_http_method == "get":
+            r = await aget(op.tp + "?query=" + quote(query), headers={"Accept": "text/csv"})
+        else:
+            r = await apost(op.tp, data=query, headers={"Accept": "text/csv", "Content-Type": "application/sparql-query"})
+        r.encoding = "utf-8"
+        sc = r.status_code
+        if sc != 200:
+            return sc, "HTTP status code %s: %s" % (sc, r.reason), "text/plain"
+
+        res = op.type_fields(list(reader(r.text.splitlines())), op.i)
+        if op.addon is not None:
+            res = await postprocess_async(op, res)
+        q_string = parse_qs(quote(op.url_parsed.query, safe="&="))
+        res = op.handling_params(q_string, res)
+        res = op.remove_types(res)
+        s_res = StringIO()
+        writer(s_res).writerows(res)
+        return (sc,) + Operation.conv(s_res.getvalue(), q_string, content_type)
+    except TimeoutError:
+        sc = 408
+        return sc, "HTTP status code %s: request timeout - %s" % (sc, __exc_message()), "text/plain"
+    except TypeError:
+        sc = 400
+        return sc, "HTTP status code %s: parameter in the request not compliant with the type specified - %s" % (
+            sc, __exc_message()), "text/plain"
+    except Exception:
+        sc = 500
+        return sc, "HTTP status code %s: something unexpected happened - %s" % (sc, __exc_message()), "text/plain"
+
+
+async def preprocess_async(op, par_dict):
+    """Preprocess the parameters in par_dict as Operation.preprocess does."""
+    if "preprocess" in op.i:
+        for pre in [sub(r"\s+", "", i) for i in op.i["preprocess"].split(" --> ")]:
+            func_name = sub(r"^([^\(\)]+)\(.+$", "\\1", pre).strip()
+            params_name = sub(r"^.+\(([^\(\)]+)\).*", "\\1", pre).split(",")
+            res = await call_async(op.addon, func_name, *[par_dict[param_name] for param_name in params_name])
+            for idx in range(len(res)):
+                par_dict[params_name[idx]] = res[idx]
+    return par_dict
+
+
+async def postprocess_async(op, res):
+    """Postprocess the result table res as Operation.postprocess does."""
+    if "postprocess" in op.i:
+        for post in [i.strip() for i in op.i["postprocess"].split(" --> ")]:
+            func_name = sub(r"^([^\(\)]+)\(.+$", "\\1", post).strip()
+            param_str = sub(r"^.+\(([^\(\)]*)\).*", "\\1", post)
+            params = () if param_str == "" else tuple(next(reader(param_str.splitlines(), skipinitialspace=True)))
+            res, do_type_fields = await call_async(op.addon, func_name, res, *params)
+            if do_type_fields:
+                res = op.type_fields(res, op.i)
+    return res
+
+
+async def call_async(addon, func_name, *args):
+    """Call the asynchronous version of the addon function, if any, or the
+    function itself otherwise."""
+    func = getattr(addon, func_name + "_async", None)
+    if func is not None:
+        return await func(*args)
+    return getattr(addon, func_name)(*args)
+
+
+def __exc_message():
+    exc_type, exc_obj, exc_tb = exc_info()
+    return "%s: %s (line %s)" % (exc_type.__name__, exc_obj, exc_tb.tb_lineno)
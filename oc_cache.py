@@ -0,0 +1,348 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Caches used by the addons to avoid asking OpenCitations Meta for the same
+# data again and again.
+
+from collections import OrderedDict
+from json import dumps, loads
+from os import environ, getpid
+from socket import create_connection
+from sqlite3 import DatabaseError, connect
+from threading import Lock, local
+from time import monotonic, time
+from urllib.parse import urlsplit
+
+# returned by the caches when a key is not available, since None (or an
+# empty value) can be cached as well
+MISSING = object()
+
+
+class TTLCache(object):
+    """A bounded cache: when full, the least recently used entry is evicted, and
+    each entry expires after ttl seconds. Misses can be cached as well with
+    set(key, value, negative=True), which uses the (usually shorter) negative_ttl.
+    A maxsize of 0 disables the cache."""
+
+    def __init__(self, maxsize=10000, ttl=3600, negative_ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.__data = OrderedDict()
+        self.__lock = Lock()
+        self.__stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        with self.__lock:
+            item = self.__data.get(key, MISSING)
+            if item is not MISSING:
+                value, expiry = item
+                if expiry > monotonic():
+                    self.__data.move_to_end(key)
+                    self.__stats["hits"] += 1
+                    return value
+                del self.__data[key]
+                self.__stats["expirations"] += 1
+            self.__stats["misses"] += 1
+            return MISSING
+
+    def set(self, key, value, negative=False):
+        ttl = self.negative_ttl if negative else self.ttl
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self.__lock:
+            self.__data[key] = (value, monotonic() + ttl)
+            self.__data.move_to_end(key)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+                self.__stats["evictions"] += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def stats(self):
+        with self.__lock:
+            result = dict(self.__stats)
+            result["size"] = len(self.__data)
+            return result
+
+
+# Cache of the metadata of the bibliographic resources retrieved from Meta,
+# keyed by OMID. All the backends have the same interface (get_many and
+# set_many) and never raise: a backend that can't be reached behaves as an
+# empty cache, so that the data are simply retrieved from Meta again.
+
+class MemoryBackend(object):
+    """In-process LRU cache, not shared among the workers of a server."""
+
+    def __init__(self, maxsize=100000, ttl=3600):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get_many(self, keys):
+        result = {}
+        for key in keys:
+            value = self.cache.get(key)
+            if value is not MISSING:
+                result[key] = value
+        return result
+
+    def set_many(self, items):
+        for key, value in items.items():
+            self.cache.set(key, value)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+def _decode(result, key, value):
+    # the values that can't be decoded (e.g. written by something else) are misses
+    try:
+        result[key] = loads(value)
+    except ValueError:
+        pass
+
+
+class SqliteBackend(object):
+    """On-disk cache stored in a SQLite database, which can be shared by all
+    the processes running on the same machine."""
+
+    MAX_VARIABLES = 500
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.__local = local()
+        self.__lock = Lock()
+        self.__stats = {"hits": 0, "misses": 0, "errors": 0}
+        # e.g. the database can't be created: the cache is empty until it can
+        try:
+            self.__connection()
+        except DatabaseError:
+            self.__count("errors")
+
+    def __connection(self):
+        # sqlite connections can't be shared among threads (nor processes)
+        conn = getattr(self.__local, "conn", None)
+        if conn is None or self.__local.pid != getpid():
+            conn = connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS br_meta (key TEXT PRIMARY KEY, value TEXT, expiry REAL)")
+            self.__local.conn = conn
+            self.__local.pid = getpid()
+        return conn
+
+    def __count(self, key, n=1):
+        with self.__lock:
+            self.__stats[key] += n
+
+    def get_many(self, keys):
+        result = {}
+        keys = list(keys)
+        try:
+            conn = self.__connection()
+            now = time()
+            for i in range(0, len(keys), self.MAX_VARIABLES):
+                chunk = keys[i:i + self.MAX_VARIABLES]
+                for key, value in conn.execute(
+                        "SELECT key, value FROM br_meta WHERE expiry > ? AND key IN (%s)" % ",".join("?" * len(chunk)),
+                        [now] + chunk):
+                    _decode(result, key, value)
+        except DatabaseError:
+            self.__count("errors")
+            return {}
+        self.__count("hits", len(result))
+        self.__count("misses", len(keys) - len(result))
+        return result
+
+    def set_many(self, items):
+        if not items or self.ttl <= 0:
+            return
+        expiry = time() + self.ttl
+        try:
+            conn = self.__connection()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO br_meta (key, value, expiry) VALUES (?, ?, ?)",
+                    [(key, dumps(value), expiry) for key, value in items.items()])
+        except DatabaseError:
+            self.__count("errors")
+
+    def purge(self):
+        """Remove the expired entries from the database."""
+        try:
+            self.__connection().execute("DELETE FROM br_meta WHERE expiry <= ?", (time(),))
+        except DatabaseError:
+            self.__count("errors")
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.__stats)
+
+
+# seconds during which a Redis server is not contacted again after an error
+REDIS_RETRY_AFTER = float(environ.get("OC_REDIS_RETRY_AFTER", "30"))
+
+
+class RedisBackend(object):
+    """Cache stored in a server speaking the Redis protocol (e.g. Redis, Valkey,
+    KeyDB), shared by all the workers connected to it. Only MGET and SET are
+    used, through a minimal client, so no further library is needed. After an
+    error (e.g. the server is down), the server is skipped for retry_after
+    seconds, so that the calls do not wait for its timeout each time."""
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, ttl=3600, prefix="oc:br:", timeout=2,
+                 retry_after=REDIS_RETRY_AFTER):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.ttl = ttl
+        self.prefix = prefix
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.__local = local()
+        self.__lock = Lock()
+        self.__stats = {"hits": 0, "misses": 0, "errors": 0, "skipped": 0}
+        self.__down_until = 0
+
+    def __count(self, key, n=1):
+        with self.__lock:
+            self.__stats[key] += n
+
+    def __connection(self):
+        conn = getattr(self.__local, "conn", None)
+        if conn is None or self.__local.pid != getpid():
+            sock = create_connection((self.host, self.port), timeout=self.timeout)
+            conn = (sock, sock.makefile("rb"))
+            self.__local.conn = conn
+            self.__local.pid = getpid()
+            if self.db:
+                self.__execute([("SELECT", self.db)])
+        return conn
+
+    def __close(self):
+        conn = getattr(self.__local, "conn", None)
+        self.__local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def __encode(command):
+        out = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def __read(self, f):
+        line = f.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by the cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise ConnectionError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            return f.read(size + 2)[:-2]
+        if kind == b"*":
+            size = int(payload)
+            if size < 0:
+                return None
+            return [self.__read(f) for _ in range(size)]
+        raise ConnectionError("unexpected reply from the cache server")
+
+    def __execute(self, commands):
+        # the commands are pipelined, i.e. sent all together before reading the replies
+        sock, f = self.__connection()
+        sock.sendall(b"".join(self.__encode(command) for command in commands))
+        return [self.__read(f) for _ in commands]
+
+    def __available(self):
+        if monotonic() < self.__down_until:
+            self.__count("skipped")
+            return False
+        return True
+
+    def __failed(self):
+        self.__close()
+        self.__count("errors")
+        self.__down_until = monotonic() + self.retry_after
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys or not self.__available():
+            return {}
+        try:
+            values = self.__execute([["MGET"] + [self.prefix + key for key in keys]])[0]
+        except (OSError, ValueError):
+            self.__failed()
+            return {}
+        result = {}
+        for key, value in zip(keys, values):
+            if value is not None:
+                _decode(result, key, value)
+        self.__count("hits", len(result))
+        self.__count("misses", len(keys) - len(result))
+        return result
+
+    def set_many(self, items):
+        if not items or self.ttl <= 0 or not self.__available():
+            return
+        try:
+            self.__execute([
+                ("SET", self.prefix + key, dumps(value), "EX", int(self.ttl)) for key, value in items.items()])
+        except (OSError, ValueError):
+            self.__failed()
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.__stats)
+
+
+def cache_from_url(url, ttl=3600, maxsize=100000):
+    """Create the backend described by url, i.e. "memory", "sqlite:///relative/path.db"
+    (or "sqlite:////absolute/path.db"), or "redis://host:port/db". An empty url (or
+    "none") disables the cache."""
+    if url is None or url.strip().lower() in ("", "none"):
+        return None
+    parsed = urlsplit(url.strip())
+    if url.strip().lower() == "memory":
+        return MemoryBackend(maxsize=maxsize, ttl=ttl)
+    if parsed.scheme == "sqlite":
+        return SqliteBackend(parsed.path[1:], ttl=ttl)
+    if parsed.scheme == "redis":
+        db = parsed.path.strip("/")
+        return RedisBackend(
+            host=parsed.hostname or "127.0.0.1", port=parsed.port or 6379,
+            db=int(db) if db else 0, ttl=ttl)
+    raise ValueError("unknown cache backend: %s" % url)
@@ -0,0 +1,241 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Precomputed counts of the incoming citations and of the outgoing references
+# of each br entity of the index, deduplicated as count_unique_cits does (i.e.
+# the br entities sharing an anyid count once, and the ones without any
+# identifier but the OMID are not counted).
+#
+# The counts are computed offline from the CSV dump of the index (the one with
+# the columns oci, citing, cited, ..., where citing and cited contain all the
+# PIDs of the entities, e.g. "omid:br/061 doi:10.1000/1"), plain or zipped, by
+# means of an external sort, so that dumps larger than the memory available can
+# be processed:
+#
+#     python oc_counts.py -i index_dump/ -o counts.bin
+#
+# The resulting file contains the sorted array of the OMIDs (as integers) and
+# the array of their counts, and it is memory-mapped by CountIndex, which looks
+# up an OMID with a binary search.
+#
+# The index is used by the count operations of the v2 API only (see
+# indexapi_v2.py, with OC_COUNT_INDEX set to the file): the v1 ones are run live.
+
+from argparse import ArgumentParser
+from array import array
+from bisect import bisect_left
+from csv import DictReader
+from heapq import merge
+from io import TextIOWrapper
+from itertools import groupby
+from mmap import mmap, ACCESS_READ
+from os import listdir
+from os.path import isdir, join
+from shutil import copyfileobj
+from struct import pack, unpack_from
+from sys import byteorder
+from tempfile import TemporaryFile
+from zipfile import ZipFile
+
+# the arrays are stored with the byte order of the machine that built them
+MAGIC = b"OCCNT1" + (b"L\0" if byteorder == "little" else b"B\0")
+HEADER_SIZE = 16
+
+
+class CountIndex(object):
+    """Read-only view of a file created by build."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.__mm = mmap(f.fileno(), 0, access=ACCESS_READ)
+        if self.__mm[:8] != MAGIC:
+            raise ValueError("%s is not a count index built on this platform" % path)
+        n = unpack_from("<Q", self.__mm, 8)[0]
+        view = memoryview(self.__mm)
+        self.__keys = view[HEADER_SIZE:HEADER_SIZE + 8 * n].cast("Q")
+        self.__counts = view[HEADER_SIZE + 8 * n:HEADER_SIZE + 16 * n].cast("I")
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def get(self, omid):
+        """Return the tuple (incoming citations, outgoing references) of the br
+        entity with the OMID specified (e.g. "06101801781"), or None if it is
+        not in the index."""
+        key = omid_key(omid)
+        idx = bisect_left(self.__keys, key)
+        if idx < len(self.__keys) and self.__keys[idx] == key:
+            return self.__counts[2 * idx], self.__counts[2 * idx + 1]
+        return None
+
+
+def omid_key(omid):
+    # the digits of an OMID can start with 0
+    return int("1" + omid)
+
+
+def dump_rows(inputs):
+    """Iterate the rows of the CSV files specified, which can be directories
+    and zip archives of CSV files too."""
+    for path in inputs:
+        if isdir(path):
+            for row in dump_rows(sorted(join(path, name) for name in listdir(path))):
+                yield row
+        elif path.endswith(".zip"):
+            with ZipFile(path) as z:
+                for name in sorted(z.namelist()):
+                    if name.endswith(".csv"):
+                        with z.open(name) as f:
+                            for row in DictReader(TextIOWrapper(f, encoding="utf-8")):
+                                yield row
+        elif path.endswith(".csv"):
+            with open(path, encoding="utf-8", newline="") as f:
+                for row in DictReader(f):
+                    yield row
+
+
+def __pids(s):
+    # the OMID of the entity and its other PIDs
+    omid = None
+    ids = []
+    for pid in s.split():
+        if pid.startswith("omid:br/"):
+            omid = pid[8:]
+        else:
+            ids.append(pid)
+    return omid, ids
+
+
+def __edges(rows):
+    # each citation gives an incoming edge of the cited entity and an outgoing
+    # one of the citing entity, as strings sorted by entity (in the order of
+    # the keys) and other entity (in the order of the OMIDs)
+    for row in rows:
+        citing, citing_ids = __pids(row["citing"])
+        cited, cited_ids = __pids(row["cited"])
+        if citing is not None and cited is not None:
+            yield (
+                "%020d\t%s\t%s\t%s" % (omid_key(cited), citing, int(bool(cited_ids)), " ".join(citing_ids)),
+                "%020d\t%s\t%s\t%s" % (omid_key(citing), cited, int(bool(citing_ids)), " ".join(cited_ids)))
+
+
+def __sorted_edges(edges, chunk_size):
+    # external sort of the incoming and outgoing edges: the sorted chunks are
+    # stored in temporary files and then merged
+    runs = ([], [])
+    chunks = ([], [])
+    for edge_pair in edges:
+        for chunk, edge in zip(chunks, edge_pair):
+            chunk.append(edge)
+        if len(chunks[0]) >= chunk_size:
+            for l_runs, chunk in zip(runs, chunks):
+                l_runs.append(__store_run(sorted(chunk)))
+                chunk.clear()
+    result = []
+    for l_runs, chunk in zip(runs, chunks):
+        chunk.sort()
+        if l_runs:
+            l_runs.append(__store_run(chunk))
+            result.append(merge(*[__read_run(run) for run in l_runs]))
+        else:
+            result.append(iter(chunk))
+    return result
+
+
+def __store_run(chunk):
+    f = TemporaryFile("w+", encoding="utf-8")
+    for edge in chunk:
+        f.write(edge + "\n")
+    f.seek(0)
+    return f
+
+
+def __read_run(f):
+    with f:
+        for line in f:
+            yield line[:-1]
+
+
+def __counts(edges, kind):
+    # the deduplicated count of each entity, as (key, kind, count) in order
+    for key, group in groupby((edge.split("\t") for edge in edges), key=lambda e: e[0]):
+        anyid_index = set()
+        count = 0
+        prev = None
+        for _, other, has_ids, other_ids in group:
+            # the entities without identifiers are not counted, as well as
+            # all their citations
+            if has_ids == "0":
+                count = 0
+                break
+            if other == prev:
+                continue
+            prev = other
+            l_ids = other_ids.split()
+            # a greedy deduplication in the order of the OMIDs, as __dedup_brs
+            if l_ids and anyid_index.isdisjoint(l_ids):
+                anyid_index.update(l_ids)
+                count += 1
+        yield int(key), kind, count
+
+
+def build(inputs, output, chunk_size=1000000):
+    """Build the count index of the citations in the CSV dump specified by
+    inputs, storing it in the file output. At most chunk_size citations are
+    kept in memory. Return the number of br entities indexed."""
+    incoming, outgoing = __sorted_edges(__edges(dump_rows(inputs)), chunk_size)
+    n = 0
+    keys = array("Q")
+    c_buf = array("I")
+    with open(output, "wb") as out, TemporaryFile() as counts:
+        out.write(MAGIC + pack("<Q", 0))
+        for key, group in groupby(merge(__counts(incoming, 0), __counts(outgoing, 1)), key=lambda c: c[0]):
+            key_counts = [0, 0]
+            for _, kind, count in group:
+                key_counts[kind] = count
+            keys.append(key)
+            c_buf.extend(key_counts)
+            if len(keys) >= chunk_size:
+                n += __flush(keys, c_buf, out, counts)
+        n += __flush(keys, c_buf, out, counts)
+        counts.seek(0)
+        copyfileobj(counts, out)
+        out.seek(8)
+        out.write(pack("<Q", n))
+    return n
+
+
+def __flush(keys, c_buf, out, counts):
+    n = len(keys)
+    keys.tofile(out)
+    c_buf.tofile(counts)
+    del keys[:]
+    del c_buf[:]
+    return n
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser("oc_counts.py", description="Build the count index from a CSV dump of the index")
+    arg_parser.add_argument("-i", "--input", nargs="+", required=True,
+                            help="CSV files, zip archives of CSV files, or directories containing them")
+    arg_parser.add_argument("-o", "--output", required=True, help="the file where to store the count index")
+    arg_parser.add_argument("-c", "--chunk-size", type=int, default=1000000,
+                            help="the number of citations sorted in memory at once")
+    args = arg_parser.parse_args()
+    print("%s br entities indexed" % build(args.input, args.output, args.chunk_size))
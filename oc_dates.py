@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Computation of the timespans of the citations, i.e. the durations between the
+# publication dates of the citing and of the cited entities, for many citations
+# at once: each distinct date is parsed only once into integer arrays, and the
+# durations are computed on them with the same semantics of dateutil's
+# relativedelta, without creating any intermediate object.
+#
+# The publication dates in Meta are always YYYY, YYYY-MM or YYYY-MM-DD: these
+# are parsed directly (and memoized), while dateutil is used for anything else.
+
+from array import array
+from calendar import monthrange
+from datetime import date, datetime
+from functools import lru_cache
+from os import environ
+from re import compile
+
+from dateutil.parser import parse
+
+DEFAULT_DATE = datetime(1970, 1, 1, 0, 0)
+ISO_DATE = compile("([0-9]{4})(?:-([0-9]{2})(?:-([0-9]{2}))?)?")
+DATE_CACHE_SIZE = int(environ.get("OC_DATE_CACHE_SIZE", "200000"))
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(s):
+    """Return the tuple (year, month, day) of the date s, where the missing month
+    and day are 1. An invalid day (e.g. the 29th of February of a non-leap year)
+    is replaced by 28."""
+    iso = ISO_DATE.fullmatch(s)
+    if iso:
+        y = int(iso.group(1))
+        m = int(iso.group(2) or 1)
+        d = int(iso.group(3) or 1)
+        if y >= 1000 and 1 <= m <= 12 and 1 <= d <= 31:
+            return y, m, d if d <= monthrange(y, m)[1] else 28
+    return __parse_general(s)
+
+
+def __parse_general(s):
+    try:
+        d = parse(s, default=DEFAULT_DATE)
+    except ValueError:  # It is not a leap year
+        d = parse(s[:7] + "-28", default=DEFAULT_DATE)
+    return d.year, d.month, d.day
+
+
+def durations(pairs):
+    """Return the durations between the dates in each pair (citing date, cited date)
+    in the XSD format (e.g. "P1Y2M3D", or "-P1Y" if the cited date follows the
+    citing one), where months and days are specified only if both the dates
+    contain them. The duration is an empty string if any of the dates is empty."""
+    dates = {}
+    years = array("i")
+    months = array("i")
+    days = array("i")
+    ordinals = array("i")
+    # 0 = year only, 1 = year and month, 2 = complete date
+    precisions = array("b")
+
+    def date_idx(s):
+        idx = dates.get(s)
+        if idx is None:
+            y, m, d = parse_date(s)
+            idx = dates[s] = len(years)
+            years.append(y)
+            months.append(m)
+            days.append(d)
+            ordinals.append(date(y, m, d).toordinal())
+            precisions.append(2 if len(s) >= 10 else 1 if len(s) >= 7 else 0)
+        return idx
+
+    # the dates are parsed in the same order as __cit_duration did
+    citing_idx = array("i")
+    cited_idx = array("i")
+    for citing_date, cited_date in pairs:
+        c_idx = -1 if citing_date == "" or citing_date is None else date_idx(citing_date)
+        citing_idx.append(c_idx)
+        cited_idx.append(-1 if c_idx < 0 or cited_date == "" or cited_date is None else date_idx(cited_date))
+
+    result = []
+    computed = {}
+    for c_idx, d_idx in zip(citing_idx, cited_idx):
+        if d_idx < 0:
+            result.append("")
+            continue
+        duration = computed.get((c_idx, d_idx))
+        if duration is None:
+            precision = min(precisions[c_idx], precisions[d_idx])
+            duration = computed[(c_idx, d_idx)] = __format(
+                __relative_delta(
+                    years[c_idx], months[c_idx], ordinals[c_idx],
+                    years[d_idx], months[d_idx], days[d_idx], ordinals[d_idx]),
+                precision >= 1, precision >= 2)
+        result.append(duration)
+    return result
+
+
+def __relative_delta(y1, m1, o1, y2, m2, d2, o2):
+    # the (years, months, days) of relativedelta(date1, date2): the months are
+    # added to date2 (with the day clamped to the end of the month) until
+    # reaching date1, and the remaining days are counted
+    n_months = (y1 - y2) * 12 + m1 - m2
+    step = 1 if o1 < o2 else -1
+    while True:
+        y, m = divmod(m2 - 1 + n_months, 12)
+        y += y2
+        o = date(y, m + 1, min(d2, monthrange(y, m + 1)[1])).toordinal()
+        if (step == 1 and o1 > o) or (step == -1 and o1 < o):
+            n_months += step
+        else:
+            break
+    sign = -1 if n_months < 0 else 1
+    return sign * (abs(n_months) // 12), sign * (abs(n_months) % 12), o1 - o
+
+
+def __format(delta, consider_months, consider_days):
+    d_years, d_months, d_days = delta
+    result = ""
+    if (
+        d_years < 0
+        or (d_years == 0 and d_months < 0 and consider_months)
+        or (d_years == 0 and d_months == 0 and d_days < 0 and consider_days)
+    ):
+        result += "-"
+    result += "P%sY" % abs(d_years)
+
+    if consider_months:
+        result += "%sM" % abs(d_months)
+
+    if consider_days:
+        result += "%sD" % abs(d_days)
+
+    return result
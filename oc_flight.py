@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Coalescing of identical calls in progress at the same time (single-flight):
+# the first call of a key is executed, while the calls of the same key arriving
+# before it ends wait for it and get its result (or its exception), instead of
+# doing the same work again. This is used for the operations called many times
+# at once (e.g. /citations of a trending DOI), through exec_shared and
+# exec_shared_async, and for the queries to Meta of the index addons (see
+# indexapi_core.META_FLIGHT). The number of calls coalesced is in stats(), and
+# in the oc_single_flight_calls_total counter of oc_metrics.
+#
+# Usage (e.g. in a Flask view):
+#
+#     status, res, c_type = oc_flight.exec_shared(api_manager, request.full_path, "get", "text/csv")
+#
+# or, measuring the stages of the call:
+#
+#     status, res, c_type, headers = oc_metrics.exec_timed(
+#         api_manager, request.full_path, "get", "text/csv", oc_flight.exec_op_shared)
+
+from asyncio import ensure_future, get_running_loop, shield
+from re import match, sub
+from threading import Event, Lock
+from urllib.parse import parse_qsl
+
+from ramose import Operation
+
+from oc_async import exec_async
+from oc_metrics import SINGLE_FLIGHT_CALLS, count
+from oc_stream import operation_params
+
+
+class SingleFlight(object):
+
+    def __init__(self, name="default"):
+        self.name = name
+        self.__lock = Lock()
+        self.__calls = {}
+        self.__futures = {}
+        self.__stats = {"calls": 0, "executed": 0, "coalesced": 0}
+
+    def __join(self, calls, key, new_call):
+        # return the call in progress for key, if any, or new_call() as the new one
+        with self.__lock:
+            self.__stats["calls"] += 1
+            call = calls.get(key)
+            first = call is None
+            if first:
+                self.__stats["executed"] += 1
+                call = calls[key] = new_call()
+            else:
+                self.__stats["coalesced"] += 1
+        count(SINGLE_FLIGHT_CALLS, (self.name, "executed" if first else "coalesced"))
+        return call, first
+
+    def __leave(self, calls, key):
+        with self.__lock:
+            del calls[key]
+
+    def do(self, key, func, *args):
+        """Return func(*args), or the result of the call of key in progress."""
+        call, first = self.__join(self.__calls, key, _Call)
+        if not first:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self.__leave(self.__calls, key)
+            call.done.set()
+
+    async def do_async(self, key, func, *args):
+        """Return await func(*args), or the result of the call of key in progress
+        in the same event loop. The call runs in a task of its own, so that it is
+        not cancelled together with the caller that started it."""
+        loop = get_running_loop()
+        task, first = self.__join(self.__futures, (loop, key), lambda: ensure_future(func(*args)))
+        if first:
+            task.add_done_callback(lambda t: self.__done(loop, key, t))
+        return await shield(task)
+
+    def __done(self, loop, key, task):
+        self.__leave(self.__futures, (loop, key))
+        if not task.cancelled():
+            # the exception is retrieved, in case no call waits for it anymore
+            task.exception()
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.__stats)
+
+    def reset_stats(self):
+        with self.__lock:
+            for k in self.__stats:
+                self.__stats[k] = 0
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+OPERATIONS = SingleFlight("operations")
+
+
+def operation_key(op, method, content_type):
+    """Return the key identifying the calls of the operation op giving the same
+    result: the operation, its parameters (lowercased if the operation does it
+    before anything else, e.g. with lower(id)), and the parameters of the query
+    string, in any order."""
+    par_dict = operation_params(op)
+    lowered = set()
+    if "preprocess" in op.i:
+        for pre in (sub(r"\s+", "", i) for i in op.i["preprocess"].split(" --> ")):
+            func = match(r"^lower\(([^\(\)]+)\)$", pre)
+            if func is None:
+                break
+            lowered.update(func.group(1).split(","))
+    params = tuple(
+        (par, value.lower() if par in lowered and isinstance(value, str) else value)
+        for par, value in sorted(par_dict.items()))
+    return method.lower(), content_type, op.op, params, tuple(sorted(parse_qsl(op.url_parsed.query)))
+
+
+def exec_shared(api_manager, op_complete_url, method="get", content_type="application/json"):
+    """Execute the operation specified by op_complete_url as Operation.exec does,
+    sharing the result with the identical calls in progress."""
+    op = api_manager.get_op(op_complete_url)
+    if not isinstance(op, Operation):
+        return op
+    return exec_op_shared(op, method, content_type)
+
+
+def exec_op_shared(op, method="get", content_type="application/json"):
+    """Execute the operation op (as returned by APIManager.get_op) as exec_shared does."""
+    try:
+        key = operation_key(op, method, content_type)
+    except Exception:  # the error is returned by exec
+        return op.exec(method, content_type)
+    return OPERATIONS.do(key, op.exec, method, content_type)
+
+
+async def exec_shared_async(api_manager, op_complete_url, method="get", content_type="application/json"):
+    """Execute the operation as oc_async.exec_async does, sharing the result with
+    the identical calls in progress in the same event loop."""
+    op = api_manager.get_op(op_complete_url)
+    if not isinstance(op, Operation):
+        return op
+    try:
+        key = operation_key(op, method, content_type)
+    except Exception:
+        return await exec_async(api_manager, op_complete_url, method, content_type)
+    return await OPERATIONS.do_async(key, exec_async, api_manager, op_complete_url, method, content_type)
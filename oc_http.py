@@ -0,0 +1,319 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Shared HTTP client used by the addons for all their outbound calls (e.g. the
+# SPARQL endpoint and the REST API of OpenCitations Meta). A single keep-alive
+# session is kept per process, so that consecutive calls to the same host reuse
+# the TCP/TLS connections already opened instead of doing a new handshake each time.
+#
+# The pool can be tuned through the following environment variables:
+#
+# * OC_HTTP_POOL_CONNECTIONS: number of per-host pools kept in memory (default 10);
+# * OC_HTTP_POOL_MAXSIZE: max number of connections kept alive for each host (default 20);
+# * OC_HTTP_POOL_BLOCK: if "true", never open more than OC_HTTP_POOL_MAXSIZE connections
+#   to the same host, waiting for a free one instead (default "false");
+# * OC_HTTP_KEEP_ALIVE: if "false", connections are closed after each request (default "true").
+#
+# With stream=True, get and post return as soon as the headers are received,
+# and the body is read in chunks with iter_content(response), which closes the
+# response at the end (see oc_sparql.read_rows).
+#
+# The coroutines aget and apost are the asynchronous versions of get and post,
+# for the addons running in an event loop (see oc_async.py). If aiohttp is
+# installed (e.g. with the "async" extra of the project), each event loop has
+# its own session, keeping at most OC_HTTP_ASYNC_LIMIT connections open at the
+# same time (default 200), so that hundreds of calls can be in flight at once.
+# Otherwise, get and post are run in the default thread pool of the event loop.
+#
+# The session of an event loop is closed when the loop shuts down its
+# asynchronous generators (e.g. at the end of asyncio.run), or before with
+# aclose(), and the shared session of the process at exit (or with close()).
+
+from asyncio import get_running_loop, to_thread
+from atexit import register
+from os import environ, getpid
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+from requests import Session
+
+from oc_metrics import outbound
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import aiohttp
+except ImportError:  # the async calls use the threads of the event loop
+    aiohttp = None
+
+
+def _env_bool(name, default):
+    return environ.get(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+POOL_CONNECTIONS = int(environ.get("OC_HTTP_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(environ.get("OC_HTTP_POOL_MAXSIZE", "20"))
+POOL_BLOCK = _env_bool("OC_HTTP_POOL_BLOCK", "false")
+KEEP_ALIVE = _env_bool("OC_HTTP_KEEP_ALIVE", "true")
+ASYNC_LIMIT = int(environ.get("OC_HTTP_ASYNC_LIMIT", "200"))
+CHUNK_SIZE = 65536
+
+_lock = Lock()
+_session = None
+_session_pid = None
+_stats = {"requests": 0, "opened": 0}
+_async_sessions = WeakKeyDictionary()
+# the URLs of the streamed responses, whose bytes are recorded when read
+_streams = WeakKeyDictionary()
+
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        _count("opened")
+        return super().connect()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        _count("opened")
+        return super().connect()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+    def _get_conn(self, timeout=None):
+        _count("requests")
+        return super()._get_conn(timeout=timeout)
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+    def _get_conn(self, timeout=None):
+        _count("requests")
+        return super()._get_conn(timeout=timeout)
+
+
+class _PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool
+        }
+
+
+def _new_session():
+    s = Session()
+    adapter = _PooledAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=POOL_BLOCK
+    )
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive" if KEEP_ALIVE else "close"
+    })
+    return s
+
+
+@register
+def close():
+    """Close the shared session of the current process, if any."""
+    global _session
+    with _lock:
+        old_session, _session = _session, None
+    if old_session is not None:
+        old_session.close()
+
+
+def session():
+    """Return the shared session of the current process. A new one is created after
+    a fork, since connections can't be shared among the workers of a server."""
+    global _session, _session_pid
+    pid = getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = _new_session()
+                _session_pid = pid
+    return _session
+
+
+def configure(pool_connections=None, pool_maxsize=None, pool_block=None, keep_alive=None):
+    """Change the pool settings, replacing the current shared session."""
+    global POOL_CONNECTIONS, POOL_MAXSIZE, POOL_BLOCK, KEEP_ALIVE, _session
+    with _lock:
+        if pool_connections is not None:
+            POOL_CONNECTIONS = pool_connections
+        if pool_maxsize is not None:
+            POOL_MAXSIZE = pool_maxsize
+        if pool_block is not None:
+            POOL_BLOCK = pool_block
+        if keep_alive is not None:
+            KEEP_ALIVE = keep_alive
+        old_session, _session = _session, None
+    if old_session is not None:
+        old_session.close()
+
+
+def stats():
+    """Return the number of requests sent, of connections opened, and of the
+    connections that have been reused instead of being opened again."""
+    with _lock:
+        return {
+            "requests": _stats["requests"],
+            "opened": _stats["opened"],
+            "reused": _stats["requests"] - _stats["opened"]
+        }
+
+
+def reset_stats():
+    with _lock:
+        for k in _stats:
+            _stats[k] = 0
+
+
+def get(url, **kwargs):
+    return _sent(url, session().get(url, **kwargs), kwargs.get("stream", False))
+
+
+def post(url, **kwargs):
+    return _sent(url, session().post(url, **kwargs), kwargs.get("stream", False))
+
+
+def _sent(url, response, stream):
+    if stream:
+        _streams[response] = url
+    else:
+        outbound(url, len(response.content))
+    return response
+
+
+def iter_content(response, chunk_size=None):
+    """Yield the body of response (as returned by get, post, aget or apost) in
+    chunks of at most chunk_size bytes (by default, CHUNK_SIZE), reading it from
+    the connection if the request was sent with stream=True. The response is
+    closed at the end."""
+    url = _streams.pop(response, None)
+    n_bytes = 0
+    try:
+        for chunk in response.iter_content(chunk_size or CHUNK_SIZE):
+            n_bytes += len(chunk)
+            yield chunk
+    finally:
+        response.close()
+        if url is not None:
+            outbound(url, n_bytes)
+
+
+def release(response):
+    """Read what is left of the body of response and close it, so that its
+    connection can be reused."""
+    for _ in iter_content(response):
+        pass
+
+
+class AsyncResponse(object):
+    """The response of an asynchronous call, with the same attributes of the
+    responses of requests used by the addons. The text is decoded according to
+    encoding (by default, the charset of the response or UTF-8)."""
+
+    def __init__(self, status_code, reason, headers, content, encoding=None):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def iter_content(self, chunk_size=1):
+        for idx in range(0, len(self.content), chunk_size):
+            yield self.content[idx:idx + chunk_size]
+
+    def close(self):
+        pass
+
+
+async def _async_session():
+    loop = get_running_loop()
+    item = _async_sessions.get(loop)
+    if item is None or item[0].closed:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(_connection_created)
+        s = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ASYNC_LIMIT, force_close=not KEEP_ALIVE),
+            headers={"Accept-Encoding": "gzip, deflate"}, trace_configs=[trace_config])
+        # the generator is kept with the session, which it closes when the loop
+        # shuts down the asynchronous generators
+        closing = _closing(s)
+        await closing.__anext__()
+        item = _async_sessions[loop] = (s, closing)
+    return item[0]
+
+
+async def _connection_created(session, context, params):
+    _count("opened")
+
+
+async def _closing(s):
+    try:
+        yield
+    finally:
+        await s.close()
+
+
+async def _arequest(method, url, headers=None, data=None, timeout=None):
+    if aiohttp is None:
+        r = await to_thread(session().request, method, url, headers=headers, data=data, timeout=timeout)
+        response = AsyncResponse(r.status_code, r.reason, r.headers, r.content, r.encoding)
+    else:
+        _count("requests")
+        s = await _async_session()
+        async with s.request(
+                method, url, headers=headers, data=data,
+                timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            response = AsyncResponse(r.status, r.reason, r.headers, await r.read(), r.charset)
+    outbound(url, len(response.content))
+    return response
+
+
+async def aget(url, headers=None, timeout=None):
+    return await _arequest("GET", url, headers=headers, timeout=timeout)
+
+
+async def apost(url, headers=None, data=None, timeout=None):
+    return await _arequest("POST", url, headers=headers, data=data, timeout=timeout)
+
+
+async def aclose():
+    """Close the asynchronous session of the current event loop, if any."""
+    item = _async_sessions.pop(get_running_loop(), None)
+    if item is not None:
+        await item[1].aclose()
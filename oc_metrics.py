@@ -0,0 +1,381 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Latency of the stages of the operations executed by exec_timed, i.e. the
+# preprocessing (e.g. id2omids), the SPARQL query of the operation, the
+# postprocessing (e.g. citations_info) and the serialisation of the result
+# ("output"), together with the time spent waiting for OpenCitations Meta
+# ("meta", part of the preprocessing and postprocessing), the requests sent and
+# the bytes received by the addons (through oc_http), and the number of rows
+# returned by the query and by the postprocessing. The calls executed or
+# coalesced with an identical one in progress (see oc_flight), and the ones
+# answered from the cache of the responses or not (see oc_responses), are
+# counted as well.
+#
+# If OC_METRICS is "true", they are added to the histograms and counters
+# returned by expose(), in the text format of Prometheus. If OC_SERVER_TIMING is
+# "true", the stages of each call are returned in its Server-Timing header too.
+# Otherwise, exec_timed runs the operation as usual, and the stages marked in
+# the addons (with stage("meta")) cost a context variable lookup each.
+#
+# Usage (e.g. in a Flask view):
+#
+#     status, res, c_type, headers = oc_metrics.exec_timed(api_manager, request.full_path, "get", "text/csv")
+#
+# or, sharing the result with the identical calls in progress and taking it
+# from the cache of the responses:
+#
+#     status, res, c_type, headers = oc_metrics.exec_timed(
+#         api_manager, request.full_path, "get", "text/csv",
+#         partial(oc_responses.exec_op_cached, if_none_match=request.headers.get("If-None-Match")))
+#
+# and in the view of /metrics:
+#
+#     return Response(oc_metrics.expose(), content_type=oc_metrics.CONTENT_TYPE)
+
+from contextlib import nullcontext
+from contextvars import ContextVar
+from os import environ
+from threading import Lock
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from ramose import Operation
+
+
+def _env_bool(name, default):
+    return environ.get(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+ENABLED = _env_bool("OC_METRICS", "false")
+SERVER_TIMING = _env_bool("OC_SERVER_TIMING", "false")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class Histogram(object):
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.__lock = Lock()
+        self.__series = {}
+
+    def observe(self, labels, value):
+        with self.__lock:
+            series = self.__series.get(labels)
+            if series is None:
+                series = self.__series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self, labels):
+        """Return the cumulative counts of the buckets, the sum and the count of
+        the values observed with labels."""
+        with self.__lock:
+            series = self.__series.get(labels, [[0] * len(self.buckets), 0.0, 0])
+            return list(series[0]), series[1], series[2]
+
+    def expose(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        with self.__lock:
+            for labels, (buckets, total, count) in sorted(self.__series.items()):
+                l_str = _labels(self.labels, labels)
+                for bound, n in zip(self.buckets, buckets):
+                    lines.append('%s_bucket{%sle="%s"} %s' % (self.name, l_str + "," if l_str else "", bound, n))
+                lines.append('%s_bucket{%sle="+Inf"} %s' % (self.name, l_str + "," if l_str else "", count))
+                lines.append("%s_sum{%s} %s" % (self.name, l_str, total))
+                lines.append("%s_count{%s} %s" % (self.name, l_str, count))
+        return lines
+
+    def reset(self):
+        with self.__lock:
+            self.__series.clear()
+
+
+class Counter(object):
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.__lock = Lock()
+        self.__series = {}
+
+    def inc(self, labels, value=1):
+        with self.__lock:
+            self.__series[labels] = self.__series.get(labels, 0) + value
+
+    def value(self, labels):
+        with self.__lock:
+            return self.__series.get(labels, 0)
+
+    def expose(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s counter" % self.name]
+        with self.__lock:
+            for labels, value in sorted(self.__series.items()):
+                lines.append("%s{%s} %s" % (self.name, _labels(self.labels, labels), value))
+        return lines
+
+    def reset(self):
+        with self.__lock:
+            self.__series.clear()
+
+
+def _labels(names, values):
+    return ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                    for name, value in zip(names, values))
+
+
+OPERATION_SECONDS = Histogram(
+    "oc_operation_duration_seconds", "Wall time of the operations.", ("operation", "status"), SECONDS_BUCKETS)
+STAGE_SECONDS = Histogram(
+    "oc_stage_duration_seconds", "Wall time of the stages of the operations.", ("operation", "stage"), SECONDS_BUCKETS)
+ROWS = Histogram(
+    "oc_operation_rows", "Rows returned by the query and by the postprocessing of the operations.",
+    ("operation", "stage"), ROWS_BUCKETS)
+OUTBOUND_REQUESTS = Counter(
+    "oc_outbound_requests_total", "Requests sent by the addons during the operations.", ("operation", "host"))
+OUTBOUND_BYTES = Counter(
+    "oc_outbound_received_bytes_total", "Bytes received by the addons during the operations.", ("operation", "host"))
+SINGLE_FLIGHT_CALLS = Counter(
+    "oc_single_flight_calls_total", "Calls executed, or coalesced with an identical call in progress.",
+    ("flight", "result"))
+RESPONSE_CACHE_CALLS = Counter(
+    "oc_response_cache_calls_total", "Calls of the cached operations answered from the cache of the responses or not.",
+    ("operation", "result"))
+
+METRICS = (OPERATION_SECONDS, STAGE_SECONDS, ROWS, OUTBOUND_REQUESTS, OUTBOUND_BYTES, SINGLE_FLIGHT_CALLS,
+           RESPONSE_CACHE_CALLS)
+
+
+def expose():
+    """Return all the metrics in the text format of Prometheus."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for metric in METRICS:
+        metric.reset()
+
+
+def count(counter, labels, value=1):
+    """Add value to the series of counter with labels, if OC_METRICS is enabled."""
+    if ENABLED:
+        counter.inc(labels, value)
+
+
+class _Timings(object):
+    # the stages and outbound requests of the call in progress, shared by the
+    # threads and tasks working for it
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.lock = Lock()
+        self.seconds = {}
+        self.rows = {}
+        self.requests = {}
+        self.active = {}
+
+    def enter(self, name):
+        with self.lock:
+            depth, start = self.active.get(name, (0, None))
+            # the stages running at the same time (e.g. in other threads) are
+            # measured together, from the first start to the last end
+            self.active[name] = (depth + 1, perf_counter() if depth == 0 else start)
+
+    def exit(self, name):
+        with self.lock:
+            depth, start = self.active[name]
+            if depth == 1:
+                del self.active[name]
+                self.add(name, perf_counter() - start)
+            else:
+                self.active[name] = (depth - 1, start)
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+
+class _Stage(object):
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.timings.enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.exit(self.name)
+        return False
+
+
+_current = ContextVar("oc_metrics_timings", default=None)
+_NO_STAGE = nullcontext()
+
+
+def stage(name):
+    """Return the context manager measuring the stage name of the call in progress."""
+    timings = _current.get()
+    if timings is None:
+        return _NO_STAGE
+    return _Stage(timings, name)
+
+
+def bind(func):
+    """Return func, measured as part of the call in progress even when run in
+    another thread (e.g. by a ThreadPoolExecutor)."""
+    timings = _current.get()
+    if timings is None:
+        return func
+
+    def bound(*args, **kwargs):
+        token = _current.set(timings)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return bound
+
+
+def outbound(url, n_bytes, requests=1):
+    """Record the requests to url and the bytes of their responses, if sent
+    during a call in progress."""
+    timings = _current.get()
+    if timings is None:
+        return
+    host = urlsplit(url).netloc
+    with timings.lock:
+        n_requests, n_received = timings.requests.get(host, (0, 0))
+        timings.requests[host] = (n_requests + requests, n_received + n_bytes)
+
+
+def exec_timed(api_manager, op_complete_url, method="get", content_type="application/json", execute=None):
+    """Execute the operation specified by op_complete_url as Operation.exec does,
+    measuring its stages. The operation is run by execute(op, method, content_type)
+    if specified (e.g. oc_flight.exec_op_shared or oc_responses.exec_op_cached),
+    otherwise by op.exec. The result is a tuple (status code, result, content
+    type, headers), where headers contains the ones returned by execute and the
+    Server-Timing of the call, if OC_SERVER_TIMING is enabled."""
+    op = api_manager.get_op(op_complete_url)
+    if not isinstance(op, Operation):
+        return op + ({},)
+    if execute is None:
+        execute = _exec
+    if not ENABLED and not SERVER_TIMING:
+        return _with_headers(execute(op, method, content_type))
+
+    timings = _Timings(op.i["url"])
+    spans = {}
+
+    def timed(name, func):
+        def run(*args):
+            spans[name] = [perf_counter(), None]
+            try:
+                return func(*args)
+            finally:
+                spans[name][1] = perf_counter()
+        return run
+
+    def type_fields(res, op_item):
+        # the results of the postprocessing can be typed again
+        if "type_fields" in spans:
+            return type_fields_func(res, op_item)
+        timings.rows["query"] = len(res) - 1
+        return timed("type_fields", type_fields_func)(res, op_item)
+
+    def postprocess(res, op_item, addon):
+        res = postprocess_func(res, op_item, addon)
+        timings.rows["postprocess"] = len(res) - 1
+        return res
+
+    type_fields_func, postprocess_func = op.type_fields, op.postprocess
+    op.preprocess = timed("preprocess", op.preprocess)
+    op.type_fields = type_fields
+    op.postprocess = timed("postprocess", postprocess)
+
+    token = _current.set(timings)
+    start = perf_counter()
+    try:
+        sc, res, c_type, headers = _with_headers(execute(op, method, content_type))
+    finally:
+        end = perf_counter()
+        _current.reset(token)
+
+    # the query goes from the end of the preprocessing to the typing of its
+    # results, and the output from the end of the postprocessing
+    last = spans.get("preprocess", [start, start])[1]
+    if "type_fields" in spans:
+        timings.add("sparql", spans["type_fields"][0] - last)
+        last = spans["type_fields"][1]
+    for name in ("preprocess", "postprocess"):
+        if name in spans and spans[name][1] is not None:
+            timings.add(name, spans[name][1] - spans[name][0])
+            last = max(last, spans[name][1])
+    if "type_fields" in spans:
+        timings.add("output", end - last)
+
+    if ENABLED:
+        __observe(timings, sc, end - start)
+    if SERVER_TIMING:
+        headers["Server-Timing"] = server_timing(timings.seconds, end - start)
+    return sc, res, c_type, headers
+
+
+def _exec(op, method, content_type):
+    return op.exec(method, content_type)
+
+
+def _with_headers(result):
+    # the results of exec, with the headers of the wrappers returning them
+    if len(result) == 3:
+        return tuple(result) + ({},)
+    return tuple(result[:3]) + (dict(result[3]),)
+
+
+def __observe(timings, sc, total):
+    operation = timings.operation
+    OPERATION_SECONDS.observe((operation, str(sc)), total)
+    for name, seconds in timings.seconds.items():
+        STAGE_SECONDS.observe((operation, name), seconds)
+    for name, n in timings.rows.items():
+        ROWS.observe((operation, name), n)
+    for host, (requests, n_bytes) in timings.requests.items():
+        OUTBOUND_REQUESTS.inc((operation, host), requests)
+        OUTBOUND_BYTES.inc((operation, host), n_bytes)
+
+
+STAGES = ("preprocess", "meta", "sparql", "postprocess", "output")
+
+
+def server_timing(seconds, total):
+    """Return the Server-Timing header with the stages measured, in milliseconds."""
+    names = [name for name in STAGES if name in seconds] + sorted(set(seconds).difference(STAGES))
+    return ", ".join(["%s;dur=%.1f" % (name, seconds[name] * 1e3) for name in names] + ["total;dur=%.1f" % (total * 1e3)])
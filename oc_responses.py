@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Cache of the whole responses of the index operations (by default /citation,
+# /citations and /references, see OC_RESPONSE_CACHE_OPERATIONS), which change
+# only with a new release of the dataset. The release in use is specified by
+# OC_INDEX_RELEASE (e.g. "2026-09"): without it, the responses are not cached.
+#
+# The responses are keyed by the release and by the call of the operation, as
+# in oc_flight.operation_key (i.e. with the identifier normalised, e.g. the DOI
+# lowercased, and the parameters of the query string in any order), and stored
+# in the backend specified by OC_RESPONSE_CACHE (see oc_cache.cache_from_url).
+# The strong ETag of a response, returned together with its Cache-Control, is
+# the hash of the release, of the key and of the response itself, since the
+# metadata added by the addons (from OpenCitations Meta) can change within the
+# same release: a request with a matching If-None-Match gets a 304 without
+# running any query if the response is in the cache (e.g. of any worker, with a
+# shared backend). Setting a new OC_INDEX_RELEASE changes all the ETags and keys,
+# so the responses of the previous release are never returned again.
+#
+# The responses marked as incomplete by the addons with incomplete() (e.g. since
+# an identifier could not be resolved, OpenCitations Meta being unreachable) are
+# returned without caching them, and without ETag and Cache-Control.
+#
+# Usage (e.g. in a Flask view):
+#
+#     status, res, c_type, headers = oc_responses.exec_cached(
+#         api_manager, request.full_path, "get", "text/csv", request.headers.get("If-None-Match"))
+#
+# The calls answered from the cache or not are counted in the
+# oc_response_cache_calls_total counter of oc_metrics, and exec_op_cached can be
+# passed to oc_metrics.exec_timed to measure the stages of the calls.
+
+from contextvars import ContextVar
+from hashlib import sha256
+from os import environ
+from re import search
+
+from ramose import Operation
+
+from oc_cache import cache_from_url
+from oc_flight import SingleFlight, operation_key
+from oc_metrics import RESPONSE_CACHE_CALLS, count
+
+RELEASE = environ.get("OC_INDEX_RELEASE", "")
+
+CACHED_OPERATIONS = environ.get("OC_RESPONSE_CACHE_OPERATIONS", r"^/(citation|citations|references)/")
+MAX_AGE = int(environ.get("OC_RESPONSE_MAX_AGE", "86400"))
+
+RESPONSE_CACHE = cache_from_url(
+    environ.get("OC_RESPONSE_CACHE", "memory"),
+    maxsize = int(environ.get("OC_RESPONSE_CACHE_SIZE", "10000")),
+    ttl = float(environ.get("OC_RESPONSE_CACHE_TTL", "604800")),
+)
+
+# the identical calls in progress missing from the cache are run once, apart
+# from the ones of oc_flight.exec_shared, whose results are not the same
+RESPONSES = SingleFlight("responses")
+
+
+def is_cached(op, method="get"):
+    """Return True if the responses of the operation op are cached."""
+    return bool(RELEASE) and method.lower() == "get" and "get" in op.i["method"].split() and \
+        search(CACHED_OPERATIONS, op.i["url"]) is not None
+
+
+_incomplete = ContextVar("oc_responses_incomplete", default=None)
+
+
+def incomplete():
+    """Mark the response of the call in progress as incomplete, so that it is
+    not cached."""
+    flags = _incomplete.get()
+    if flags is not None:
+        flags.append(True)
+
+
+def response_key(key):
+    """Return the key of the cache of the response to the call identified by key
+    in the current release."""
+    return sha256(repr((RELEASE, key)).encode("utf-8")).hexdigest()
+
+
+def response_etag(key, response):
+    """Return the strong ETag of response, i.e. the tuple (status code, result,
+    content type) of the call identified by key in the current release."""
+    return '"%s"' % sha256(repr((RELEASE, key, tuple(response))).encode("utf-8")).hexdigest()[:32]
+
+
+def etag_matches(etag, if_none_match):
+    """Return True if the ETag etag is in the If-None-Match header specified (with
+    the weak comparison required for it)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def exec_cached(api_manager, op_complete_url, method="get", content_type="application/json", if_none_match=None):
+    """Execute the operation specified by op_complete_url as Operation.exec does,
+    returning its response from the cache if available. The result is a tuple
+    (status code, result, content type, headers), where headers contains the ETag
+    and Cache-Control of the cached operations. If if_none_match (the value of the
+    If-None-Match header) matches the ETag, the status code is 304 and the result
+    is empty."""
+    op = api_manager.get_op(op_complete_url)
+    if not isinstance(op, Operation):
+        return op + ({},)
+    return exec_op_cached(op, method, content_type, if_none_match)
+
+
+def exec_op_cached(op, method="get", content_type="application/json", if_none_match=None):
+    """Execute the operation op (as returned by APIManager.get_op) as exec_cached does."""
+    if not is_cached(op, method):
+        return op.exec(method, content_type) + ({},)
+    try:
+        key = operation_key(op, method, content_type)
+    except Exception:  # the error is returned by exec
+        return op.exec(method, content_type) + ({},)
+
+    cache_key = response_key(key)
+    if RESPONSE_CACHE is not None:
+        cached = RESPONSE_CACHE.get_many([cache_key])
+        if cache_key in cached:
+            count(RESPONSE_CACHE_CALLS, (op.i["url"], "hit"))
+            sc, res, c_type, etag = cached[cache_key]
+            return __response(sc, res, c_type, etag, if_none_match)
+    count(RESPONSE_CACHE_CALLS, (op.i["url"], "miss"))
+
+    sc, res, c_type, complete = RESPONSES.do(key, __exec, op, method, content_type)
+    if sc != 200 or not complete:
+        return sc, res, c_type, {}
+    etag = response_etag(key, (sc, res, c_type))
+    if RESPONSE_CACHE is not None:
+        RESPONSE_CACHE.set_many({cache_key: [sc, res, c_type, etag]})
+    return __response(sc, res, c_type, etag, if_none_match)
+
+
+def __exec(op, method, content_type):
+    # the result of exec, and whether it is complete
+    flags = []
+    token = _incomplete.set(flags)
+    try:
+        return op.exec(method, content_type) + (not flags,)
+    finally:
+        _incomplete.reset(token)
+
+
+def __response(sc, res, c_type, etag, if_none_match):
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=%s" % MAX_AGE}
+    if etag_matches(etag, if_none_match):
+        return 304, "", c_type, headers
+    return sc, res, c_type, headers
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Reading of the results of the SPARQL SELECT queries sent by the addons to
+# OpenCitations Meta. The results are requested in the format specified by
+# OC_SPARQL_RESULTS_FORMAT, i.e. "csv" (default), "tsv" or "json", and are read
+# according to the format actually returned by the endpoint. The responses are
+# requested with stream=True, and decoded one row at a time while their body is
+# read in chunks (see oc_http.iter_content), so that neither the whole body nor
+# the whole text of the results are ever in memory. Each row is a dict mapping
+# the variables to their values (as strings), instead of the nested bindings of
+# the JSON format: the unbound variables are missing from the rows of the JSON
+# and TSV results, and are empty strings in the CSV ones.
+
+from codecs import getincrementaldecoder
+from csv import reader
+from io import BufferedReader, RawIOBase, TextIOWrapper
+from json import JSONDecodeError, JSONDecoder, loads
+from os import environ
+from re import compile
+
+from oc_http import iter_content
+
+CSV = "text/csv"
+TSV = "text/tab-separated-values"
+JSON = "application/sparql-results+json"
+FORMATS = {"csv": CSV, "tsv": TSV, "json": JSON}
+
+RESULTS_FORMAT = environ.get("OC_SPARQL_RESULTS_FORMAT", "csv").lower()
+
+BINDINGS = compile(r'"bindings"\s*:\s*\[')
+TSV_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+TSV_ESCAPE = compile(r"\\(.)")
+
+
+def sparql_headers(results_format=None):
+    """Return the headers of a POST request with a SPARQL query as body, asking
+    for the results in results_format (by default, OC_SPARQL_RESULTS_FORMAT)."""
+    return {"Accept": FORMATS[results_format or RESULTS_FORMAT], "Content-Type": "application/sparql-query"}
+
+
+def read_rows(response):
+    """Yield the rows of the SPARQL results in the response, one at a time,
+    while its body is read. The response is closed at the end."""
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    chunks = iter_content(response)
+    try:
+        if content_type == CSV:
+            yield from __csv_rows(chunks)
+        elif content_type == TSV:
+            yield from __tsv_rows(chunks)
+        else:
+            yield from __json_rows(chunks)
+    finally:
+        chunks.close()
+
+
+class _ChunksReader(RawIOBase):
+    # a binary file reading the chunks of bytes of an iterator
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chunk = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.chunk:
+            self.chunk = next(self.chunks, None)
+            if self.chunk is None:
+                self.chunk = b""
+                return 0
+        n = min(len(b), len(self.chunk))
+        b[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+
+def __lines(chunks):
+    return TextIOWrapper(BufferedReader(_ChunksReader(chunks)), encoding="utf-8", errors="replace", newline="")
+
+
+def __csv_rows(chunks):
+    lines = reader(__lines(chunks))
+    header = next(lines, None)
+    if header is None:
+        return
+    for row in lines:
+        yield dict(zip(header, row))
+
+
+def __tsv_rows(chunks):
+    lines = __lines(chunks)
+    header = [var.strip().lstrip("?$") for var in next(lines, "").rstrip("\r\n").split("\t")]
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line:
+            yield {var: __tsv_value(term) for var, term in zip(header, line.split("\t")) if term != ""}
+
+
+def __tsv_value(term):
+    if term.startswith("<") and term.endswith(">"):
+        return term[1:-1]
+    if term.startswith('"') or term.startswith("'"):
+        # a literal, possibly followed by its language or datatype
+        end = term.rindex(term[0])
+        if end > 0:
+            term = term[1:end]
+        return TSV_ESCAPE.sub(lambda m: TSV_ESCAPES.get(m.group(1), m.group(0)), term)
+    return term
+
+
+def __json_rows(chunks):
+    # the text is decoded chunk by chunk, and each binding is parsed as soon as
+    # it is complete, keeping only the text following it
+    utf8 = getincrementaldecoder("utf-8")(errors="replace")
+    text = ""
+    bindings = None
+    for chunk in chunks:
+        text += utf8.decode(chunk)
+        bindings = BINDINGS.search(text)
+        if bindings is not None:
+            break
+    if bindings is None:
+        # the whole document was read without finding the bindings
+        for elem in loads(text + utf8.decode(b"", True))["results"]["bindings"]:
+            yield {var: value["value"] for var, value in elem.items()}
+        return
+
+    decoder = JSONDecoder()
+    text = text[bindings.end():]
+    idx = 0
+    while True:
+        while idx < len(text) and text[idx] in " \t\r\n,":
+            idx += 1
+        if idx < len(text) and text[idx] == "]":
+            return
+        try:
+            elem, idx = decoder.raw_decode(text, idx)
+        except JSONDecodeError:
+            # the binding continues in the next chunk
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise
+            text = text[idx:] + utf8.decode(chunk)
+            idx = 0
+            continue
+        yield {var: value["value"] for var, value in elem.items()}
@@ -0,0 +1,477 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026, OpenCitations <contact@opencitations.net>
+#
+# Permission to use, copy, modify, and/or distribute this software for any purpose
+# with or without fee is hereby granted, provided that the above copyright notice
+# and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+# DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
+# SOFTWARE.
+
+__author__ = 'OpenCitations'
+
+# Streaming execution of the RAMOSE operations. Instead of retrieving all the
+# results of the SPARQL query at once, they are retrieved in pages of
+# OC_STREAM_PAGE_SIZE rows (sorted by the first variable of the query, e.g. ?oci),
+# and each page is postprocessed and serialised (as NDJSON or CSV) as soon as
+# it is available. The postprocessing is done by the streaming version of the
+# function specified in '#postprocess', i.e. the addon function having the same
+# name followed by "_stream" (e.g. citations_info_stream), which takes an
+# iterator of result tables (one per page) and yields the postprocessed tables.
+#
+# Usage (e.g. in a Flask view):
+#
+#     status, body, c_type = oc_stream.exec_stream(api_manager, request.full_path, "application/x-ndjson")
+#     return Response(body, status=status, content_type=c_type)
+#
+# The first page is postprocessed before returning the status code, so that an
+# error in it gives a 500 instead of a 200. An error in the following pages,
+# when the status code has already been sent, ends the body with an error
+# record, i.e. {"error": "HTTP status code 500: ..."} in NDJSON or a row with
+# the same message only in CSV, instead of truncating it silently.
+#
+# The same pagination is exposed to the clients by exec_page: when the
+# parameter 'limit' or 'cursor' is specified in the query string, only the
+# 'limit' results following the cursor are returned, together with a Link
+# header pointing to the next page (if any). The postprocessing is done by the
+# function specified in '#postprocess' followed by "_page" (e.g.
+# citations_info_page), which takes a page of results and a lookup function
+# for running the query of the operation on a subset of its results.
+#
+# Finally, exec_bulk executes an operation on many values of its parameter at
+# once (e.g. thousands of IDs sent in the body of a POST request to /metadata),
+# split in chunks of OC_BULK_CHUNK_SIZE values joined as in the URL (e.g. with
+# "__"). The chunks are run concurrently, and the results of each one are
+# postprocessed by the streaming version of the postprocess function (e.g.
+# create_metadata_output_stream) and serialised as soon as they are available.
+# The rows returned by more than one chunk (e.g. the same entity, through two
+# of its IDs) are returned once, keeping only the values of their key column
+# (e.g. "id"):
+#
+#     status, body, c_type = oc_stream.exec_bulk(
+#         api_manager, "/meta/api/v1/metadata/", request.get_data(as_text=True), request.content_type, key="id")
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from csv import reader, writer
+from io import StringIO
+from json import dumps, loads
+from os import environ
+from re import findall, match, search, sub, DOTALL, IGNORECASE
+from urllib.parse import parse_qs, parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+from ramose import Operation
+
+from oc_http import get, post
+
+PAGE_SIZE = int(environ.get("OC_STREAM_PAGE_SIZE", "5000"))
+
+# default and maximum number of results returned by exec_page
+PAGE_LIMIT = int(environ.get("OC_PAGE_LIMIT", "1000"))
+PAGE_MAX_LIMIT = int(environ.get("OC_PAGE_MAX_LIMIT", "10000"))
+
+# number of values of each chunk of exec_bulk, number of chunks run at the same
+# time, and maximum number of values of a request
+BULK_CHUNK_SIZE = int(environ.get("OC_BULK_CHUNK_SIZE", "100"))
+BULK_MAX_WORKERS = int(environ.get("OC_BULK_MAX_WORKERS", "4"))
+BULK_MAX_VALUES = int(environ.get("OC_BULK_MAX_VALUES", "100000"))
+
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+JSON = "application/json"
+
+
+def paged_query(query, page_size, after=None, order_var=None):
+    """Rewrite a SELECT query so as to return the page_size rows following the value
+    'after' according to the order of the variable order_var (by default, the first
+    one in the SELECT clause). Any LIMIT at the end of the query is removed."""
+    if order_var is None:
+        order_var = first_variable(query)
+    query = sub(r"\s+LIMIT\s+\d+\s*$", "", query.strip(), flags=IGNORECASE)
+    if after is not None:
+        query = __add_to_where(query, '    FILTER(STR(?%s) > %s)\n' % (order_var, __sparql_literal(after)))
+    return "%s\nORDER BY STR(?%s)\nLIMIT %s" % (query, order_var, page_size)
+
+
+def restricted_query(query, values, distinct=None, before=None, order_var=None):
+    """Rewrite a SELECT query so as to return only the rows where each variable in
+    the dictionary values has one of the values specified, and (if 'before' is
+    specified) where the variable order_var precedes 'before'. If distinct is
+    specified, only the distinct values of that variable are returned."""
+    if order_var is None:
+        order_var = first_variable(query)
+    query = sub(r"\s+LIMIT\s+\d+\s*$", "", query.strip(), flags=IGNORECASE)
+    if distinct is not None:
+        query = sub(r"SELECT\s.*?\sWHERE", "SELECT DISTINCT ?%s WHERE" % distinct, query, count=1,
+                    flags=IGNORECASE | DOTALL)
+    for var, var_values in values.items():
+        query = __add_to_where(query, "    VALUES ?%s {%s}\n" % (var, " ".join(__sparql_term(v) for v in var_values)))
+    if before is not None:
+        query = __add_to_where(query, '    FILTER(STR(?%s) < %s)\n' % (order_var, __sparql_literal(before)))
+    return query
+
+
+def __add_to_where(query, s):
+    close_idx = query.rindex("}")
+    return query[:close_idx] + s + query[close_idx:]
+
+
+def __sparql_term(value):
+    if match(r"^https?://[^\s<>\"{}|\\^`]+$", value):
+        return "<%s>" % value
+    return __sparql_literal(value)
+
+
+def __sparql_literal(value):
+    return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def first_variable(query):
+    return search(r"SELECT\s+(?:DISTINCT\s+)?\?(\w+)", query, IGNORECASE).group(1)
+
+
+def query_limit(query):
+    limit = search(r"\s+LIMIT\s+(\d+)\s*$", query.strip(), IGNORECASE)
+    return int(limit.group(1)) if limit else None
+
+
+def sparql_table(op, query):
+    """Run the query on the SPARQL endpoint of the operation, returning the
+    results as a table of strings."""
+    if op.sparql_http_method == "get":
+        r = get(op.tp + "?query=" + quote(query), headers={"Accept": "text/csv"})
+    else:
+        r = post(op.tp, data=query, headers={"Accept": "text/csv", "Content-Type": "application/sparql-query"})
+    r.encoding = "utf-8"
+    if r.status_code != 200:
+        raise ConnectionError("HTTP status code %s: %s" % (r.status_code, r.reason))
+    return list(reader(r.text.splitlines()))
+
+
+def sparql_pages(op, query, page_size=PAGE_SIZE, after=None):
+    """Run the query of the operation page by page, yielding each page as a
+    typed result table (i.e. as the one passed to the postprocess functions)."""
+    order_var = first_variable(query)
+    max_rows = query_limit(query)
+    n_rows = 0
+    while max_rows is None or n_rows < max_rows:
+        size = page_size if max_rows is None else min(page_size, max_rows - n_rows)
+        table = sparql_table(op, paged_query(query, size, after, order_var))
+        if len(table) <= 1:
+            break
+        yield op.type_fields(table, op.i)
+        n_rows += len(table) - 1
+        if len(table) - 1 < size:
+            break
+        after = table[-1][table[0].index(order_var)]
+
+
+def operation_params(op):
+    """Return the typed values of the parameters in the URL of the operation,
+    as Operation.exec does."""
+    par_dict = {}
+    par_man = match(op.op, op.op_url).groups()
+    for idx, par in enumerate(findall("{([^{}]+)}", op.i["url"])):
+        try:
+            par_type = op.i[par].split("(")[0]
+            if par_type == "str":
+                par_value = par_man[idx]
+            else:
+                par_value = op.dt.get_func(par_type)(par_man[idx])
+        except KeyError:
+            par_value = par_man[idx]
+        par_dict[par] = par_value
+    return par_dict
+
+
+def operation_query(op, join=False):
+    """Return the SPARQL queries of the operation, after the preprocessing of
+    its parameters: a parameter set to a list of values (e.g. by id2omids) gives
+    a query for each value, unless join is True, in which case the values are
+    joined with a space (e.g. in a single VALUES clause)."""
+    par_dict = operation_params(op)
+    if op.addon is not None:
+        op.preprocess(par_dict, op.i, op.addon)
+
+    queries = [op.i["sparql"]]
+    for param in par_dict:
+        values = par_dict[param] if isinstance(par_dict[param], list) else [par_dict[param]]
+        if join:
+            values = [" ".join(str(value) for value in values)]
+        queries = [q.replace("[[%s]]" % param, str(value)) for q in queries for value in values]
+    return queries
+
+
+def postprocess_function(op, suffix):
+    """Return the version of the postprocess function of the operation having the
+    name followed by suffix (e.g. "_stream") and its parameters, or None if the
+    operation does not have one."""
+    if op.addon is None or "postprocess" not in op.i:
+        return None
+    post_funcs = [i.strip() for i in op.i["postprocess"].split(" --> ")]
+    if len(post_funcs) != 1:
+        return None
+    func_name = sub(r"^([^\(\)]+)\(.+$", "\\1", post_funcs[0]).strip()
+    param_str = sub(r"^.+\(([^\(\)]*)\).*", "\\1", post_funcs[0])
+    params = () if param_str == "" else tuple(next(reader(param_str.splitlines(), skipinitialspace=True)))
+    func = getattr(op.addon, func_name + suffix, None)
+    if func is None:
+        return None
+    return func, params
+
+
+def serialise(tables, content_type):
+    """Serialise the tables (without types) as NDJSON or CSV, one row at a time.
+    The header is taken from the first table. An error in getting the tables is
+    serialised as the last record (see error_record)."""
+    header = None
+    try:
+        for table in tables:
+            if header is None:
+                header = list(table[0])
+                if content_type == CSV:
+                    yield __csv_line(header)
+            for row in table[1:]:
+                if content_type == CSV:
+                    yield __csv_line(row)
+                else:
+                    yield dumps(dict(zip(header, row)), ensure_ascii=False) + "\n"
+    except Exception as e:
+        yield error_record(e, content_type)
+
+
+def error_record(e, content_type):
+    """Return the record ending a body whose rows could not all be returned."""
+    message = __error_message(500, e)
+    if content_type == CSV:
+        return __csv_line([message])
+    return dumps({"error": message}, ensure_ascii=False) + "\n"
+
+
+def __error_message(sc, e):
+    return "HTTP status code %s: something unexpected happened - %s: %s" % (sc, type(e).__name__, e)
+
+
+def stream_response(tables, content_type):
+    """Return a tuple (status code, body, content type) for the tables (an
+    iterator), serialised as serialise does. The first table is taken before
+    returning, so that an error in it gives a status code 500."""
+    try:
+        first = next(tables, None)
+    except Exception as e:
+        sc = 500
+        return sc, __error_message(sc, e), "text/plain"
+    return 200, serialise(tables if first is None else __chain(first, tables), content_type), content_type
+
+
+def __chain(first, tables):
+    yield first
+    yield from tables
+
+
+def __csv_line(row):
+    s = StringIO()
+    writer(s).writerow(row)
+    return s.getvalue()
+
+
+def exec_stream(api_manager, op_complete_url, content_type=NDJSON, page_size=PAGE_SIZE):
+    """Execute the operation specified by op_complete_url as Operation.exec does,
+    returning a tuple (status code, body, content type) where body is an iterator
+    of strings. The 'require' and 'filter' parameters are applied page by page,
+    while 'sort' is ignored since it would need all the rows. Operations without
+    a streaming postprocess function are executed in the usual way."""
+    op = api_manager.get_op(op_complete_url)
+    if not isinstance(op, Operation):
+        return op
+    stream_func = postprocess_function(op, "_stream")
+    if stream_func is None or "get" not in op.i["method"].split():
+        sc, res, c_type = op.exec(content_type="text/csv" if content_type == CSV else "application/json")
+        return sc, iter([res]), c_type
+
+    func, params = stream_func
+    q_string = parse_qs(quote(op.url_parsed.query, safe="&="))
+    q_string.pop("sort", None)
+
+    def pages():
+        for query in operation_query(op):
+            for page in sparql_pages(op, query, page_size):
+                yield page
+
+    def tables():
+        for table in func(pages(), *params):
+            table = op.type_fields(table, op.i)
+            table = op.handling_params(q_string, table)
+            yield op.remove_types(table)
+
+    return stream_response(tables(), content_type)
+
+
+def encode_cursor(value):
+    return urlsafe_b64encode(value.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    return urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+
+
+def exec_page(api_manager, op_complete_url, content_type="application/json"):
+    """Execute the operation specified by op_complete_url as Operation.exec does,
+    returning only the page of results specified by the parameters 'limit' and
+    'cursor' of the query string. The result is a tuple (status code, result,
+    content type, headers), where headers contains the Link to the next page, if
+    any. The pages are keyed on the order of the first variable of the query (e.g.
+    ?oci), and the LIMIT of the query does not apply. The operations called
+    without these parameters, or without a paginated postprocess function, are
+    executed in the usual way."""
+    op = api_manager.get_op(op_complete_url)
+    if not isinstance(op, Operation):
+        return op + ({},)
+    q_string = parse_qs(quote(op.url_parsed.query, safe="&="))
+    page_func = postprocess_function(op, "_page")
+    if page_func is None or "get" not in op.i["method"].split() or \
+            ("limit" not in q_string and "cursor" not in q_string):
+        return op.exec(content_type=content_type) + ({},)
+
+    try:
+        limit = int(q_string["limit"][0]) if "limit" in q_string else PAGE_LIMIT
+        after = decode_cursor(q_string["cursor"][0]) if "cursor" in q_string else None
+        if not 0 < limit <= PAGE_MAX_LIMIT:
+            raise ValueError("limit must be between 1 and %s" % PAGE_MAX_LIMIT)
+    except (ValueError, Base64Error) as e:
+        sc = 400
+        return sc, "HTTP status code %s: wrong 'limit' or 'cursor' parameter - %s" % (sc, e), "text/plain", {}
+
+    func, params = page_func
+    try:
+        query = operation_query(op, join=True)[0]
+        order_var = first_variable(query)
+        table = sparql_table(op, paged_query(query, limit + 1, after, order_var))
+
+        next_cursor = None
+        if len(table) > limit + 1:
+            table = table[:limit + 1]
+            next_cursor = encode_cursor(table[-1][table[0].index(order_var)])
+
+        def lookup(values, distinct=None, before=None):
+            return op.type_fields(
+                sparql_table(op, restricted_query(query, values, distinct, before, order_var)), op.i)
+
+        res, do_type_fields = func(op.type_fields(table, op.i), *params, lookup=lookup)
+        if do_type_fields:
+            res = op.type_fields(res, op.i)
+        res = op.handling_params(q_string, res)
+        res = op.remove_types(res)
+    except Exception as e:
+        sc = 500
+        return sc, __error_message(sc, e), "text/plain", {}
+
+    s_res = StringIO()
+    writer(s_res).writerows(res)
+    headers = {}
+    if next_cursor is not None:
+        next_query = [(k, v) for k, v in parse_qsl(op.url_parsed.query) if k != "cursor"]
+        next_url = urlunsplit(op.url_parsed._replace(query=urlencode(next_query + [("cursor", next_cursor)])))
+        headers["Link"] = '<%s>; rel="next"' % next_url
+    return (200,) + Operation.conv(s_res.getvalue(), q_string, content_type) + (headers,)
+
+
+def bulk_values(body, body_type=NDJSON):
+    """Return the distinct values in the body of a bulk request, which is either a
+    JSON array of strings (or a JSON object with such an array as its only member,
+    e.g. {"ids": [...]}) if body_type is application/json, or a value per line,
+    optionally as a JSON string (e.g. NDJSON), otherwise."""
+    if body_type.split(";")[0].strip() == JSON:
+        values = loads(body)
+        if isinstance(values, dict) and len(values) == 1:
+            values = next(iter(values.values()))
+        if not isinstance(values, list):
+            raise ValueError("the body must be a JSON array")
+    else:
+        values = [loads(line) if line.startswith('"') else line
+                  for line in (line.strip() for line in body.splitlines()) if line]
+    if not all(isinstance(value, str) and value for value in values):
+        raise ValueError("the values must be non-empty strings")
+    return list(dict.fromkeys(values))
+
+
+def exec_bulk(api_manager, op_url, body, body_type=NDJSON, content_type=NDJSON, sep="__",
+              chunk_size=BULK_CHUNK_SIZE, key=None):
+    """Execute the operation specified by op_url, i.e. the URL of the operation
+    without the value of its last parameter (e.g. /meta/api/v1/metadata/), on all
+    the values in the body of a bulk request (see bulk_values), returning a tuple
+    (status code, body, content type) as exec_stream does. The values are split in
+    chunks of chunk_size values joined with sep, and the rows of each chunk are
+    returned as soon as the chunk is done, i.e. not in the order of the values.
+    The duplicated rows of a chunk are returned once and, if key is the name of
+    the column identifying the rows (e.g. "id"), so are the rows having the same
+    key in different chunks: only the keys returned are kept, not the rows."""
+    url_parsed = urlsplit(op_url)
+    try:
+        values = bulk_values(body, body_type)
+        if not 0 < len(values) <= BULK_MAX_VALUES:
+            raise ValueError("the number of values must be between 1 and %s" % BULK_MAX_VALUES)
+        for value in values:
+            if sep in value or "?" in value or "#" in value:
+                raise ValueError("wrong value '%s'" % value)
+    except ValueError as e:
+        sc = 400
+        return sc, "HTTP status code %s: wrong body of the request - %s" % (sc, e), "text/plain"
+
+    ops = []
+    for idx in range(0, len(values), chunk_size):
+        op = api_manager.get_op(urlunsplit(url_parsed._replace(
+            path=url_parsed.path + sep.join(values[idx:idx + chunk_size]))))
+        if not isinstance(op, Operation):
+            return op
+        ops.append(op)
+
+    first_op = ops[0]
+    q_string = parse_qs(quote(first_op.url_parsed.query, safe="&="))
+    q_string.pop("sort", None)
+    stream_func = postprocess_function(first_op, "_stream")
+
+    def chunk_table(op):
+        table = op.type_fields(sparql_table(op, operation_query(op, join=True)[0]), op.i)
+        if stream_func is None and op.addon is not None:
+            table = op.postprocess(table, op.i, op.addon)
+        return table
+
+    def pages():
+        executor = ThreadPoolExecutor(max_workers=max(1, min(BULK_MAX_WORKERS, len(ops))))
+        try:
+            for future in as_completed([executor.submit(chunk_table, op) for op in ops]):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def tables():
+        if stream_func is None:
+            results = pages()
+        else:
+            func, params = stream_func
+            results = (first_op.type_fields(table, first_op.i) for table in func(pages(), *params))
+        returned = set()
+        for table in results:
+            table = first_op.handling_params(q_string, table)
+            table = first_op.remove_types(table)
+            key_idx = table[0].index(key) if key in table[0] else None
+            rows = [table[0]]
+            in_chunk = set()
+            for row in table[1:]:
+                row_key = tuple(row) if key_idx is None else row[key_idx]
+                if row_key not in in_chunk and row_key not in returned:
+                    in_chunk.add(row_key)
+                    rows.append(row)
+            if key_idx is not None:
+                returned.update(in_chunk)
+            yield rows
+
+    return stream_response(tables(), content_type)
@@ -0,0 +1,48 @@
+# The fixtures shared by the tests of the index addons: the fake SPARQL endpoint
+# of the index, the fake Meta (see fake_meta.py), and the RAMOSE API manager of
+# index_v2.hf querying both.
+
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import indexapi_core
+import indexapi_v1
+from fake_meta import FakeMeta
+from fakes import BR, META, FakeIndexHandler, index_api_manager
+from oc_cache import TTLCache
+
+
+@pytest.fixture(scope="session")
+def endpoint():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeIndexHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%s/index/sparql" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="session")
+def fake_meta():
+    data = dict(META)
+    data[BR + "0691"] = {"pubDate": "", "ids": "issn:1234-5678", "source": "", "author": ""}
+    data[BR + "061"] = dict(data[BR + "061"], authors="Doe, John [omid:ra/061]; Roe, Jane")
+    with FakeMeta(data) as fake:
+        yield fake
+
+
+@pytest.fixture
+def meta_endpoints(fake_meta, monkeypatch):
+    monkeypatch.setattr(indexapi_core, "META_SPARQL_ENDPOINT", fake_meta.sparql_endpoint)
+    monkeypatch.setattr(indexapi_v1, "META_API_ENDPOINT", fake_meta.api_endpoint)
+    monkeypatch.setattr(indexapi_core, "OMID_CACHE", TTLCache())
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", None)
+    fake_meta.queries.clear()
+    return fake_meta
+
+
+@pytest.fixture
+def api_manager(endpoint, meta_endpoints, tmp_path):
+    return index_api_manager(endpoint, tmp_path)
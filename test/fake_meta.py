@@ -0,0 +1,328 @@
+# Local stand-in for OpenCitations Meta, answering from canned data the
+# queries done by the index addons (see indexapi_core.py and indexapi_v1.py):
+#
+# * the SPARQL queries of __query_omid_of (plain and journal), __query_omids_of,
+#   __br_meta_metadata and __br_meta_brs_of, at <base>/meta/sparql;
+# * the metadata operation of the REST API, at <base>/meta/api/v1/metadata/<ids>;
+# * the SPARQL query of the metadata operation of meta_v1.hf (see metaapi.py),
+#   e.g. run in bulk by oc_stream.py, at <base>/meta/sparql.
+#
+# The SPARQL results are returned as CSV, TSV or JSON according to the Accept
+# header of the request, as Virtuoso does.
+#
+# The data are a dict mapping the URI of each br entity to its fields, i.e.
+# "pubDate", "ids" (separated by " __ "), "source" and "author" (URIs separated
+# by "; "), and optionally "title", "venue", "volume", "issue", "page" and
+# "authors" used by the REST API. To run the enrichment of the addons offline
+# (e.g. for load testing) on a synthetic Meta of 100000 br entities:
+#
+#     python test/fake_meta.py --port 8890 --entities 100000
+#     OC_META_SPARQL_ENDPOINT=http://127.0.0.1:8890/meta/sparql \
+#     OC_META_API_ENDPOINT=http://127.0.0.1:8890/meta/api/v1/metadata/ ...
+
+import json
+import threading
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from csv import writer
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from re import findall, search, sub
+from urllib.parse import parse_qs, unquote
+
+BR = "https://w3id.org/oc/meta/br/"
+RA = "https://w3id.org/oc/meta/ra/"
+
+# the variables of the results of the query of the metadata operation
+METADATA_OPERATION_VARS = (
+    "id", "title", "author", "pub_date", "issue", "volume", "venue", "type", "page", "publisher", "editor")
+
+
+class FakeMeta(object):
+
+    def __init__(self, data, host="127.0.0.1", port=0):
+        self.data = data
+        # the br entities having each id (with and without its scheme), and
+        # the ones part of each venue
+        self.by_id = defaultdict(set)
+        self.by_value = defaultdict(set)
+        self.by_venue = defaultdict(set)
+        for uri, meta in data.items():
+            for id in _split(meta.get("ids"), " __ "):
+                self.by_id[id].add(uri)
+                self.by_value[id.split(":", 1)[1]].add(uri)
+            for venue in _split(meta.get("source"), "; "):
+                self.by_venue[venue].add(uri)
+        # the number of requests received for each kind of query
+        self.queries = Counter()
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://%s:%s/meta" % self.server.server_address[:2]
+
+    @property
+    def sparql_endpoint(self):
+        return self.url + "/sparql"
+
+    @property
+    def api_endpoint(self):
+        return self.url + "/api/v1/metadata/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def sparql(self, query):
+        """Return the SPARQL results (as a dict) of the query, or None if it is
+        not one of the queries done by the addons."""
+        if "?res a fabio:Expression" in query:
+            self.queries["metadata_operation"] += 1
+            return _results(list(METADATA_OPERATION_VARS), [
+                self.__metadata_operation(uri) for uri in self.__searched(query)])
+
+        values = search(r"VALUES \?val \{([^}]*)\}", query)
+        if values:
+            self.queries["metadata"] += 1
+            return _results(["val", "pubDate", "ids", "source", "author"], [
+                self.__metadata(uri) for uri in (v.strip("<>") for v in values.group(1).split()) if uri in self.data])
+
+        pairs = search(r"VALUES \(\?scheme \?literalValue\) \{(.*?)\}\s*\n", query)
+        if pairs:
+            self.queries["brs_of"] += 1
+            brs = set()
+            for scheme, literal_value in findall(r'\(datacite:(\w+) "((?:[^"\\]|\\.)*)"\)', pairs.group(1)):
+                brs.update(self.by_id.get(scheme + ":" + sub(r"\\(.)", r"\1", literal_value), ()))
+            return _results(["val"], [{"val": _uri(uri)} for uri in sorted(brs)])
+
+        literal_values = search(r"VALUES \?literalValue \{(.*?)\}\s*\n", query)
+        if literal_values:
+            self.queries["omids_of"] += 1
+            bindings = []
+            for literal_value in findall(r'"((?:[^"\\]|\\.)*)"', literal_values.group(1)):
+                value = sub(r"\\(.)", r"\1", literal_value)
+                bindings.extend({"literalValue": _literal(value), "br": _uri(uri)}
+                                for uri in sorted(self.by_value.get(value, ())))
+            return _results(["literalValue", "br"], bindings)
+
+        literal_value = search(r"literal:hasLiteralValue '([^']*)'", query)
+        if literal_value:
+            value = literal_value.group(1)
+            brs = self.by_value.get(value, set())
+            if "partOf" in query:
+                self.queries["journal_omid_of"] += 1
+                brs = {uri for venue in sorted(brs) for uri in self.by_venue.get(venue, ())}
+            else:
+                self.queries["omid_of"] += 1
+            return _results(["br"], [{"br": _uri(uri)} for uri in sorted(brs)])
+
+        return None
+
+    def api_metadata(self, ids):
+        """Return the records of the metadata operation of the REST API for the
+        ids specified (e.g. ["omid:br/061", "doi:10.1000/1"])."""
+        self.queries["api_metadata"] += 1
+        brs = []
+        for id in ids:
+            if id.startswith("omid:br/"):
+                uris = [BR + id[8:]] if BR + id[8:] in self.data else []
+            else:
+                uris = sorted(self.by_id.get(id, ()))
+            brs.extend(uri for uri in uris if uri not in brs)
+        return [self.__record(uri) for uri in brs]
+
+    def __searched(self, query):
+        # the br entities searched by generate_id_search, in either of its shapes
+        brs = {BR + omid for omid in findall(r"BIND\(<https://w3id.org/oc/meta/br/([0-9]+)> AS \?res\)", query)
+               if BR + omid in self.data}
+        pairs = findall(r'\(datacite:(\w+) "((?:[^"\\]|\\.)*)"\)', query)
+        pairs += [(scheme, value) for value, scheme in findall(
+            r'literal:hasLiteralValue "((?:[^"\\]|\\.)*)";\s*datacite:usesIdentifierScheme datacite:(\w+)', query)]
+        for scheme, literal_value in pairs:
+            brs.update(self.by_id.get(scheme + ":" + sub(r"\\(.)", r"\1", literal_value), ()))
+        return sorted(brs)
+
+    def __metadata_operation(self, uri):
+        record = self.__record(uri)
+        # the authors as returned by the query, i.e. with their roles in order
+        authors = _split(self.data[uri].get("authors"), "; ")
+        record["author"] = "|".join(
+            "%s:ar%s:%s" % (author, i, "ar%s" % (i + 1) if i + 1 < len(authors) else "")
+            for i, author in enumerate(authors))
+        record["type"] = "http://purl.org/spar/fabio/JournalArticle"
+        return {var: _literal(record[var]) for var in METADATA_OPERATION_VARS}
+
+    def __metadata(self, uri):
+        meta = self.data[uri]
+        elem = {"val": _uri(uri)}
+        if meta.get("pubDate"):
+            elem["pubDate"] = _literal(meta["pubDate"])
+        for k in ("ids", "source", "author"):
+            elem[k] = _literal(meta.get(k, ""))
+        return elem
+
+    def __record(self, uri):
+        meta = self.data[uri]
+        return {
+            "id": " ".join(_split(meta.get("ids"), " __ ") + ["omid:br/" + uri[len(BR):]]),
+            "title": meta.get("title", ""),
+            "author": meta.get("authors", ""),
+            "pub_date": meta.get("pubDate", ""),
+            "venue": meta.get("venue", ""),
+            "volume": meta.get("volume", ""),
+            "issue": meta.get("issue", ""),
+            "page": meta.get("page", ""),
+            "type": "journal article",
+            "publisher": "",
+            "editor": ""
+        }
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path, _, qs = self.path.partition("?")
+                if path.startswith("/meta/api/v1/metadata/"):
+                    ids = unquote(path[len("/meta/api/v1/metadata/"):]).split("__")
+                    self.__reply(fake.api_metadata([id for id in ids if id]))
+                elif path == "/meta/sparql" and "query" in parse_qs(qs):
+                    self.__reply_sparql(fake.sparql(parse_qs(qs)["query"][0]))
+                else:
+                    self.__reply(None)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    body = parse_qs(body).get("query", [""])[0]
+                self.__reply_sparql(fake.sparql(body) if self.path == "/meta/sparql" else None)
+
+            def __reply_sparql(self, res):
+                accept = self.headers.get("Accept", "")
+                if res is not None and "text/csv" in accept:
+                    self.__send(200, "text/csv", _csv(res))
+                elif res is not None and "text/tab-separated-values" in accept:
+                    self.__send(200, "text/tab-separated-values", _tsv(res))
+                else:
+                    self.__reply(res)
+
+            def __reply(self, res):
+                if res is not None:
+                    self.__send(200, "application/sparql-results+json", json.dumps(res))
+                else:
+                    self.__send(400, "text/plain", "Bad Request")
+
+            def __send(self, status, content_type, body):
+                body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def synthetic_meta(n, dup_ratio=0.1, seed=0):
+    """Return the data of n synthetic br entities, published in 100 journals by
+    1000 authors, where dup_ratio of them share a DOI with another one."""
+    rnd = Random(seed)
+    data = {}
+    for j in range(100):
+        data[BR + "09%s" % j] = {"pubDate": "", "ids": "issn:0000-%04d" % j, "source": "", "author": ""}
+    for i in range(n):
+        doi = "doi:10.1000/%s" % (rnd.randrange(i) if i > 0 and rnd.random() < dup_ratio else i)
+        ids = [doi] + ["pmid:%s" % (i * 10 + k) for k in range(rnd.randrange(2))]
+        journal = rnd.randrange(100)
+        authors = sorted({rnd.randrange(1000) for _ in range(rnd.randrange(1, 4))})
+        pub_date = "%s-%02d-%02d" % (rnd.randrange(1950, 2024), rnd.randrange(1, 13), rnd.randrange(1, 29))
+        data[BR + "06%s" % i] = {
+            "pubDate": pub_date[:rnd.choice((4, 7, 10, 10))],
+            "ids": " __ ".join(ids),
+            "source": BR + "09%s" % journal,
+            "author": "; ".join(RA + "06%s" % a for a in authors),
+            "title": "Title %s" % i,
+            "venue": "Journal %s [issn:0000-%04d omid:br/09%s]" % (journal, journal, journal),
+            "authors": "; ".join("Doe%s, John [omid:ra/06%s]" % (a, a) for a in authors)
+        }
+    return data
+
+
+def _split(s, sep):
+    return s.split(sep) if s else []
+
+
+def _uri(value):
+    return {"type": "uri", "value": value}
+
+
+def _literal(value):
+    return {"type": "literal", "value": value}
+
+
+def _results(variables, bindings):
+    return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+
+
+def _csv(res):
+    s = StringIO()
+    w = writer(s)
+    w.writerow(res["head"]["vars"])
+    for elem in res["results"]["bindings"]:
+        w.writerow([elem[var]["value"] if var in elem else "" for var in res["head"]["vars"]])
+    return s.getvalue()
+
+
+def _tsv(res):
+    lines = ["\t".join("?" + var for var in res["head"]["vars"])]
+    for elem in res["results"]["bindings"]:
+        lines.append("\t".join(_tsv_term(elem[var]) if var in elem else "" for var in res["head"]["vars"]))
+    return "\n".join(lines) + "\n"
+
+
+def _tsv_term(value):
+    if value["type"] == "uri":
+        return "<%s>" % value["value"]
+    return '"%s"' % value["value"].replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser("fake_meta.py", description="Run a local stand-in for OpenCitations Meta")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8890)
+    arg_parser.add_argument("--data", help="a JSON file with the data of the br entities")
+    arg_parser.add_argument("--entities", type=int, default=10000,
+                            help="the number of synthetic br entities, if no data are specified")
+    args = arg_parser.parse_args()
+
+    if args.data:
+        with open(args.data, encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        data = synthetic_meta(args.entities)
+    fake = FakeMeta(data, args.host, args.port)
+    print("OC_META_SPARQL_ENDPOINT=%s" % fake.sparql_endpoint)
+    print("OC_META_API_ENDPOINT=%s" % fake.api_endpoint)
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.server.server_close()
@@ -0,0 +1,114 @@
+# Canned data and stand-ins shared by the tests: the Meta metadata of a few br
+# entities, the functions replacing the queries of indexapi_core to Meta, the
+# results of the index for some citations, the CSV dumps of the index used to
+# build a count index (see oc_counts.py), and a SPARQL endpoint of the index
+# answering the queries of the operations of index_v2.hf (see conftest.py).
+
+from http.server import BaseHTTPRequestHandler
+from re import findall, search
+
+from ramose import APIManager
+
+BR = "https://w3id.org/oc/meta/br/"
+
+META = {
+    BR + "061": {"pubDate": "2021-03-10", "ids": "doi:10.7717/peerj-cs.421 __ pmid:33817056", "source": BR + "0690", "author": "https://w3id.org/oc/meta/ra/061"},
+    BR + "062": {"pubDate": "2019-11-25", "ids": "doi:10.3233/ds-190019", "source": BR + "0691", "author": "https://w3id.org/oc/meta/ra/062"},
+    # same DOI of 062, hence a duplicate
+    BR + "063": {"pubDate": "2019-11-25", "ids": "doi:10.3233/ds-190019 __ pmid:1", "source": BR + "0691", "author": "https://w3id.org/oc/meta/ra/062"},
+    BR + "064": {"pubDate": "2015-03-09", "ids": "doi:10.1108/jd-12-2013-0166", "source": BR + "0691", "author": "https://w3id.org/oc/meta/ra/062"},
+    BR + "065": {"pubDate": "2016", "ids": "doi:10.1000/other", "source": BR + "0692", "author": "https://w3id.org/oc/meta/ra/063"},
+    # no identifier at all
+    BR + "066": {"pubDate": "2016", "ids": "", "source": "", "author": ""},
+}
+
+
+def fake_br_meta_metadata(values):
+    res_json = {}
+    for value in values:
+        uri = value[1:-1]
+        if uri in META:
+            elem = {"val": uri}
+            elem.update(META[uri])
+            res_json[uri] = elem
+    return res_json, ["val", "pubDate", "ids", "source", "author"]
+
+
+def fake_br_meta_brs_of(ids):
+    ids = set(ids)
+    return {uri for uri, meta in META.items() if ids.intersection(meta["ids"].split(" __ "))}, ["val"]
+
+
+def index_res(*cits):
+    res = [["oci", "citing", "cited"]]
+    for citing, cited in cits:
+        oci = citing + "-" + cited
+        res.append([(oci, oci), (BR + citing, BR + citing), (BR + cited, BR + cited)])
+    return res
+
+
+CITATIONS = [("061", "064"), ("062", "064"), ("063", "064"), ("066", "064"), ("065", "064"),
+             ("061", "062"), ("061", "063"), ("061", "064"), ("066", "061")]
+
+
+def pids(omid):
+    return " ".join(["omid:br/" + omid] + META[BR + omid]["ids"].split(" __ ")).strip()
+
+
+def write_dump(path, citations):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("oci,citing,cited,creation,timespan,journal_sc,author_sc\n")
+        for citing, cited in citations:
+            f.write('%s-%s,"%s","%s",2020,P1Y,no,no\n' % (citing, cited, pids(citing), pids(cited)))
+
+
+OCI = "https://w3id.org/oc/index/ci/"
+
+# citations to 064, and references of 061, where 063 is a duplicate of 062
+INDEX = sorted(
+    (OCI + citing + "-" + cited, BR + citing, BR + cited)
+    for citing, cited in (("061", "064"), ("062", "064"), ("063", "064"), ("065", "064"),
+                          ("061", "062"), ("061", "063")))
+
+INDEX_HEADER = ("oci", "citing", "cited")
+
+
+class FakeIndexHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    queries = []
+
+    def do_POST(self):
+        query = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        self.queries.append(query)
+        header = INDEX_HEADER
+        rows = INDEX
+        for var, values in findall(r"VALUES \?(\w+) \{([^}]*)\}", query):
+            values = [v.strip("<>") for v in values.split()]
+            rows = [row for row in rows if row[INDEX_HEADER.index(var)] in values]
+        for op, value in findall(r'FILTER\(STR\(\?oci\) ([<>]) "([^"]*)"\)', query):
+            rows = [row for row in rows if (row[0] > value if op == ">" else row[0] < value)]
+        distinct = search(r"SELECT DISTINCT \?(\w+)", query)
+        if distinct:
+            header = (distinct.group(1),)
+            rows = sorted({(row[INDEX_HEADER.index(header[0])],) for row in rows})
+        limit = search(r"LIMIT (\d+)\s*$", query)
+        if limit:
+            rows = rows[:int(limit.group(1))]
+        body = "\r\n".join(",".join(row) for row in [header] + rows).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def index_api_manager(endpoint, path):
+    """Return the API manager of index_v2.hf, querying the index at endpoint."""
+    FakeIndexHandler.queries.clear()
+    with open("index_v2.hf", encoding="utf-8") as f:
+        conf = f.read().replace("#endpoint http://127.0.0.1/index/sparql", "#endpoint " + endpoint)
+    (path / "index_v2.hf").write_text(conf, encoding="utf-8")
+    return APIManager([str(path / "index_v2.hf")])
@@ -0,0 +1,246 @@
+import pytest
+
+import indexapi_core
+import indexapi_v1
+import indexapi_v2
+from fakes import BR, META, fake_br_meta_metadata, index_res
+from oc_cache import TTLCache, cache_from_url
+from oc_sparql import sparql_headers
+
+
+@pytest.fixture(params=[indexapi_v1, indexapi_v2], ids=["v1", "v2"])
+def addon(request, monkeypatch):
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", fake_br_meta_metadata)
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", None)
+    return request.param
+
+
+def test_citations_info_single_omid(addon):
+    res, do_type = addon.citations_info(index_res(("061", "064"), ("062", "064")), "oci", "citing", "cited")
+    assert do_type
+    assert res[0] == ["oci", "citing", "cited", "creation", "timespan", "journal_sc", "author_sc"]
+    rows = sorted(res[1:])
+    assert [r[0] for r in rows] == ["061-064", "062-064"]
+    assert rows[0][3:] == ["2021-03-10", "P6Y0M1D", "no", "no"]
+    assert rows[1][3:] == ["2019-11-25", "P4Y8M16D", "yes", "yes"]
+    if addon is indexapi_v2:
+        assert rows[0][1] == "omid:br/061 doi:10.7717/peerj-cs.421 pmid:33817056"
+    else:
+        assert rows[0][1] == "10.7717/peerj-cs.421"
+
+
+def test_addons_differ_only_in_the_pids(monkeypatch):
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", fake_br_meta_metadata)
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", None)
+    res = index_res(("061", "064"), ("062", "064"), ("063", "064"), ("065", "064"), ("061", "062"))
+    v1, _ = indexapi_v1.citations_info(res, "oci", "citing", "cited")
+    v2, _ = indexapi_v2.citations_info(res, "oci", "citing", "cited")
+    assert len(v1) == len(v2) == 5
+    for row_v1, row_v2 in zip(v1[1:], v2[1:]):
+        assert row_v1[:1] + row_v1[3:] == row_v2[:1] + row_v2[3:]
+        for pids_v1, pids_v2 in zip(row_v1[1:3], row_v2[1:3]):
+            assert pids_v1 == " ".join(p[4:] for p in pids_v2.split() if p.startswith("doi:"))
+    assert indexapi_v1.count_unique_cits(res, "oci", "citing", "cited") == \
+        indexapi_v2.count_unique_cits(res, "oci", "citing", "cited")
+
+
+def test_citations_info_duplicates_are_merged(addon):
+    res, _ = addon.citations_info(index_res(("062", "064"), ("063", "064")), "oci", "citing", "cited")
+    assert len(res) == 2
+    count, _ = addon.count_unique_cits(index_res(("062", "064"), ("063", "064")), "oci", "citing", "cited")
+    assert count == [["count"], [1]]
+
+
+def test_citations_info_multi_omid_only_real_citations(addon):
+    # two cited entities: citing 061 cites only 064, citing 062 cites only 065
+    res, _ = addon.citations_info(index_res(("061", "064"), ("062", "065")), "oci", "citing", "cited")
+    assert sorted(r[0] for r in res[1:]) == ["061-064", "062-065"]
+    count, _ = addon.count_unique_cits(index_res(("061", "064"), ("062", "065")), "oci", "citing", "cited")
+    assert count == [["count"], [2]]
+
+
+def test_citations_info_without_ids(addon):
+    res, _ = addon.citations_info(index_res(("066", "064")), "oci", "citing", "cited")
+    assert len(res) == 1
+
+
+def test_empty_result(addon):
+    res, _ = addon.citations_info([["oci", "citing", "cited"]], "oci", "citing", "cited")
+    assert len(res) == 1
+    count, _ = addon.count_unique_cits([["oci", "citing", "cited"]], "oci", "citing", "cited")
+    assert count == [["count"], [0]]
+
+
+def test_dedup_brs_is_not_transitive():
+    # 2 is a duplicate of 1, so its pmid:y does not make 3 a duplicate too,
+    # as with the pairwise comparison against the unique br entities
+    brs_meta = {}
+    for br, ids in (("1", "doi:x"), ("2", "doi:x __ pmid:y"), ("3", "pmid:y"), ("4", "pmid:y __ doi:z")):
+        brs_meta[br] = {"val": br, "ids": ids}
+    f_res, alias = getattr(indexapi_core, "__dedup_brs")(brs_meta, ["val", "ids"])
+    assert list(f_res) == ["1", "3"]
+    assert alias == {"1": "1", "2": "1", "3": "3", "4": "3"}
+
+
+def test_chunks_are_fetched_concurrently_and_retried(monkeypatch):
+    monkeypatch.setattr(indexapi_core, "META_CHUNK_SIZE", 1)
+    monkeypatch.setattr(indexapi_core, "META_RETRY_BACKOFF", 0)
+    failing = "<%s063>" % BR
+    failures = {failing: 1}
+
+    def flaky_br_meta_metadata(values):
+        if failures.get(values[0], 0) > 0:
+            failures[values[0]] -= 1
+            return None, None
+        return fake_br_meta_metadata(values)
+
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", flaky_br_meta_metadata)
+    f_res, alias = getattr(indexapi_core, "__get_unique_brs_metadata")([BR + "061", BR + "063", BR + "062"])
+    assert list(f_res) == [BR + "061", BR + "063"]
+    assert alias[BR + "062"] == BR + "063"
+    assert failures[failing] == 0
+
+
+def test_failed_chunk_raises(addon, monkeypatch):
+    monkeypatch.setattr(indexapi_core, "META_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", lambda values: None)
+    with pytest.raises(ConnectionError):
+        addon.citations_info(index_res(("061", "064")), "oci", "citing", "cited")
+
+
+def test_v1_metadata_batches_meta_calls(monkeypatch):
+    calls = {"sparql": 0, "api": 0}
+
+    def counting_br_meta_metadata(values):
+        calls["sparql"] += 1
+        return fake_br_meta_metadata(values)
+
+    def fake_ocmeta_parser(ids, pre="doi"):
+        calls["api"] += 1
+        return {
+            i: {"authors_str": "Doe, John", "pub_date": META[BR + i[8:]]["pubDate"], "title": "T" + i[8:],
+                "source_title": "S", "volume": "1", "issue": "2", "page": "1-2", "source_id": "issn:0000-0000"}
+            for i in ids if i != "omid:br/065"
+        }
+
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", counting_br_meta_metadata)
+    monkeypatch.setattr(indexapi_v1, "__ocmeta_parser", fake_ocmeta_parser)
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", None)
+    res = [
+        ["val", "citation", "reference"],
+        [(BR + "064",) * 2, (BR + "061; " + BR + "062",) * 2, ("",) * 2],
+        [(BR + "061",) * 2, ("",) * 2, (BR + "064; " + BR + "066",) * 2],
+        [(BR + "065",) * 2, ("",) * 2, ("",) * 2],
+    ]
+    out, _ = indexapi_v1.metadata(res, "val", "citation", "reference")
+    assert calls == {"sparql": 1, "api": 1}
+    assert out[0] == ["doi", "citation_count", "citation", "reference", "author", "year", "title",
+                      "source_title", "volume", "issue", "page", "source_id", "oa_link"]
+    assert out[1] == ["10.1108/jd-12-2013-0166", "2", "10.7717/peerj-cs.421; 10.3233/ds-190019", "",
+                      "Doe, John", "2015-03-09", "T064", "S", "1", "2", "1-2", "issn:0000-0000", ""]
+    assert out[2][:4] == ["10.7717/peerj-cs.421", "0", "", "10.1108/jd-12-2013-0166; "]
+    assert out[3] == ["10.1000/other", "0", "", ""] + [""] * 9
+
+
+def test_omid_resolution_is_cached(addon, monkeypatch):
+    monkeypatch.setattr(indexapi_core, "OMID_CACHE", TTLCache())
+    calls = []
+
+    def fake_query_omid_of(s, multi=False):
+        calls.append(s)
+        if s == "doi:10.1000/broken":
+            return None
+        return ["<%s061>" % BR] if s == "doi:10.1000/found" else ""
+
+    monkeypatch.setattr(indexapi_core, "__query_omid_of", fake_query_omid_of)
+    for _ in range(3):
+        assert addon.id2omids("doi:10.1000/found") == (["<%s061>" % BR],)
+        assert addon.id2omids("doi:10.1000/missing") == ("",)
+        assert addon.id2omids("doi:10.1000/broken") == ("",)
+    assert calls.count("doi:10.1000/found") == 1
+    assert calls.count("doi:10.1000/missing") == 1
+    assert calls.count("doi:10.1000/broken") == 3
+    assert indexapi_core.OMID_CACHE.stats()["hits"] == 4
+
+
+def test_br_metadata_cache(addon, monkeypatch, tmp_path):
+    requested = []
+
+    def counting_br_meta_metadata(values):
+        requested.extend(values)
+        return fake_br_meta_metadata(values)
+
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", counting_br_meta_metadata)
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", cache_from_url("sqlite:///" + str(tmp_path / "br.db")))
+    first, _ = addon.citations_info(index_res(("061", "064"), ("062", "064")), "oci", "citing", "cited")
+    assert len(requested) == 3
+    second, _ = addon.citations_info(index_res(("061", "064"), ("063", "064")), "oci", "citing", "cited")
+    assert requested[3:] == ["<%s063>" % BR]
+    assert first[1] == second[1]
+
+
+@pytest.mark.parametrize("module", [indexapi_v1, indexapi_v2], ids=["v1", "v2"])
+def test_enrichment_through_the_meta_endpoints(meta_endpoints, module, monkeypatch):
+    res = index_res(("061", "064"), ("062", "064"), ("063", "064"), ("065", "064"), ("066", "064"))
+    live, _ = module.citations_info(res, "oci", "citing", "cited")
+    live_count, _ = module.count_unique_cits(res, "oci", "citing", "cited")
+    assert meta_endpoints.queries == {"metadata": 4}
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", fake_br_meta_metadata)
+    assert module.citations_info(res, "oci", "citing", "cited")[0] == live
+    assert module.count_unique_cits(res, "oci", "citing", "cited")[0] == live_count == [["count"], [3]]
+
+
+def test_omid_resolution_through_the_meta_endpoint(meta_endpoints):
+    assert indexapi_core.id2omids("doi:10.3233/ds-190019") == (["<%s062> <%s063>" % (BR, BR)],)
+    assert indexapi_core.id2omids("doi:10.1000/missing") == ("",)
+    # all the articles of a journal
+    assert indexapi_core.id2omids("issn:1234-5678") == (["<%s062> <%s063> <%s064>" % (BR, BR, BR)],)
+    assert getattr(indexapi_core, "__br_meta_brs_of")(["pmid:1", 'doi:10.1000/"other']) == ({BR + "063"}, ["val"])
+    assert meta_endpoints.queries == {"omid_of": 2, "journal_omid_of": 1, "brs_of": 1}
+
+
+def test_split_dois_are_resolved_in_batch(meta_endpoints, monkeypatch):
+    dois = "doi:10.3233/ds-190019__doi:10.1000/missing__doi:10.1108/jd-12-2013-0166__issn:1234-5678"
+    expected = " ".join(omid for d in dois.split("__") for omid in indexapi_core.get_omid_of(d, multi=True))
+    monkeypatch.setattr(indexapi_core, "OMID_CACHE", TTLCache())
+    meta_endpoints.queries.clear()
+    assert indexapi_v1.split_dois2omids(dois) == (expected,)
+    assert meta_endpoints.queries == {"omids_of": 1, "journal_omid_of": 1}
+    # served from the cache
+    assert indexapi_v1.split_dois2omids(dois) == (expected,)
+    assert meta_endpoints.queries == {"omids_of": 1, "journal_omid_of": 1}
+
+    monkeypatch.setattr(indexapi_core, "OMID_CACHE", TTLCache())
+    monkeypatch.setattr(indexapi_core, "OMID_BATCH_SIZE", 1)
+    assert indexapi_v1.split_dois2omids(dois) == (expected,)
+    assert meta_endpoints.queries["omids_of"] == 4
+
+
+def test_split_dois_with_meta_unavailable(meta_endpoints, monkeypatch):
+    monkeypatch.setattr(indexapi_core, "META_SPARQL_ENDPOINT", meta_endpoints.url + "/unknown")
+    assert indexapi_v1.split_dois2omids("doi:10.3233/ds-190019__doi:10.1000/missing") == ("",)
+    assert len(indexapi_core.OMID_CACHE) == 0
+
+
+@pytest.mark.parametrize("results_format", ["csv", "tsv"])
+def test_sparql_results_formats(meta_endpoints, results_format, monkeypatch):
+    res = index_res(("061", "064"), ("062", "064"), ("063", "064"), ("065", "064"))
+
+    def run():
+        monkeypatch.setattr(indexapi_core, "OMID_CACHE", TTLCache())
+        return (indexapi_v2.citations_info(res, "oci", "citing", "cited")[0],
+                indexapi_v1.split_dois2omids("doi:10.3233/ds-190019__issn:1234-5678__doi:10.1000/missing"),
+                getattr(indexapi_core, "__br_meta_brs_of")(["pmid:1", "doi:10.1108/jd-12-2013-0166"]))
+
+    monkeypatch.setattr(indexapi_core, "SPARQL_HEADERS", sparql_headers("json"))
+    expected = run()
+    monkeypatch.setattr(indexapi_core, "SPARQL_HEADERS", sparql_headers(results_format))
+    assert run() == expected
+
+
+def test_v1_metadata_through_the_meta_endpoints(meta_endpoints):
+    res = [["val", "citation", "reference"], [(BR + "064",) * 2, (BR + "061; " + BR + "063",) * 2, ("",) * 2]]
+    out, _ = indexapi_v1.metadata(res, "val", "citation", "reference")
+    assert out[1][:6] == ["10.1108/jd-12-2013-0166", "2", "10.7717/peerj-cs.421; 10.3233/ds-190019", "", "",
+                          "2015-03-09"]
+    assert meta_endpoints.queries == {"metadata": 1, "api_metadata": 1}
@@ -3,6 +3,7 @@ import os
 import sys
 from io import StringIO
 
+import metaapi
 import pytest
 from ramose import APIManager
 
@@ -560,4 +561,73 @@ def test_editor_works_retrieval_without_scheme_prefix(api_manager):
         assert False, "The output is not valid JSON"
     normalized_output = normalize_json(output_json)
     normalized_expected = normalize_json(expected_output)        
-    assert normalized_output == normalized_expected
\ No newline at end of file
+    assert normalized_output == normalized_expected
+
+
+def test_id_search_values_groups_the_identifiers(monkeypatch):
+    """
+    Test that the non-OMID identifiers are looked up in a single VALUES block,
+    grouped by scheme and without duplicates.
+    """
+    monkeypatch.setattr(metaapi, "ID_SEARCH", "values")
+    ids_search = metaapi.generate_id_search('pmid:123__doi:10.1000/A"b__omid:br/061__doi:10.1000/a"b')[0]
+    assert ids_search.count("VALUES") == 1
+    assert '{ (datacite:doi "10.1000/a\\"b") (datacite:pmid "123") }' in ids_search
+    assert "<https://w3id.org/oc/meta/br/061>" in ids_search
+    assert ids_search.count("UNION") == 1
+
+    monkeypatch.setattr(metaapi, "ID_SEARCH", "union")
+    assert metaapi.generate_id_search("pmid:123__doi:10.1000/ab")[0].count("UNION") == 1
+
+
+def test_metadata_retrieval_id_search_modes(api_manager, monkeypatch):
+    """
+    Test that both the strategies of generate_id_search return the same metadata
+    for many identifiers.
+    """
+    ids = "doi:10.1787/b0e499cf-en__isbn:9789264960114__doi:10.1007/978-1-4020-9632-7__omid:br/06603870331"
+    outputs = []
+    for mode in ("union", "values"):
+        monkeypatch.setattr(metaapi, "ID_SEARCH", mode)
+        outputs.append(normalize_json(json.loads(execute_operation(api_manager, "/api/v1/metadata/" + ids))))
+    assert len(outputs[0]) == 2
+    assert outputs[0] == outputs[1]
+
+
+def test_create_metadata_output():
+    """
+    Test that the type, the authors, the editors and the publishers of each row are
+    postprocessed, and the other columns are left untouched.
+    """
+    header = ["id", "title", "author", "type", "publisher", "editor"]
+    row = ["doi:10.1000/1", "A title", "Doe, Jane [omid:ra/062]:ar2:|Doe, John [omid:ra/061]:ar1:ar2",
+           "http://purl.org/spar/fabio/JournalArticle", "", "Roe, Ann [omid:ra/063]:ar3:"]
+    output, do_type_fields = metaapi.create_metadata_output([header, [(value, value) for value in row]])
+    assert do_type_fields
+    assert output == [header, [
+        ("doi:10.1000/1", "doi:10.1000/1"),
+        ("A title", "A title"),
+        (row[2], "Doe, John [omid:ra/061]; Doe, Jane [omid:ra/062]"),
+        (row[3], "journal article"),
+        ("", ""),
+        (row[5], "Roe, Ann [omid:ra/063]")]]
+
+
+@pytest.mark.parametrize("items, expected", [
+    # the chain in any order
+    ("C:ar3:|A:ar1:ar2|B:ar2:ar3", "A; B; C"),
+    # a role following a missing one, i.e. two segments
+    ("A:ar1:ar2|B:ar2:|C:ar3:ar4|D:ar4:ar5|E:ar5:", "C; D; E; A; B"),
+    # a role followed by a missing one
+    ("A:ar1:ar2|B:ar2:ar9", "A; B"),
+    # a cycle, alone or after a segment
+    ("B:ar2:ar1|A:ar1:ar2", "A; B"),
+    ("A:ar1:ar2|B:ar2:|C:ar3:ar4|D:ar4:ar3", "A; B; C; D"),
+])
+def test_process_ordered_list_broken_chains(items, expected):
+    """
+    Test that all the names are returned, in a deterministic order, even when the
+    chain of roles is broken or contains cycles.
+    """
+    assert metaapi.process_ordered_list(items) == expected
+    assert metaapi.process_ordered_list("|".join(reversed(items.split("|")))) == expected
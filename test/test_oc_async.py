@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+
+import indexapi_core
+import indexapi_v1
+import indexapi_v2
+import oc_async
+import oc_counts
+from oc_http import AsyncResponse
+from fakes import BR, CITATIONS, index_res, write_dump
+
+
+@pytest.mark.parametrize("url", [
+    "/api/v2/citations/omid:br/064",
+    "/api/v2/references/omid:br/061?format=csv",
+    "/api/v2/citation-count/omid:br/064",
+    "/api/v2/reference-count/doi:10.7717/peerj-cs.421",
+    "/api/v2/citations/omid:br/064?filter=journal_sc:yes&sort=desc(oci)",
+])
+def test_exec_async_as_exec(api_manager, url):
+    expected = api_manager.get_op(url).exec()
+    assert asyncio.run(oc_async.exec_async(api_manager, url)) == expected
+
+
+def test_exec_async_errors(api_manager):
+    status, _, _ = asyncio.run(oc_async.exec_async(api_manager, "/api/v2/citations/omid:br/064", method="post"))
+    assert status == 405
+    status, _, _ = asyncio.run(oc_async.exec_async(api_manager, "/api/v2/nothing"))
+    assert status == 404
+
+
+def test_concurrent_operations(api_manager, tmp_path, monkeypatch):
+    write_dump(tmp_path / "dump.csv", CITATIONS)
+    oc_counts.build([str(tmp_path / "dump.csv")], str(tmp_path / "counts.bin"))
+    monkeypatch.setattr(indexapi_v2, "COUNT_INDEX", oc_counts.CountIndex(str(tmp_path / "counts.bin")))
+    urls = ["/api/v2/citation-count/omid:br/064", "/api/v2/reference-count/omid:br/061",
+            "/api/v2/citations/omid:br/064", "/api/v2/reference-count/omid:br/062"] * 10
+
+    async def run_all():
+        return await asyncio.gather(*[oc_async.exec_async(api_manager, url) for url in urls])
+
+    results = asyncio.run(run_all())
+    # the counts precomputed in the preprocessing do not leak among the operations
+    for url, (status, res, _) in zip(urls, results):
+        assert status == 200
+        assert res == api_manager.get_op(url).exec()[1]
+    assert [json.loads(res) for _, res, _ in results[:2]] == [[{"count": "3"}], [{"count": "2"}]]
+
+
+def test_v1_async_functions(api_manager, fake_meta):
+    res = index_res(("061", "064"), ("062", "064"), ("063", "064"))
+    assert asyncio.run(indexapi_v1.citations_info_async(res, "oci", "citing", "cited")) == \
+        indexapi_v1.citations_info(res, "oci", "citing", "cited")
+    assert asyncio.run(indexapi_v1.count_unique_cits_async(res, "oci", "citing", "cited")) == \
+        indexapi_v1.count_unique_cits(res, "oci", "citing", "cited")
+    assert asyncio.run(indexapi_v1.split_dois2omids_async("10.7717/peerj-cs.421__10.1000/other")) == \
+        ("<%s061> <%s065>" % (BR, BR),)
+
+    meta_res = [["val", "citation", "reference"], [(BR + "064",) * 2, (BR + "061; " + BR + "063",) * 2, ("",) * 2]]
+    fake_meta.queries.clear()
+    out = asyncio.run(indexapi_v1.metadata_async([list(r) for r in meta_res], "val", "citation", "reference"))
+    assert fake_meta.queries == {"metadata": 1, "api_metadata": 1}
+    assert out == indexapi_v1.metadata([list(r) for r in meta_res], "val", "citation", "reference")
+
+
+def test_async_failed_chunk_raises(api_manager, monkeypatch):
+    monkeypatch.setattr(indexapi_core, "META_SPARQL_ENDPOINT", "http://127.0.0.1:1/meta/sparql")
+    monkeypatch.setattr(indexapi_core, "META_RETRY_BACKOFF", 0)
+    with pytest.raises(ConnectionError):
+        asyncio.run(indexapi_v2.citations_info_async(index_res(("061", "064")), "oci", "citing", "cited"))
+
+
+def test_async_meta_requests_are_bounded(monkeypatch):
+    # the limit holds across the nested and concurrent gathers of the calls
+    monkeypatch.setattr(indexapi_core, "META_MAX_WORKERS", 3)
+    monkeypatch.setattr(indexapi_core, "META_CHUNK_SIZE", 1)
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", None)
+    running = [0, 0]
+
+    async def apost(url, **kwargs):
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return AsyncResponse(200, "OK", {"Content-Type": "text/csv"}, b"val,pubDate,ids,source,author\n")
+
+    async def calls():
+        brs = [["omid:br/06%d%d" % (n, i) for i in range(5)] for n in range(4)]
+        return await asyncio.gather(*[indexapi_core.get_brs_metadata_async(l) for l in brs])
+
+    monkeypatch.setattr(indexapi_core, "apost", apost)
+    assert len(asyncio.run(calls())) == 4
+    assert running == [0, 3]
@@ -0,0 +1,191 @@
+import socket
+import sqlite3
+import threading
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+import pytest
+
+import oc_cache
+from oc_cache import MISSING, MemoryBackend, RedisBackend, SqliteBackend, TTLCache, cache_from_url
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(oc_cache, "monotonic", lambda: now[0])
+    return now
+
+
+def test_lru_eviction(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"hits": 3, "misses": 1, "evictions": 1, "expirations": 0, "size": 2}
+
+
+def test_ttl_and_negative_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60, negative_ttl=5)
+    cache.set("hit", ["<omid>"])
+    cache.set("miss", "", negative=True)
+    clock[0] += 10
+    assert cache.get("hit") == ["<omid>"]
+    assert cache.get("miss") is MISSING
+    clock[0] += 60
+    assert cache.get("hit") is MISSING
+    assert cache.stats()["expirations"] == 2
+    assert len(cache) == 0
+
+
+def test_disabled_cache(clock):
+    cache = TTLCache(maxsize=0)
+    cache.set("a", 1)
+    assert cache.get("a") is MISSING
+
+
+class FakeRedisHandler(StreamRequestHandler):
+    # a stand-in for a Redis server, implementing only the commands used by RedisBackend
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        command = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(size + 2)[:-2])
+        return command
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            command = self.read_command()
+            if command is None:
+                break
+            name = command[0].upper()
+            if name == b"MGET":
+                out = [b"*%d\r\n" % (len(command) - 1)]
+                for key in command[1:]:
+                    value = store.get(key)
+                    out.append(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+                self.wfile.write(b"".join(out))
+            elif name in (b"SET", b"SELECT"):
+                if name == b"SET":
+                    store[command[1]] = command[2]
+                self.wfile.write(b"+OK\r\n")
+            else:
+                self.wfile.write(b"-ERR unknown command\r\n")
+
+
+@pytest.fixture
+def redis_server():
+    server = ThreadingTCPServer(("127.0.0.1", 0), FakeRedisHandler)
+    server.daemon_threads = True
+    server.store = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def check_backend(backend):
+    elem = {"val": {"value": "https://w3id.org/oc/meta/br/061"}, "pubDate": {"value": "2020"}}
+    assert backend.get_many(["https://w3id.org/oc/meta/br/061"]) == {}
+    backend.set_many({"https://w3id.org/oc/meta/br/061": elem})
+    assert backend.get_many(["https://w3id.org/oc/meta/br/061", "https://w3id.org/oc/meta/br/062"]) == {
+        "https://w3id.org/oc/meta/br/061": elem}
+    assert backend.stats()["hits"] == 1
+    assert backend.stats()["misses"] == 2
+
+
+def test_memory_backend():
+    backend = cache_from_url("memory")
+    assert isinstance(backend, MemoryBackend)
+    check_backend(backend)
+
+
+def test_sqlite_backend(tmp_path):
+    backend = cache_from_url("sqlite:///" + str(tmp_path / "cache.db"))
+    assert isinstance(backend, SqliteBackend)
+    check_backend(backend)
+    # another process (here, another backend) shares the same entries
+    assert len(SqliteBackend(str(tmp_path / "cache.db")).get_many(["https://w3id.org/oc/meta/br/061"])) == 1
+
+
+def test_sqlite_backend_expiry(tmp_path, monkeypatch):
+    backend = SqliteBackend(str(tmp_path / "cache.db"), ttl=10)
+    backend.set_many({"a": 1})
+    monkeypatch.setattr(oc_cache, "time", lambda: 1e12)
+    assert backend.get_many(["a"]) == {}
+    backend.purge()
+
+
+def test_unusable_sqlite_backend_is_empty(tmp_path):
+    (tmp_path / "cache.db").mkdir()
+    backend = SqliteBackend(str(tmp_path / "cache.db"))
+    backend.set_many({"a": 1})
+    assert backend.get_many(["a"]) == {}
+    assert backend.stats()["errors"] == 3
+
+
+def test_undecodable_values_are_misses(tmp_path, redis_server):
+    backend = RedisBackend(port=redis_server.server_address[1])
+    redis_server.store[b"oc:br:a"] = b"{not json"
+    redis_server.store[b"oc:br:b"] = b"\xff"
+    backend.set_many({"c": 1})
+    assert backend.get_many(["a", "b", "c"]) == {"c": 1}
+    assert backend.stats()["misses"] == 2
+    backend = SqliteBackend(str(tmp_path / "cache.db"))
+    backend.set_many({"a": 1, "c": 1})
+    with sqlite3.connect(str(tmp_path / "cache.db")) as conn:
+        conn.execute("UPDATE br_meta SET value = '{not json' WHERE key = 'a'")
+    assert backend.get_many(["a", "c"]) == {"c": 1}
+    assert backend.stats()["misses"] == 1
+
+
+def test_redis_backend(redis_server):
+    backend = cache_from_url("redis://127.0.0.1:%s/1" % redis_server.server_address[1])
+    assert isinstance(backend, RedisBackend)
+    check_backend(backend)
+    assert list(redis_server.store) == [b"oc:br:https://w3id.org/oc/meta/br/061"]
+
+
+def test_unreachable_redis_is_a_miss():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    backend = RedisBackend(port=port, retry_after=0)
+    backend.set_many({"a": 1})
+    assert backend.get_many(["a"]) == {}
+    assert backend.stats()["errors"] == 2
+
+
+def test_unreachable_redis_is_skipped(redis_server, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(oc_cache, "monotonic", lambda: now[0])
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    backend = RedisBackend(port=port, retry_after=30)
+    assert backend.get_many(["a"]) == {}
+
+    # the server, even if back, is not contacted until retry_after seconds have passed
+    backend.port = redis_server.server_address[1]
+    backend.set_many({"a": 1})
+    assert backend.get_many(["a"]) == {}
+    assert backend.stats()["errors"] == 1
+    assert backend.stats()["skipped"] == 2
+    now[0] += 30
+    backend.set_many({"a": 1})
+    assert backend.get_many(["a"]) == {"a": 1}
+
+
+def test_no_cache():
+    assert cache_from_url("none") is None
+    with pytest.raises(ValueError):
+        cache_from_url("memcached://localhost")
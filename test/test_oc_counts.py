@@ -0,0 +1,104 @@
+import json
+import zipfile
+
+import pytest
+
+import indexapi_core
+import indexapi_v2
+import oc_counts
+from fakes import BR, CITATIONS, FakeIndexHandler, fake_br_meta_metadata, index_res, write_dump
+
+
+@pytest.fixture
+def count_index(tmp_path):
+    write_dump(tmp_path / "dump.csv", CITATIONS)
+    oc_counts.build([str(tmp_path / "dump.csv")], str(tmp_path / "counts.bin"))
+    return oc_counts.CountIndex(str(tmp_path / "counts.bin"))
+
+
+@pytest.fixture
+def live(monkeypatch):
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", fake_br_meta_metadata)
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", None)
+
+    def live_count(citations):
+        count, _ = indexapi_v2.count_unique_cits(index_res(*citations), "oci", "citing", "cited")
+        return count[1][0]
+    return live_count
+
+
+def test_counts_match_live_counts(count_index, live):
+    assert len(count_index) == 6
+    for omid in ("061", "062", "063", "064", "065", "066"):
+        incoming = sorted({c for c in CITATIONS if c[1] == omid})
+        outgoing = sorted({c for c in CITATIONS if c[0] == omid})
+        assert count_index.get(omid) == (live(incoming), live(outgoing)), omid
+    # 062 and 063 are the same entity, 066 has no identifier
+    assert count_index.get("064") == (3, 0)
+    assert count_index.get("061") == (0, 2)
+    assert count_index.get("0610") is None
+
+
+def test_external_sort_and_zip(tmp_path, count_index):
+    write_dump(tmp_path / "a.csv", CITATIONS[:4])
+    write_dump(tmp_path / "b.csv", CITATIONS[4:])
+    with zipfile.ZipFile(tmp_path / "dump.zip", "w") as z:
+        z.write(tmp_path / "b.csv", "b.csv")
+    (tmp_path / "dump").mkdir()
+    (tmp_path / "a.csv").rename(tmp_path / "dump" / "a.csv")
+    n = oc_counts.build([str(tmp_path / "dump"), str(tmp_path / "dump.zip")], str(tmp_path / "small.bin"),
+                        chunk_size=2)
+    small = oc_counts.CountIndex(str(tmp_path / "small.bin"))
+    assert n == len(small) == 6
+    for omid in ("061", "062", "063", "064", "065", "066", "067"):
+        assert small.get(omid) == count_index.get(omid)
+
+
+def test_count_operations_use_the_index(count_index, live, monkeypatch):
+    monkeypatch.setattr(indexapi_v2, "COUNT_INDEX", count_index)
+    omid = "<%s064>" % BR
+    assert indexapi_v2.citation_count_index(omid) == ("",)
+    count, _ = indexapi_v2.count_unique_cits([["oci", "citing", "cited"]], "oci", "citing", "cited")
+    assert count == [["count"], [3]]
+    # the count is used only once
+    count, _ = indexapi_v2.count_unique_cits([["oci", "citing", "cited"]], "oci", "citing", "cited")
+    assert count == [["count"], [0]]
+    assert indexapi_v2.reference_count_index("<%s061>" % BR) == ("",)
+    count, _ = indexapi_v2.count_unique_cits([["oci", "citing", "cited"]], "oci", "citing", "cited")
+    assert count == [["count"], [2]]
+    # the only br entity of a DOI, as resolved by id2omids
+    assert indexapi_v2.citation_count_index(["<%s064>" % BR]) == ("",)
+    count, _ = indexapi_v2.count_unique_cits([["oci", "citing", "cited"]], "oci", "citing", "cited")
+    assert count == [["count"], [3]]
+
+
+def test_count_operations_fallback(count_index, live, monkeypatch):
+    monkeypatch.setattr(indexapi_v2, "COUNT_INDEX", count_index)
+    # not in the index, or more than one OMID
+    for s in ("<%s067>" % BR, ["<%s061> <%s062>" % (BR, BR)]):
+        assert indexapi_v2.citation_count_index(s) == (s,)
+        count, _ = indexapi_v2.count_unique_cits(index_res(("062", "064"), ("063", "064")), "oci", "citing", "cited")
+        assert count == [["count"], [1]]
+
+
+def test_count_operations_with_a_doi(api_manager, count_index, monkeypatch):
+    monkeypatch.setattr(indexapi_v2, "COUNT_INDEX", count_index)
+    for url, count in (("/api/v2/citation-count/doi:10.1108/JD-12-2013-0166", "3"),
+                       ("/api/v2/reference-count/doi:10.7717/peerj-cs.421", "2")):
+        status, res, _ = api_manager.get_op(url).exec()
+        assert status == 200
+        assert json.loads(res) == [{"count": count}]
+        # the index is queried on no entity at all
+        assert "{}" in FakeIndexHandler.queries[-1]
+
+
+def test_count_operations_with_a_doi_of_several_omids(meta_endpoints, count_index, live, monkeypatch):
+    monkeypatch.setattr(indexapi_v2, "COUNT_INDEX", count_index)
+    omids = indexapi_core.id2omids("doi:10.3233/ds-190019")[0]
+    assert omids == ["<%s062> <%s063>" % (BR, BR)]
+    # both are in the index, but the same citation of both counts once: the
+    # query is run on all of them and the count is the live one
+    assert count_index.get("062") == count_index.get("063") == (1, 1)
+    assert indexapi_v2.citation_count_index(omids) == (omids,)
+    count, _ = indexapi_v2.count_unique_cits(index_res(("061", "062"), ("061", "063")), "oci", "citing", "cited")
+    assert count == [["count"], [1]]
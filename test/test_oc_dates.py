@@ -0,0 +1,130 @@
+from datetime import datetime
+from random import Random
+
+import pytest
+from dateutil.parser import parse
+from dateutil.relativedelta import relativedelta
+
+import oc_dates
+
+
+# the computation of the timespan previously done for each citation
+def legacy_cit_duration(citing_complete_pub_date, cited_complete_pub_date):
+
+    def ___contains_months(date):
+        return date is not None and len(date) >= 7
+
+    def ___contains_days(date):
+        return date is not None and len(date) >= 10
+
+    DEFAULT_DATE = datetime(1970, 1, 1, 0, 0)
+    consider_months = ___contains_months(citing_complete_pub_date) and ___contains_months(cited_complete_pub_date)
+    consider_days = ___contains_days(citing_complete_pub_date) and ___contains_days(cited_complete_pub_date)
+
+    try:
+        if citing_complete_pub_date == "" or citing_complete_pub_date == None:
+            return ""
+        citing_pub_datetime = parse(citing_complete_pub_date, default=DEFAULT_DATE)
+    except ValueError:  # It is not a leap year
+        citing_pub_datetime = parse(citing_complete_pub_date[:7] + "-28", default=DEFAULT_DATE)
+    try:
+        if cited_complete_pub_date == "" or cited_complete_pub_date == None:
+            return ""
+        cited_pub_datetime = parse(cited_complete_pub_date, default=DEFAULT_DATE)
+    except ValueError:  # It is not a leap year
+        cited_pub_datetime = parse(cited_complete_pub_date[:7] + "-28", default=DEFAULT_DATE)
+
+    delta = relativedelta(citing_pub_datetime, cited_pub_datetime)
+
+    result = ""
+    if (
+        delta.years < 0
+        or (delta.years == 0 and delta.months < 0 and consider_months)
+        or (delta.years == 0 and delta.months == 0 and delta.days < 0 and consider_days)
+    ):
+        result += "-"
+    result += "P%sY" % abs(delta.years)
+
+    if consider_months:
+        result += "%sM" % abs(delta.months)
+
+    if consider_days:
+        result += "%sD" % abs(delta.days)
+
+    return result
+
+
+EDGE_CASES = [
+    ("2021-03-10", "2015-03-09"), ("2019-11-25", "2015-03-09"), ("2015-03-09", "2019-11-25"),
+    ("2016", "2015-03-09"), ("2015", "2016"), ("2016-02", "2016-03"), ("2016-03-01", "2016-02-29"),
+    ("2020-03-31", "2020-02-29"), ("2019-02-29", "2016-02-29"), ("2016-02-29", "2019-02-29"),
+    ("2021-01-31", "2020-12-31"), ("2020-01-31", "2020-02-29"), ("2020-03-30", "2020-01-31"),
+    ("2019-04-31", "2019-04-30"), ("2020-02-30", "2020-02-28"), ("2019", "2019"),
+    ("", "2019"), ("2019", ""), ("", ""), (None, "2019"), ("2019", None),
+]
+
+
+def random_date(rnd):
+    y = rnd.choice([1900, 1999, 2000, 2001, 2004, 2019, 2020, 2021])
+    kind = rnd.random()
+    if kind < 0.15:
+        return str(y)
+    m = rnd.randint(1, 12)
+    if kind < 0.3:
+        return "%d-%02d" % (y, m)
+    return "%d-%02d-%02d" % (y, m, rnd.choice([1, 15, 28, 29, 30, 31, rnd.randint(1, 31)]))
+
+
+@pytest.mark.parametrize("pair", EDGE_CASES)
+def test_durations_edge_cases(pair):
+    assert oc_dates.durations([pair]) == [legacy_cit_duration(*pair)]
+
+
+def test_durations_match_legacy():
+    rnd = Random(0)
+    pairs = [(random_date(rnd), random_date(rnd)) for _ in range(5000)] + EDGE_CASES
+    assert oc_dates.durations(pairs) == [legacy_cit_duration(*pair) for pair in pairs]
+
+
+def test_parse_date():
+    assert oc_dates.parse_date("2019") == (2019, 1, 1)
+    assert oc_dates.parse_date("2019-11") == (2019, 11, 1)
+    assert oc_dates.parse_date("2019-02-29") == (2019, 2, 28)
+
+
+def legacy_parse(s):
+    try:
+        d = parse(s, default=datetime(1970, 1, 1, 0, 0))
+    except ValueError:  # It is not a leap year
+        d = parse(s[:7] + "-28", default=datetime(1970, 1, 1, 0, 0))
+    return d.year, d.month, d.day
+
+
+def outcome(func, s):
+    try:
+        return func(s)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("year", [999, 1000, 1900, 1999, 2000, 2001, 2004, 2019, 2100, 9999])
+def test_parse_date_matches_dateutil(year):
+    dates = ["%04d" % year]
+    for month in range(0, 14):
+        dates.append("%04d-%02d" % (year, month))
+        dates.extend("%04d-%02d-%02d" % (year, month, day) for day in range(0, 33))
+    for s in dates:
+        assert outcome(oc_dates.parse_date, s) == outcome(legacy_parse, s), s
+
+
+@pytest.mark.parametrize("s", ["2019-11-25T10:00:00", "25 November 2019", "2019-1-5", "2019-11-25\n", "201"])
+def test_parse_date_other_formats(s):
+    assert outcome(oc_dates.parse_date, s) == outcome(legacy_parse, s)
+
+
+def test_parse_date_leap_years():
+    assert oc_dates.parse_date("2020-02-29") == (2020, 2, 29)
+    assert oc_dates.parse_date("1900-02-29") == (1900, 2, 28)
+    assert oc_dates.parse_date("2000-02-29") == (2000, 2, 29)
+    assert oc_dates.parse_date("2019-04-31") == (2019, 4, 28)
+    assert oc_dates.durations([("2019-03-01", "2019-02-29")]) == ["P0Y0M1D"]
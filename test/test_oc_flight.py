@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+
+import indexapi_core
+import indexapi_v2
+import oc_flight
+from fakes import BR, fake_br_meta_metadata
+
+
+def run_threads(n, func):
+    results = [None] * n
+
+    def run(idx):
+        results[idx] = func(idx)
+
+    threads = [threading.Thread(target=run, args=(idx,)) for idx in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_single_flight():
+    flight = oc_flight.SingleFlight()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        time.sleep(0.2)
+        return [value]
+
+    results = run_threads(5, lambda idx: flight.do("key", slow, idx))
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert flight.stats() == {"calls": 5, "executed": 1, "coalesced": 4}
+    # the calls following the end of the first one are executed again
+    assert flight.do("key", slow, 9) == [9]
+    assert len(calls) == 2
+
+
+def test_single_flight_errors():
+    flight = oc_flight.SingleFlight()
+
+    def failing():
+        time.sleep(0.2)
+        raise ConnectionError("Meta is down")
+
+    def call(idx):
+        try:
+            flight.do("key", failing)
+        except ConnectionError as e:
+            return str(e)
+
+    assert run_threads(3, call) == ["Meta is down"] * 3
+    assert flight.stats()["executed"] == 1
+
+
+def test_single_flight_async():
+    flight = oc_flight.SingleFlight()
+    calls = []
+
+    async def slow(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        if value == "error":
+            raise ValueError(value)
+        return value
+
+    async def run_all():
+        return await asyncio.gather(
+            *[flight.do_async("a", slow, "a") for _ in range(4)],
+            flight.do_async("b", slow, "b"),
+            *[flight.do_async("c", slow, "error") for _ in range(2)],
+            return_exceptions=True)
+
+    results = asyncio.run(run_all())
+    assert results[:5] == ["a"] * 4 + ["b"]
+    assert all(isinstance(r, ValueError) for r in results[5:])
+    assert calls == ["a", "b", "error"]
+    assert flight.stats() == {"calls": 7, "executed": 3, "coalesced": 4}
+
+
+def test_single_flight_async_cancellation():
+    flight = oc_flight.SingleFlight()
+    calls = []
+
+    async def slow(value):
+        calls.append(value)
+        await asyncio.sleep(0.1)
+        return value
+
+    async def run_all():
+        first = asyncio.ensure_future(flight.do_async("key", slow, "a"))
+        second = asyncio.ensure_future(flight.do_async("key", slow, "a"))
+        await asyncio.sleep(0.01)
+        # the caller that started the call goes away (e.g. the client disconnects)
+        first.cancel()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = asyncio.run(run_all())
+    assert isinstance(first, asyncio.CancelledError)
+    assert second == "a"
+    assert calls == ["a"]
+    assert flight.stats() == {"calls": 2, "executed": 1, "coalesced": 1}
+
+
+def test_operation_key(api_manager):
+    def key(url, content_type="application/json"):
+        return oc_flight.operation_key(api_manager.get_op(url), "get", content_type)
+
+    assert key("/api/v2/citations/doi:10.7717/PEERJ-CS.421?format=csv&filter=journal_sc:yes") == \
+        key("/api/v2/citations/doi:10.7717/peerj-cs.421?filter=journal_sc:yes&format=csv")
+    assert key("/api/v2/citations/omid:br/064") != key("/api/v2/references/omid:br/064")
+    assert key("/api/v2/citations/omid:br/064") != key("/api/v2/citations/omid:br/064", "text/csv")
+    assert key("/api/v2/citations/omid:br/064") != key("/api/v2/citations/omid:br/064?format=csv")
+
+
+def test_exec_shared(api_manager, monkeypatch):
+    expected = api_manager.get_op("/api/v2/citations/omid:br/064").exec()
+    calls = []
+    citations_info = indexapi_v2.citations_info
+
+    def slow_citations_info(*args):
+        calls.append(args)
+        time.sleep(0.3)
+        return citations_info(*args)
+
+    monkeypatch.setattr(indexapi_v2, "citations_info", slow_citations_info)
+    monkeypatch.setattr(oc_flight, "OPERATIONS", oc_flight.SingleFlight())
+    results = run_threads(6, lambda idx: oc_flight.exec_shared(api_manager, "/api/v2/citations/omid:br/064"))
+    assert results == [expected] * 6
+    assert len(calls) == 1
+    assert oc_flight.OPERATIONS.stats()["coalesced"] == 5
+
+    async def run_all():
+        return await asyncio.gather(*[
+            oc_flight.exec_shared_async(api_manager, "/api/v2/citations/omid:br/064") for _ in range(3)])
+
+    results = asyncio.run(run_all())
+    assert results == [expected] * 3
+    assert oc_flight.OPERATIONS.stats() == {"calls": 9, "executed": 2, "coalesced": 7}
+    assert oc_flight.exec_shared(api_manager, "/api/v2/nothing")[0] == 404
+
+
+def test_meta_chunks_are_shared(monkeypatch):
+    requested = []
+
+    def slow_br_meta_metadata(values):
+        requested.append(values)
+        time.sleep(0.2)
+        return fake_br_meta_metadata(values)
+
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", slow_br_meta_metadata)
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", None)
+    monkeypatch.setattr(indexapi_core, "META_FLIGHT", oc_flight.SingleFlight())
+    brs = [BR + "061", BR + "062", BR + "064"]
+    results = run_threads(4, lambda idx: indexapi_core.get_brs_metadata(brs if idx % 2 else brs[::-1]))
+    assert len(requested) == 1
+    assert all(r == results[0] for r in results)
+    assert indexapi_core.META_FLIGHT.stats() == {"calls": 4, "executed": 1, "coalesced": 3}
@@ -0,0 +1,137 @@
+import asyncio
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import oc_http
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = self.headers.get("Accept-Encoding", "").encode("utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%s/" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    oc_http.configure(keep_alive=True)
+    oc_http.reset_stats()
+    yield
+    oc_http.configure(keep_alive=True)
+
+
+def test_connections_are_reused(server_url):
+    for _ in range(5):
+        r = oc_http.post(server_url, data="ping")
+        assert r.status_code == 200
+        assert r.text == "ping"
+    stats = oc_http.stats()
+    assert stats["requests"] == 5
+    assert stats["opened"] == 1
+    assert stats["reused"] == 4
+
+
+def test_gzip_is_negotiated(server_url):
+    r = oc_http.get(server_url)
+    assert "gzip" in r.text
+
+
+def test_keep_alive_disabled(server_url):
+    oc_http.configure(keep_alive=False)
+    for _ in range(3):
+        oc_http.get(server_url)
+    stats = oc_http.stats()
+    assert stats["opened"] == 3
+    assert stats["reused"] == 0
+
+
+def test_configure_replaces_session():
+    first = oc_http.session()
+    oc_http.configure(pool_maxsize=2)
+    second = oc_http.session()
+    assert first is not second
+    assert second.get_adapter("https://example.org")._pool_maxsize == 2
+    oc_http.configure(pool_maxsize=20)
+
+
+@pytest.mark.parametrize("keep_alive, opened", [(True, 1), (False, 3)])
+def test_async_connections(server_url, keep_alive, opened):
+    pytest.importorskip("aiohttp")
+    oc_http.configure(keep_alive=keep_alive)
+
+    async def run():
+        responses = [await oc_http.apost(server_url, data="ping") for _ in range(3)]
+        return responses, await oc_http._async_session()
+
+    responses, session = asyncio.run(run())
+    assert [r.text for r in responses] == ["ping"] * 3
+    assert oc_http.stats() == {"requests": 3, "opened": opened, "reused": 3 - opened}
+    # the session is closed together with the event loop
+    assert session.closed
+
+
+def test_async_close(server_url):
+    pytest.importorskip("aiohttp")
+
+    async def run():
+        await oc_http.aget(server_url)
+        session = await oc_http._async_session()
+        await oc_http.aclose()
+        return session, await oc_http._async_session()
+
+    closed, session = asyncio.run(run())
+    assert closed.closed and closed is not session
+
+
+def test_async_without_aiohttp(server_url, monkeypatch):
+    monkeypatch.setattr(oc_http, "aiohttp", None)
+    r = asyncio.run(oc_http.apost(server_url, data="ping"))
+    assert (r.status_code, r.text) == (200, "ping")
+    assert oc_http.stats()["requests"] == 1
+
+
+def test_close():
+    first = oc_http.session()
+    oc_http.close()
+    assert oc_http.session() is not first
+
+
+def test_streamed_responses(server_url):
+    for _ in range(3):
+        r = oc_http.post(server_url, data="ping" * 10, stream=True)
+        assert b"".join(oc_http.iter_content(r, 7)) == b"ping" * 10
+    oc_http.release(oc_http.post(server_url, data="pong", stream=True))
+    # the connection is reused once the body has been read
+    assert oc_http.stats()["opened"] == 1
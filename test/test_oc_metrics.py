@@ -0,0 +1,127 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+import pytest
+
+import oc_flight
+import oc_metrics
+import oc_responses
+from oc_cache import MemoryBackend
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(oc_metrics, "ENABLED", True)
+    monkeypatch.setattr(oc_metrics, "SERVER_TIMING", True)
+    oc_metrics.reset()
+    yield
+    oc_metrics.reset()
+
+
+def test_exec_timed_disabled(api_manager):
+    url = "/api/v2/citations/omid:br/064"
+    assert oc_metrics.exec_timed(api_manager, url) == api_manager.get_op(url).exec() + ({},)
+    assert oc_metrics.stage("meta") is oc_metrics.stage("other")
+    assert oc_metrics.bind(len) is len
+    assert "oc_stage_duration_seconds_count" not in oc_metrics.expose()
+
+
+def test_exec_timed(api_manager, fake_meta, metrics):
+    url = "/api/v2/citations/omid:br/064"
+    expected = api_manager.get_op(url).exec()
+    sc, res, c_type, headers = oc_metrics.exec_timed(api_manager, url)
+    assert (sc, res, c_type) == expected
+
+    stages = [s.split(";")[0] for s in headers["Server-Timing"].split(", ")]
+    assert stages == ["preprocess", "meta", "sparql", "postprocess", "output", "total"]
+    for stage in stages[:-1]:
+        assert oc_metrics.STAGE_SECONDS.samples(("/citations/{id}", stage))[2] == 1
+    assert oc_metrics.OPERATION_SECONDS.samples(("/citations/{id}", "200"))[2] == 1
+
+    # the rows of the index (citations to 064) and the ones returned
+    assert oc_metrics.ROWS.samples(("/citations/{id}", "query"))[1] == 4
+    assert oc_metrics.ROWS.samples(("/citations/{id}", "postprocess"))[1] == len(expected[1].split('"oci"')) - 1
+    host = urlsplit(fake_meta.sparql_endpoint).netloc
+    assert oc_metrics.OUTBOUND_REQUESTS.value(("/citations/{id}", host)) > 0
+    assert oc_metrics.OUTBOUND_BYTES.value(("/citations/{id}", host)) > 0
+
+    exposed = oc_metrics.expose()
+    assert "# TYPE oc_stage_duration_seconds histogram" in exposed
+    assert 'oc_stage_duration_seconds_count{operation="/citations/{id}",stage="meta"} 1' in exposed
+    assert 'oc_operation_rows_bucket{operation="/citations/{id}",stage="query",le="10"} 1' in exposed
+
+
+def test_exec_timed_errors(api_manager, metrics):
+    assert oc_metrics.exec_timed(api_manager, "/api/v2/nothing")[0] == 404
+    sc, _, _, headers = oc_metrics.exec_timed(api_manager, "/api/v2/citations/omid:br/064", method="post")
+    assert sc == 405
+    assert headers["Server-Timing"].startswith("total;dur=")
+    assert oc_metrics.OPERATION_SECONDS.samples(("/citations/{id}", "405"))[2] == 1
+
+
+def test_exec_timed_with_the_cache(api_manager, metrics, monkeypatch):
+    monkeypatch.setattr(oc_responses, "RELEASE", "2026-09")
+    monkeypatch.setattr(oc_responses, "RESPONSE_CACHE", MemoryBackend())
+    monkeypatch.setattr(oc_responses, "RESPONSES", oc_flight.SingleFlight("responses"))
+    url = "/api/v2/citations/omid:br/064"
+    expected = api_manager.get_op(url).exec()
+
+    sc, res, c_type, headers = oc_metrics.exec_timed(api_manager, url, execute=oc_responses.exec_op_cached)
+    assert (sc, res, c_type) == expected
+    assert "sparql;dur=" in headers["Server-Timing"]
+    etag = headers["ETag"]
+
+    # answered from the cache, without running any stage
+    sc, res, _, headers = oc_metrics.exec_timed(
+        api_manager, url, execute=partial(oc_responses.exec_op_cached, if_none_match=etag))
+    assert (sc, res, headers["ETag"]) == (304, "", etag)
+    assert headers["Server-Timing"].startswith("total;dur=")
+    assert oc_metrics.STAGE_SECONDS.samples(("/citations/{id}", "sparql"))[2] == 1
+    assert oc_metrics.OPERATION_SECONDS.samples(("/citations/{id}", "304"))[2] == 1
+
+    exposed = oc_metrics.expose()
+    assert 'oc_response_cache_calls_total{operation="/citations/{id}",result="hit"} 1' in exposed
+    assert 'oc_response_cache_calls_total{operation="/citations/{id}",result="miss"} 1' in exposed
+    assert 'oc_single_flight_calls_total{flight="responses",result="executed"} 1' in exposed
+
+
+def test_exec_timed_shared(api_manager, metrics, monkeypatch):
+    monkeypatch.setattr(oc_flight, "OPERATIONS", oc_flight.SingleFlight("operations"))
+    url = "/api/v2/citations/omid:br/064"
+    expected = api_manager.get_op(url).exec()
+    assert oc_metrics.exec_timed(api_manager, url, execute=oc_flight.exec_op_shared)[:3] == expected
+    assert oc_metrics.SINGLE_FLIGHT_CALLS.value(("operations", "executed")) == 1
+    assert oc_metrics.SINGLE_FLIGHT_CALLS.value(("meta", "executed")) > 0
+
+
+def test_stages_in_threads():
+    timings = oc_metrics._Timings("/test")
+    token = oc_metrics._current.set(timings)
+
+    def work(idx):
+        with oc_metrics.stage("meta"):
+            with oc_metrics.stage("meta"):
+                time.sleep(0.1)
+
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(oc_metrics.bind(work), range(4)))
+    finally:
+        oc_metrics._current.reset(token)
+    # the stages running at the same time are measured once
+    assert 0.1 <= timings.seconds["meta"] < 0.3
+    assert oc_metrics.stage("meta") is oc_metrics._NO_STAGE
+
+
+def test_histogram():
+    h = oc_metrics.Histogram("test_seconds", "Test.", ("op",), (0.1, 1))
+    for value in (0.05, 0.5, 5):
+        h.observe(("a",), value)
+    buckets, total, count = h.samples(("a",))
+    assert (buckets, count) == ([1, 2], 3)
+    assert total == pytest.approx(5.55)
+    assert h.expose()[2:] == [
+        'test_seconds_bucket{op="a",le="0.1"} 1', 'test_seconds_bucket{op="a",le="1"} 2',
+        'test_seconds_bucket{op="a",le="+Inf"} 3', 'test_seconds_sum{op="a"} %s' % total, 'test_seconds_count{op="a"} 3']
@@ -0,0 +1,129 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import indexapi_core
+import oc_flight
+import oc_responses
+from oc_cache import MemoryBackend
+from ramose import Operation
+from oc_flight import operation_key
+from fakes import FakeIndexHandler
+
+
+@pytest.fixture
+def release(monkeypatch):
+    monkeypatch.setattr(oc_responses, "RELEASE", "2026-09")
+    monkeypatch.setattr(oc_responses, "RESPONSE_CACHE", MemoryBackend())
+
+
+def test_responses_are_cached(api_manager, release):
+    url = "/api/v2/citations/doi:10.7717/PEERJ-CS.421?format=csv"
+    expected = api_manager.get_op(url).exec()
+    FakeIndexHandler.queries.clear()
+
+    sc, res, c_type, headers = oc_responses.exec_cached(api_manager, url)
+    assert (sc, res, c_type) == expected
+    assert headers["Cache-Control"] == "public, max-age=%s" % oc_responses.MAX_AGE
+    n_queries = len(FakeIndexHandler.queries)
+    assert n_queries > 0
+
+    # the same call, with the identifier normalised, is answered from the cache
+    assert oc_responses.exec_cached(api_manager, "/api/v2/citations/doi:10.7717/peerj-cs.421?format=csv") == \
+        (sc, res, c_type, headers)
+    assert len(FakeIndexHandler.queries) == n_queries
+
+    other = oc_responses.exec_cached(api_manager, "/api/v2/references/doi:10.7717/peerj-cs.421?format=csv")
+    assert other[3]["ETag"] != headers["ETag"]
+    assert len(FakeIndexHandler.queries) > n_queries
+
+
+@pytest.mark.parametrize("if_none_match, status", [
+    (None, 200),
+    ('"other"', 200),
+    ("{etag}", 304),
+    ('"other", W/{etag}', 304),
+    ("*", 304),
+])
+def test_conditional_requests(api_manager, release, if_none_match, status):
+    url = "/api/v2/citation/06101-06104"
+    etag = oc_responses.exec_cached(api_manager, url)[3]["ETag"]
+    FakeIndexHandler.queries.clear()
+
+    sc, res, _, headers = oc_responses.exec_cached(
+        api_manager, url, if_none_match=if_none_match and if_none_match.format(etag=etag))
+    assert sc == status
+    assert headers["ETag"] == etag
+    assert FakeIndexHandler.queries == []
+    if status == 304:
+        assert res == ""
+    else:
+        assert isinstance(json.loads(res), list)
+
+    # the ETag depends on the response, not on the cache
+    oc_responses.RESPONSE_CACHE = MemoryBackend()
+    sc, _, _, headers = oc_responses.exec_cached(
+        api_manager, url, if_none_match=if_none_match and if_none_match.format(etag=etag))
+    assert (sc, headers["ETag"]) == (status, etag)
+    assert FakeIndexHandler.queries != []
+
+
+def test_etag_of_the_response(api_manager, release):
+    # the metadata from Meta can change within the same release
+    url = "/api/v2/citation/06101-06104"
+    sc, res, c_type, headers = oc_responses.exec_cached(api_manager, url)
+    key = operation_key(api_manager.get_op(url), "get", "application/json")
+    assert headers["ETag"] == oc_responses.response_etag(key, (sc, res, c_type))
+    assert headers["ETag"] != oc_responses.response_etag(key, (sc, res + " ", c_type))
+
+
+def test_incomplete_responses_not_cached(api_manager, release, monkeypatch):
+    # the DOI cannot be resolved, since Meta is not reachable
+    monkeypatch.setattr(indexapi_core, "META_SPARQL_ENDPOINT", "http://127.0.0.1:1/sparql")
+    url = "/api/v2/citations/doi:10.7717/peerj-cs.421"
+    sc, res, _, headers = oc_responses.exec_cached(api_manager, url)
+    assert (sc, json.loads(res), headers) == (200, [], {})
+    assert oc_responses.RESPONSE_CACHE.stats()["size"] == 0
+
+
+def test_new_release_invalidates(api_manager, release, monkeypatch):
+    url = "/api/v2/citations/omid:br/064"
+    _, _, _, headers = oc_responses.exec_cached(api_manager, url)
+    monkeypatch.setattr(oc_responses, "RELEASE", "2026-10")
+    FakeIndexHandler.queries.clear()
+
+    sc, _, _, new_headers = oc_responses.exec_cached(api_manager, url, if_none_match=headers["ETag"])
+    assert sc == 200
+    assert new_headers["ETag"] != headers["ETag"]
+    assert FakeIndexHandler.queries != []
+
+
+def test_responses_not_cached(api_manager, release, monkeypatch):
+    # other operations, and the calls without a release
+    url = "/api/v2/citation-count/omid:br/064"
+    sc, res, c_type, headers = oc_responses.exec_cached(api_manager, url)
+    assert (sc, res, c_type) == api_manager.get_op(url).exec()
+    assert headers == {}
+    assert oc_responses.exec_cached(api_manager, "/api/v2/nothing")[0] == 404
+    monkeypatch.setattr(oc_responses, "RELEASE", "")
+    assert oc_responses.exec_cached(api_manager, "/api/v2/citations/omid:br/064")[3] == {}
+
+
+def test_cached_and_shared_calls_at_once(api_manager, release, monkeypatch):
+    # the calls of exec_cached and exec_shared return different results, and
+    # are not coalesced with each other
+    exec_func = Operation.exec
+
+    def slow_exec(self, *args):
+        time.sleep(0.2)
+        return exec_func(self, *args)
+
+    monkeypatch.setattr(Operation, "exec", slow_exec)
+    url = "/api/v2/citations/omid:br/064"
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        cached = executor.submit(oc_responses.exec_cached, api_manager, url)
+        shared = executor.submit(oc_flight.exec_shared, api_manager, url)
+        assert cached.result()[:3] == shared.result()
+    assert "ETag" in cached.result()[3]
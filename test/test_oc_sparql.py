@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import oc_http
+import oc_sparql
+from oc_http import AsyncResponse
+
+BR = "https://w3id.org/oc/meta/br/"
+
+ROWS = [
+    {"val": BR + "061", "ids": "doi:10.1000/1 __ pmid:1", "title": 'A "quoted",\ttabbed\nmulti-line title'},
+    {"val": BR + "062", "ids": "doi:10.1000/2", "title": "Caffè"},
+]
+
+
+# the body is read in a single chunk, or in chunks splitting the rows and the
+# characters encoded in more than one byte
+@pytest.fixture(autouse=True, params=[65536, 3])
+def chunk_size(request, monkeypatch):
+    monkeypatch.setattr(oc_http, "CHUNK_SIZE", request.param)
+
+
+def response(content_type, body):
+    return AsyncResponse(200, "OK", {"Content-Type": content_type}, body.encode("utf-8"))
+
+
+def json_results(rows):
+    return json.dumps({
+        "head": {"vars": ["val", "ids", "title"]},
+        "results": {"bindings": [
+            {var: {"type": "uri" if var == "val" else "literal", "value": value} for var, value in row.items()}
+            for row in rows]}}, ensure_ascii=False)
+
+
+def test_sparql_headers():
+    assert oc_sparql.sparql_headers("tsv") == {
+        "Accept": "text/tab-separated-values", "Content-Type": "application/sparql-query"}
+    assert oc_sparql.sparql_headers()["Accept"] == oc_sparql.FORMATS[oc_sparql.RESULTS_FORMAT]
+
+
+def test_csv_rows():
+    body = 'val,ids,title\r\n%s061,doi:10.1000/1 __ pmid:1,"A ""quoted"",\ttabbed\nmulti-line title"\r\n' \
+           '%s062,doi:10.1000/2,Caffè\r\n%s063,,\r\n' % (BR, BR, BR)
+    rows = list(oc_sparql.read_rows(response("text/csv; charset=UTF-8", body)))
+    # the unbound variables are empty strings
+    assert rows == ROWS + [{"val": BR + "063", "ids": "", "title": ""}]
+
+
+def test_tsv_rows():
+    body = '?val\t?ids\t?title\n<%s061>\t"doi:10.1000/1 __ pmid:1"\t"A \\"quoted\\",\\ttabbed\\nmulti-line title"@en\n' \
+           '<%s062>\t"doi:10.1000/2"^^<http://www.w3.org/2001/XMLSchema#string>\t"Caffè"\n<%s063>\t\t\n' % (BR, BR, BR)
+    assert list(oc_sparql.read_rows(response("text/tab-separated-values", body))) == ROWS + [{"val": BR + "063"}]
+
+
+@pytest.mark.parametrize("body", [
+    json_results(ROWS),
+    # the bindings before the head, and without any binding
+    '{"results": {"bindings" : [ %s ,%s]}, "head": {"vars": ["val"]}}' % tuple(
+        json.dumps(b, ensure_ascii=False) for b in json.loads(json_results(ROWS))["results"]["bindings"]),
+])
+def test_json_rows(body):
+    rows = oc_sparql.read_rows(response("application/sparql-results+json", body))
+    assert next(rows) == ROWS[0]
+    assert list(rows) == ROWS[1:]
+
+
+def test_empty_results():
+    assert list(oc_sparql.read_rows(response("text/csv", ""))) == []
+    assert list(oc_sparql.read_rows(response("text/tab-separated-values", "?val\n"))) == []
+    assert list(oc_sparql.read_rows(response("application/json", json_results([])))) == []
+
+
+def test_rows_are_read_while_streamed():
+    # the rows are returned before the rest of the body is read, and the
+    # response is closed at the end
+    body = json_results(ROWS).encode("utf-8")
+    read = []
+
+    class StreamedResponse(AsyncResponse):
+        def iter_content(self, chunk_size=1):
+            for idx in range(0, len(body), 10):
+                read.append(idx)
+                yield body[idx:idx + 10]
+
+        def close(self):
+            read.append("closed")
+
+    rows = oc_sparql.read_rows(StreamedResponse(200, "OK", {"Content-Type": oc_sparql.JSON}, b""))
+    assert next(rows) == ROWS[0]
+    assert len(read) < len(body) // 10
+    assert list(rows) == ROWS[1:]
+    assert read[-1] == "closed"
@@ -0,0 +1,204 @@
+import json
+from csv import reader
+from re import search
+
+import pytest
+from ramose import APIManager
+
+import indexapi_core
+import oc_stream
+from fake_meta import METADATA_OPERATION_VARS
+from fakes import FakeIndexHandler, fake_br_meta_brs_of, fake_br_meta_metadata, index_api_manager
+
+
+# the metadata of Meta are taken from the canned data, without any request
+@pytest.fixture
+def api_manager(endpoint, tmp_path, monkeypatch):
+    monkeypatch.setattr(indexapi_core, "__br_meta_metadata", fake_br_meta_metadata)
+    monkeypatch.setattr(indexapi_core, "__br_meta_brs_of", fake_br_meta_brs_of)
+    monkeypatch.setattr(indexapi_core, "BR_CACHE", None)
+    return index_api_manager(endpoint, tmp_path)
+
+
+def test_paged_query():
+    query = "SELECT ?oci ?citing WHERE {\n    ?oci a ?citing .\n}\nLIMIT 200000"
+    assert oc_stream.query_limit(query) == 200000
+    assert oc_stream.paged_query(query, 10) == \
+        "SELECT ?oci ?citing WHERE {\n    ?oci a ?citing .\n}\nORDER BY STR(?oci)\nLIMIT 10"
+    assert oc_stream.paged_query(query, 10, 'a"b') == \
+        'SELECT ?oci ?citing WHERE {\n    ?oci a ?citing .\n    FILTER(STR(?oci) > "a\\"b")\n}\n' \
+        'ORDER BY STR(?oci)\nLIMIT 10'
+
+
+def test_stream_ndjson(api_manager):
+    op = api_manager.get_op("/api/v2/citations/omid:br/064")
+    _, res, _ = op.exec()
+    status, body, c_type = oc_stream.exec_stream(
+        api_manager, "/api/v2/citations/omid:br/064", oc_stream.NDJSON, page_size=1)
+    assert status == 200
+    assert c_type == "application/x-ndjson"
+    streamed = [json.loads(line) for line in body]
+    # one query for each page, plus the last empty one
+    assert len(FakeIndexHandler.queries) == 1 + 5
+    assert [r["oci"] for r in streamed] == ["061-064", "062-064", "065-064"]
+    assert sorted(streamed, key=lambda r: r["oci"]) == sorted(json.loads(res), key=lambda r: r["oci"])
+
+
+def test_stream_csv_with_filter(api_manager):
+    status, body, c_type = oc_stream.exec_stream(
+        api_manager, "/api/v2/citations/omid:br/064?filter=journal_sc:yes", oc_stream.CSV, page_size=2)
+    rows = list(reader("".join(body).splitlines()))
+    assert c_type == "text/csv"
+    assert rows[0] == ["oci", "citing", "cited", "creation", "timespan", "journal_sc", "author_sc"]
+    assert [r[0] for r in rows[1:]] == ["062-064"]
+
+
+@pytest.mark.parametrize("failing_query", [1, 3])
+def test_stream_failure(api_manager, monkeypatch, failing_query):
+    sparql_table = oc_stream.sparql_table
+    n_queries = []
+
+    def failing_table(op, query):
+        n_queries.append(query)
+        if len(n_queries) == failing_query:
+            raise ConnectionError("HTTP status code 503: Service Unavailable")
+        return sparql_table(op, query)
+
+    monkeypatch.setattr(oc_stream, "sparql_table", failing_table)
+    status, body, c_type = oc_stream.exec_stream(
+        api_manager, "/api/v2/citations/omid:br/064", oc_stream.NDJSON, page_size=1)
+    if failing_query == 1:
+        # nothing has been returned yet
+        assert (status, c_type) == (500, "text/plain")
+        assert "ConnectionError: HTTP status code 503" in body
+        return
+    assert status == 200
+    streamed = [json.loads(line) for line in body]
+    assert "oci" in streamed[0]
+    assert streamed[-1] == {"error": "HTTP status code 500: something unexpected happened - "
+                                     "ConnectionError: HTTP status code 503: Service Unavailable"}
+
+
+def test_stream_failure_csv():
+    def tables():
+        yield [["oci", "citing"], ["061-064", "061"]]
+        raise ConnectionError("timeout")
+
+    status, body, _ = oc_stream.stream_response(tables(), oc_stream.CSV)
+    rows = list(reader("".join(body).splitlines()))
+    assert status == 200
+    assert rows == [["oci", "citing"], ["061-064", "061"],
+                    ["HTTP status code 500: something unexpected happened - ConnectionError: timeout"]]
+
+
+def test_stream_without_stream_function(api_manager):
+    status, body, _ = oc_stream.exec_stream(api_manager, "/api/v2/citation-count/omid:br/064")
+    assert status == 200
+    assert json.loads("".join(body)) == [{"count": "3"}]
+
+
+def all_pages(api_manager, url):
+    pages = []
+    while url is not None:
+        status, res, c_type, headers = oc_stream.exec_page(api_manager, url)
+        assert status == 200
+        pages.append(json.loads(res))
+        url = None
+        if "Link" in headers:
+            url = search(r"^<([^>]+)>; rel=\"next\"$", headers["Link"]).group(1)
+    return pages
+
+
+@pytest.mark.parametrize("op, count_op, pid, n_index_rows, ocis", [
+    ("citations", "citation-count", "omid:br/064", 4, ["061-064", "062-064", "065-064"]),
+    ("references", "reference-count", "omid:br/061", 3, ["061-062", "061-064"]),
+])
+@pytest.mark.parametrize("limit", [1, 2, 10])
+def test_pages_match_whole_results(api_manager, op, count_op, pid, n_index_rows, ocis, limit):
+    _, whole, _ = api_manager.get_op("/api/v2/%s/%s" % (op, pid)).exec()
+    pages = all_pages(api_manager, "/api/v2/%s/%s?limit=%s" % (op, pid, limit))
+    # the pages are made of index rows, some of which are duplicates
+    assert len(pages) == -(-n_index_rows // limit)
+    rows = [row for page in pages for row in page]
+    assert [r["oci"] for r in rows] == ocis
+    assert sorted(rows, key=lambda r: r["oci"]) == sorted(json.loads(whole), key=lambda r: r["oci"])
+    _, count, _ = api_manager.get_op("/api/v2/%s/%s" % (count_op, pid)).exec()
+    assert json.loads(count) == [{"count": str(len(rows))}]
+
+
+def test_page_without_parameters(api_manager):
+    _, whole, _ = api_manager.get_op("/api/v2/citations/omid:br/064").exec()
+    status, res, _, headers = oc_stream.exec_page(api_manager, "/api/v2/citations/omid:br/064")
+    assert (status, res, headers) == (200, whole, {})
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=x", "cursor=%25%25"])
+def test_page_wrong_parameters(api_manager, query):
+    status, _, _, _ = oc_stream.exec_page(api_manager, "/api/v2/citations/omid:br/064?" + query)
+    assert status == 400
+
+
+@pytest.fixture
+def meta_api_manager(meta_endpoints, tmp_path):
+    with open("meta_v1.hf", encoding="utf-8") as f:
+        conf = f.read().replace("#endpoint http://test.opencitations.net/meta/sparql",
+                                "#endpoint " + meta_endpoints.sparql_endpoint)
+    (tmp_path / "meta_v1.hf").write_text(conf, encoding="utf-8")
+    return APIManager([str(tmp_path / "meta_v1.hf")])
+
+
+@pytest.mark.parametrize("body, body_type", [
+    ("doi:10.7717/peerj-cs.421\npmid:1\n\ndoi:10.1108/jd-12-2013-0166\nomid:br/065\npmid:33817056\n"
+     "doi:10.1000/missing\n", oc_stream.NDJSON),
+    (json.dumps({"ids": ["doi:10.7717/peerj-cs.421", "pmid:1", "doi:10.1108/jd-12-2013-0166", "omid:br/065",
+                         "pmid:33817056", "doi:10.1000/missing"]}), "application/json; charset=utf-8"),
+])
+def test_bulk_matches_whole_results(meta_api_manager, meta_endpoints, body, body_type):
+    _, whole, _ = meta_api_manager.get_op(
+        "/api/v1/metadata/doi:10.7717/peerj-cs.421__pmid:1__doi:10.1108/jd-12-2013-0166__omid:br/065"
+        "__pmid:33817056__doi:10.1000/missing").exec()
+    meta_endpoints.queries.clear()
+    status, res, c_type = oc_stream.exec_bulk(
+        meta_api_manager, "/api/v1/metadata/", body, body_type, chunk_size=2, key="id")
+    assert (status, c_type) == (200, oc_stream.NDJSON)
+    rows = [json.loads(line) for line in res]
+    # a query for each chunk, and the entity of doi:10.7717/peerj-cs.421 and pmid:33817056 only once
+    assert meta_endpoints.queries == {"metadata_operation": 3}
+    assert sorted(r["id"].split()[-1] for r in rows) == ["omid:br/061", "omid:br/063", "omid:br/064", "omid:br/065"]
+    assert sorted(rows, key=lambda r: r["id"]) == sorted(json.loads(whole), key=lambda r: r["id"])
+    assert [r["author"] for r in rows if r["id"].endswith("omid:br/061")] == ["Doe, John [omid:ra/061]; Roe, Jane"]
+    assert rows[0]["type"] == "journal article"
+
+
+def test_bulk_without_key(meta_api_manager):
+    # the entity of doi:10.7717/peerj-cs.421 and pmid:33817056, in two chunks, is returned by both
+    status, res, _ = oc_stream.exec_bulk(
+        meta_api_manager, "/api/v1/metadata/",
+        "doi:10.7717/peerj-cs.421\ndoi:10.1108/jd-12-2013-0166\npmid:33817056\ndoi:10.7717/peerj-cs.421\n",
+        chunk_size=2)
+    assert status == 200
+    assert sorted(json.loads(line)["id"].split()[-1] for line in res) == \
+        ["omid:br/061", "omid:br/061", "omid:br/064"]
+
+
+def test_bulk_csv_with_filter(meta_api_manager):
+    status, res, c_type = oc_stream.exec_bulk(
+        meta_api_manager, "/api/v1/metadata/?filter=id:pmid", "doi:10.7717/peerj-cs.421\ndoi:10.3233/ds-190019\n",
+        content_type=oc_stream.CSV)
+    rows = list(reader("".join(res).splitlines()))
+    assert c_type == "text/csv"
+    assert rows[0] == list(METADATA_OPERATION_VARS)
+    assert sorted(r[0] for r in rows[1:]) == [
+        "doi:10.3233/ds-190019 pmid:1 omid:br/063", "doi:10.7717/peerj-cs.421 pmid:33817056 omid:br/061"]
+
+
+@pytest.mark.parametrize("body, body_type", [
+    ("", oc_stream.NDJSON),
+    ('{"ids": "doi:10.1000/1"}', "application/json"),
+    ("[1, 2]", "application/json"),
+    ("doi:10.1000/1__doi:10.1000/2", oc_stream.NDJSON),
+])
+def test_bulk_wrong_body(meta_api_manager, meta_endpoints, body, body_type):
+    status, _, _ = oc_stream.exec_bulk(meta_api_manager, "/api/v1/metadata/", body, body_type)
+    assert status == 400
+    assert meta_endpoints.queries == {}